@@ -3,23 +3,342 @@
 #include "sim_config.h"
 #include <chrono>
 #include <thread>
+#include <cstdint>
+#include <string>
 
-#define VERILATOR_INIT(argc, argv) \
-    contextp->commandArgs(argc, argv);       \
-    Verilated::traceEverOn(true);        \
-    top->trace(tfp, 99);                     \
-    tfp->open(WAVEFILE);
+#ifndef ENABLE_BINARY_STIMULUS
+#define ENABLE_BINARY_STIMULUS 0
+#endif
+
+#ifndef ENABLE_TESTBENCH_LIBRARY
+#define ENABLE_TESTBENCH_LIBRARY 0
+#endif
+
+#ifndef ENABLE_FAST_FORWARD
+#define ENABLE_FAST_FORWARD 0
+#endif
+
+#ifndef STIMFILE
+#define STIMFILE "stimulus.stim"
+#endif
+
+#ifndef ENABLE_CHECKPOINT
+#define ENABLE_CHECKPOINT 0
+#endif
+
+#ifndef CHECKPOINTDIR
+#define CHECKPOINTDIR "checkpoint"
+#endif
+
+#ifndef CHECKPOINT_MODE
+#define CHECKPOINT_MODE "auto"
+#endif
+
+#ifndef CHECKPOINT_MODEL_KEY
+#define CHECKPOINT_MODEL_KEY 0
+#endif
+
+#ifndef DELAY_WHILE_RUNNING_NVBOARD
+#define DELAY_WHILE_RUNNING_NVBOARD 0
+#endif
+
+#ifndef NVBOARD_SIM_FREQUENCY
+#define NVBOARD_SIM_FREQUENCY 0
+#endif
+
+#ifndef NVBOARD_FRAME_RATE
+#define NVBOARD_FRAME_RATE 60
+#endif
+
+#ifndef ENABLE_PROFILING
+#define ENABLE_PROFILING 0
+#endif
+
+#ifndef PROFILEFILE
+#define PROFILEFILE "profile.json"
+#endif
+
+#ifndef ENABLE_TRACE
+#define ENABLE_TRACE 1
+#endif
+
+#ifndef TRACE_DEPTH
+#define TRACE_DEPTH 99
+#endif
+
+#ifndef TRACE_TRIGGER_DURATION
+#define TRACE_TRIGGER_DURATION 0
+#endif
+
+#ifndef QUIESCENCE_CYCLES
+#define QUIESCENCE_CYCLES 0
+#endif
+
+// 二进制激励文件格式，需与csv2c.py中的STIM_HEADER/STIM_RECORD保持一致
+#define STIM_MAGIC "MVSTIM\0\0"
+#define STIM_VERSION 4
+
+enum StimSection
+{
+    STIM_SECTION_INITIAL = 0,
+    STIM_SECTION_FOREVER = 1
+};
+
+// 运行时激励生成器，需与csv2c.py中的GENERATOR_KINDS保持一致
+enum StimGeneratorKind
+{
+    STIM_GEN_COUNTER = 0,
+    STIM_GEN_RANDOM = 1,
+    STIM_GEN_REPEAT = 2
+};
+
+struct StimHeader
+{
+    char magic[8];
+    uint32_t version;
+    uint32_t pin_count;
+    uint64_t initial_count;
+    uint64_t forever_count;
+    uint64_t records_offset;
+    uint64_t initial_generator_count;
+    uint64_t forever_generator_count;
+    uint64_t generators_offset;
+    uint64_t values_count;
+    uint64_t values_offset;
+    uint32_t expect_signal_count;
+    uint32_t reserved;
+    uint64_t expect_count;
+    uint64_t expects_offset;
+    uint64_t checkpoint_key;
+};
+
+struct StimRecord
+{
+    uint64_t time;
+    uint64_t value;
+    uint32_t pin;
+    uint32_t reserved;
+};
+
+// 从块起点后start开始，每隔period赋值一次，共count次（0表示持续到块结束）
+// COUNTER: a + k * b；RANDOM: 以a为种子的xorshift64序列；REPEAT: 循环取值表中[a, a + b)的值
+struct StimGenerator
+{
+    uint64_t start;
+    uint64_t period;
+    uint64_t count;
+    uint64_t a;
+    uint64_t b;
+    uint32_t pin;
+    uint32_t kind;
+};
+
+// 期望值检查：time时刻求值后(信号 & mask)应等于value，line为CSV中的行号
+struct StimExpect
+{
+    uint64_t time;
+    uint64_t value;
+    uint64_t mask;
+    uint32_t signal;
+    uint32_t line;
+};
+
+// 激励库：多个testbench编译进同一个仿真程序，每个testbench的激励块、生成器表、期望表与时长、时钟配置
+// 由csv2c.py生成到VERILATOR_TESTBENCHES(X)及各自的宏中，运行时以+tb=名字选择（未指定时为第一个），
+// 下列配置宏读取所选testbench的配置；X的参数顺序需与csv2c.py中的TESTBENCH_CONFIG_KEYS保持一致
+#if ENABLE_TESTBENCH_LIBRARY == 1
+struct TestbenchConfig
+{
+    const char *name;
+    uint64_t enable_limit_time_stimulation;
+    uint64_t max_time_sim;
+    uint64_t half_clk_cycle;
+    uint64_t enable_clk_input;
+    uint64_t enable_initial_block;
+    uint64_t initial_block_max_stimulate_time;
+    uint64_t enable_forever_block;
+    uint64_t forever_block_cycle;
+    bool (*initial_block)();
+    void (*forever_block)();
+    const StimGenerator *initial_generators;
+    uint64_t initial_generator_count;
+    const StimGenerator *forever_generators;
+    uint64_t forever_generator_count;
+    const uint64_t *generator_values;
+    const StimExpect *expects;
+    uint64_t expect_count;
+    uint64_t checkpoint_key;
+    uint64_t quiescence_start;
+};
+extern const TestbenchConfig *testbench;
+void testbench_select();
+#define VERILATOR_TESTBENCH_SELECT() testbench_select()
+#define ENABLE_LIMIT_TIME_STIMULATION (testbench->enable_limit_time_stimulation)
+#define MAX_TIME_SIM (testbench->max_time_sim)
+#define HALF_CLK_CYCLE (testbench->half_clk_cycle)
+#define ENABLE_CLK_INPUT (testbench->enable_clk_input)
+#define ENABLE_INITIAL_BLOCK (testbench->enable_initial_block)
+#define INITIAL_BLOCK_MAX_STIMULATE_TIME (testbench->initial_block_max_stimulate_time)
+#define ENABLE_FOREVER_BLOCK (testbench->enable_forever_block)
+#define FOREVER_BLOCK_CYCLE (testbench->forever_block_cycle)
+// 块函数在VERILATOR_END_CHECK跳转到自身的end标签时返回，INITIAL块返回false表示仿真已经结束
+#define VERILATOR_MAIN_INITIAL_BLOCK()         \
+    do                                         \
+    {                                          \
+        if (!testbench->initial_block())       \
+            goto end;                          \
+    } while (0)
+#define VERILATOR_MAIN_FOREVER_BLOCK() testbench->forever_block()
+#else
+#define VERILATOR_TESTBENCH_SELECT()
+#endif
+
+std::string plusarg_or(const char *prefix, const char *fallback);
+
+// 运行参数：+wave=路径 覆盖波形文件，+wave-dump=0/1 覆盖是否记录波形，
+// +report=路径 在退出时写出JSON运行报告（仿真时长、耗时与期望值检查结果）
+extern bool wave_enabled;
+void wave_init();
+const char *wave_path();
+// 波形只在采集窗口内或触发条件满足后记录，第一次需要记录时才打开波形文件
+void trace_init();
+bool trace_should_dump(uint64_t t);
+void report_init();
+void report_write();
+
+void stim_begin(int section, uint64_t base);
+void stim_apply(uint64_t t);
+uint64_t stim_next_time();
+#define VERILATOR_STIM_BEGIN(section, base) stim_begin(section, base)
+#define VERILATOR_STIM_APPLY() stim_apply(T)
+
+void expect_check(uint64_t t);
+uint64_t expect_next_time();
+uint64_t expect_finish();
+uint64_t expect_total();
+uint64_t expect_failed();
+#define VERILATOR_EXPECT_CHECK() expect_check(T)
+
+// 静止检测：最后一次激励与期望之后，观察的输出信号连续QUIESCENCE_CYCLES个时钟周期（没有时钟时为时间单位）
+// 没有变化时提前结束仿真；+quiesce=N 覆盖周期数，0表示关闭
+extern bool quiescent;
+extern uint64_t quiescence_limit;
+void quiescence_init();
+void quiescence_check(uint64_t t);
+#define VERILATOR_QUIESCENCE_CHECK()   \
+    do                                 \
+    {                                  \
+        if (quiescence_limit)          \
+            quiescence_check(T);       \
+    } while (0)
+
+#if ENABLE_BINARY_STIMULUS == 1
+void stim_open(const char *path);
+void stim_close();
+#define VERILATOR_STIM_OPEN() stim_open(plusarg_or("stim=", STIMFILE).c_str())
+#define VERILATOR_STIM_CLOSE() stim_close()
+#else
+#define VERILATOR_STIM_OPEN()
+#define VERILATOR_STIM_CLOSE()
+#endif
+
+// 检查点：INITIAL块结束时保存模型、T与时钟状态，之后的运行可直接从FOREVER块开始
+// +checkpoint=off/save/restore/auto 覆盖CSV中的checkpoint mode，+checkpoint-file=路径 指定检查点文件
+#if ENABLE_CHECKPOINT == 1
+bool checkpoint_restore();
+void checkpoint_save();
+#define VERILATOR_CHECKPOINT_RESTORE() checkpoint_restore()
+#define VERILATOR_CHECKPOINT_SAVE() checkpoint_save()
+#else
+#define VERILATOR_CHECKPOINT_RESTORE() false
+#define VERILATOR_CHECKPOINT_SAVE()
+#endif
+
+// 快进模式：下一个需要求值的时刻（时钟边沿、激励事件或步进目标中最早的一个）
+uint64_t verilator_next_time(uint64_t t);
+
+// 性能剖析：统计步进循环中各阶段的调用次数与耗时（steady_clock），退出时写出JSON，
+// 可用testbench/profile_report.py查看与比较；+profile=路径 覆盖编译时的PROFILEFILE
+#if ENABLE_PROFILING == 1
+enum ProfilePhase
+{
+    PROFILE_STIM,
+    PROFILE_EVAL,
+    PROFILE_DUMP,
+    PROFILE_EXPECT,
+    PROFILE_NVBOARD_UPDATE,
+    PROFILE_NVBOARD_WAIT,
+    PROFILE_PHASE_COUNT
+};
+extern uint64_t profile_ns[PROFILE_PHASE_COUNT];
+extern uint64_t profile_calls[PROFILE_PHASE_COUNT];
+void profile_init();
+void profile_write();
+static inline uint64_t profile_now()
+{
+    return std::chrono::duration_cast<std::chrono::nanoseconds>(
+               std::chrono::steady_clock::now().time_since_epoch()).count();
+}
+#define PROFILE(phase, ...)                            \
+    do                                                 \
+    {                                                  \
+        uint64_t profile_start = profile_now();        \
+        __VA_ARGS__;                                   \
+        profile_ns[phase] += profile_now() - profile_start; \
+        profile_calls[phase]++;                        \
+    } while (0)
+#define PROFILE_INIT() profile_init()
+#define PROFILE_WRITE() profile_write()
+#else
+#define PROFILE(phase, ...) __VA_ARGS__
+#define PROFILE_INIT()
+#define PROFILE_WRITE()
+#endif
 
 #ifdef NVBOARD
+// NVBOARD节拍调度：仿真时间按目标频率（每秒推进的仿真时间单位数）对齐墙钟时间，
+// 界面按固定帧率刷新，两次刷新之间连续求值；+nvboard-freq=、+nvboard-fps= 覆盖编译时的配置
+void nvboard_pace_init();
+void nvboard_pace(uint64_t t);
+void nvboard_pace_report();
 #define NVBOARD_UPDATE nvboard_update()
 #define NVBOARD_QUIT nvboard_quit()
-#define NVBOARD_DELAY(ms) DELAY(ms)
+#define NVBOARD_PACE_INIT() nvboard_pace_init()
+#define NVBOARD_PACE(t) nvboard_pace(t)
 #else
 #define NVBOARD_UPDATE
 #define NVBOARD_QUIT
-#define NVBOARD_DELAY(ms)
+#define NVBOARD_PACE_INIT()
+#define NVBOARD_PACE(t)
 #endif // NVBOARD
 
+// 不带--trace-fst构建（max-throughput构建配置）时模型没有trace()接口，波形相关调用全部展开为空
+#if ENABLE_TRACE == 1
+#define VERILATOR_TRACE_INIT()        \
+    Verilated::traceEverOn(true);     \
+    top->trace(tfp, TRACE_DEPTH)
+#define VERILATOR_TRACE_DUMP() PROFILE(PROFILE_DUMP, tfp->dump(contextp->time()))
+#define VERILATOR_TRACE_FREE() \
+    tfp->close();              \
+    delete tfp
+#else
+#define VERILATOR_TRACE_INIT()
+#define VERILATOR_TRACE_DUMP()
+#define VERILATOR_TRACE_FREE()
+#endif
+
+#define VERILATOR_INIT(argc, argv) \
+    contextp->commandArgs(argc, argv);       \
+    VERILATOR_TESTBENCH_SELECT();            \
+    report_init();                           \
+    PROFILE_INIT();                          \
+    wave_init();                             \
+    VERILATOR_TRACE_INIT();                  \
+    trace_init();                            \
+    NVBOARD_PACE_INIT();                     \
+    VERILATOR_STIM_OPEN();                   \
+    quiescence_init();
+
 #define DELAY(ms)                           \
     std::chrono::milliseconds timespan(ms); \
     std::this_thread::sleep_for(timespan)
@@ -34,34 +353,49 @@
     } while (0)
 
 #define VERILATOR_EVAL_AND_DUMP()         \
-    top->eval();                          \
-    if (clk)                              \
-        NVBOARD_UPDATE;                   \
+    PROFILE(PROFILE_EVAL, top->eval());   \
     do                                    \
     {                                     \
-        if (!ENABLE_WAVEFROM_ACQUISITION) \
+        if (!trace_should_dump(T))        \
         {                                 \
             break;                        \
         }                                 \
-        tfp->dump(contextp->time());      \
+        VERILATOR_TRACE_DUMP();           \
     } while (0)
 
 #define VERILATOR_STEP()                        \
     T++;                                        \
-    NVBOARD_DELAY(DELAY_WHILE_RUNNING_NVBOARD); \
+    NVBOARD_PACE(T);                            \
     contextp->timeInc(1)
 
+#define VERILATOR_STEP_TO(next)             \
+    do                                      \
+    {                                       \
+        vluint64_t T_next = (next);         \
+        contextp->timeInc(T_next - T);      \
+        T = T_next;                         \
+    } while (0)
+
+#if ENABLE_FAST_FORWARD == 1
+#define VERILATOR_STEP_TOWARDS(t) VERILATOR_STEP_TO(verilator_next_time(t))
+#else
+#define VERILATOR_STEP_TOWARDS(t) VERILATOR_STEP()
+#endif
+
 #define VERILATOR_FREE() \
-    tfp->close();        \
-    delete tfp;          \
+    VERILATOR_TRACE_FREE(); \
+    PROFILE_WRITE();     \
     delete top;          \
     delete contextp;     \
+    VERILATOR_STIM_CLOSE(); \
     NVBOARD_QUIT;\
     
-#if ENABLE_LIMIT_TIME_STIMULATION == 1
-#define VERILATOR_VALID_STIMULATION_RANGE() !contextp->gotFinish() && T < MAX_TIME_SIM
+#if ENABLE_TESTBENCH_LIBRARY == 1
+#define VERILATOR_VALID_STIMULATION_RANGE() !contextp->gotFinish() && !quiescent && (!ENABLE_LIMIT_TIME_STIMULATION || T < MAX_TIME_SIM)
+#elif ENABLE_LIMIT_TIME_STIMULATION == 1
+#define VERILATOR_VALID_STIMULATION_RANGE() !contextp->gotFinish() && !quiescent && T < MAX_TIME_SIM
 #else
-#define VERILATOR_VALID_STIMULATION_RANGE() !contextp->gotFinish()
+#define VERILATOR_VALID_STIMULATION_RANGE() !contextp->gotFinish() && !quiescent
 #endif
 
 #define VERILATOR_SWITCH_INPUT_TO(input, value) top->input = value
@@ -87,14 +421,31 @@
 #define VERILATOR_STEP_AND_EVAL_UNTIL(t) \
     do                                   \
     {                                    \
+        PROFILE(PROFILE_STIM, VERILATOR_STIM_APPLY()); \
         VERILATOR_TOGGLE_CLK();          \
         VERILATOR_CLK_INPUT(clk);        \
         VERILATOR_EVAL_AND_DUMP();       \
-        VERILATOR_STEP();                \
+        PROFILE(PROFILE_EXPECT, VERILATOR_EXPECT_CHECK()); \
+        VERILATOR_QUIESCENCE_CHECK();    \
+        if (quiescent)                   \
+            goto end;                    \
+        VERILATOR_STEP_TOWARDS(t);       \
         VERILATOR_END_CHECK();           \
     } while (T < t)
 
-#if ENABLE_CLK_INPUT == 1
+#if ENABLE_TESTBENCH_LIBRARY == 1
+// 激励库中的testbench共用同一个时钟引脚，是否驱动由所选testbench决定；没有testbench使用时钟时不定义CLK_PIN_NAME
+#ifdef CLK_PIN_NAME
+#define VERILATOR_CLK_INPUT(clk)                         \
+    do                                                   \
+    {                                                    \
+        if (ENABLE_CLK_INPUT)                            \
+            VERILATOR_SWITCH_INPUT_TO(CLK_PIN_NAME, clk); \
+    } while (0)
+#else
+#define VERILATOR_CLK_INPUT(clk)
+#endif
+#elif ENABLE_CLK_INPUT == 1
 #define VERILATOR_CLK_INPUT(clk) \
     VERILATOR_SWITCH_INPUT_TO(CLK_PIN_NAME, clk)
 #else
@@ -0,0 +1,43 @@
+// content-hash: 5664a4ff4d8b0021
+#ifndef __SIM_STIMULUS__
+#define __SIM_STIMULUS__
+#include "sim_config.h"
+
+#define VERILATOR_STIM_PINS(X) \
+    X(reset) \
+    X(io_a) \
+    X(io_b)
+
+#define CHECKPOINT_KEY 0xf63c22bbde8810deULL
+#define QUIESCENCE_START 13ULL
+
+#define VERILATOR_MAIN_INITIAL_BLOCK()                                   \
+    do                                                                   \
+    {                                                                    \
+            if (!ENABLE_INITIAL_BLOCK) \
+                break; \
+            VERILATOR_SWITCH_INPUT_TO(io_a, 0); \
+            VERILATOR_SWITCH_INPUT_TO(io_b, 0); \
+            VERILATOR_SWITCH_INPUT_TO(reset, 1); \
+            VERILATOR_STEP_AND_EVAL_UNTIL(10); \
+            VERILATOR_SWITCH_INPUT_TO(reset, 0); \
+            VERILATOR_STEP_AND_EVAL_UNTIL(11); \
+            VERILATOR_SWITCH_INPUT_TO(io_a, 1); \
+            VERILATOR_STEP_AND_EVAL_UNTIL(12); \
+            VERILATOR_SWITCH_INPUT_TO(io_b, 1); \
+            VERILATOR_STEP_AND_EVAL_UNTIL(13); \
+            VERILATOR_SWITCH_INPUT_TO(io_a, 0); \
+            VERILATOR_STEP_AND_EVAL_UNTIL(INITIAL_BLOCK_MAX_STIMULATE_TIME); \
+    } while (0)
+
+#define VERILATOR_MAIN_FOREVER_BLOCK()                               \
+    vluint64_t T_start;                                              \
+    do                                                               \
+    {                                                                \
+        T_start = T;                                                 \
+            if (!ENABLE_FOREVER_BLOCK) \
+                break; \
+            VERILATOR_STEP_AND_EVAL_UNTIL(FOREVER_BLOCK_CYCLE + T_start); \
+    } while (1)
+
+#endif //__SIM_STIMULUS__
@@ -0,0 +1,84 @@
+"""
+gen_tool.py展开引擎的性能基准：生成不同规模的引脚库与nxdclite文件，测量转换耗时
+
+默认布局中每个端口使用嵌套的大括号与循环（例如`@0-N p@ (Q[@*2-@]{A-H}{0-7})`）；--wide布局用
+一行嵌套笛卡尔积`wide (Q{0-N}{A-H}{0-7})`绑定全部引脚。输出引脚数按倍数增长，每个引脚的
+平均耗时应基本不变，即耗时与输出引脚数呈线性关系。
+
+用法: python pin/bench_gen_tool.py [--sizes 1024 4096 16384 65536] [--repeat 3] [--wide]
+"""
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+
+from gen_tool import NXDCConverter
+
+LETTERS = "ABCDEFGH"
+
+
+def write_case(directory, pin_count, wide=False):
+    """生成包含pin_count个物理引脚的板卡描述，以及恰好绑定全部引脚的nxdclite文件"""
+    ports = pin_count // 64
+    pins = ports * len(LETTERS) * 8
+    pins_path = os.path.join(directory, "boards.json")
+    with open(pins_path, "w") as f:
+        json.dump({"default": "bench", "boards": {"bench": {"groups": {
+            "Q": {"direction": "input", "pins": f"Q{{0-{ports - 1}}}{{A-H}}{{0-7}}"}}}}}, f)
+    half = ports // 2
+    lite_path = os.path.join(directory, "bench.nxdclite")
+    with open(lite_path, "w") as f:
+        f.write("top=top\n")
+        if wide:
+            f.write(f"wide (Q{{0-{ports - 1}}}{{A-H}}{{0-7}})\n")
+            return pins_path, lite_path, pins
+        # 一半端口由循环生成，一半逐行书写，分别覆盖两条展开路径
+        if half:
+            f.write(f"@0-{half - 1} p@ (Q[@*2-@]{{A-H}}{{0-7}})\n")
+        for i in range(half, ports):
+            f.write(f"p{i} (Q{i}{{A-D}}{{7-0}}, Q{i}{{E F G H}}{{0-3 4-7}})\n")
+    return pins_path, lite_path, pins
+
+
+def measure(pin_count, repeat, wide=False):
+    with tempfile.TemporaryDirectory() as directory:
+        pins_path, lite_path, total = write_case(directory, pin_count, wide)
+        output_path = os.path.join(directory, "bench.nxdc")
+        best = float("inf")
+        for _ in range(repeat):
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            converter = NXDCConverter(pins_path, cache_dir=os.path.join(directory, "index"))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                converter.convert(lite_path, output_path)
+            best = min(best, time.perf_counter() - start)
+        with open(output_path) as f:
+            bound = sum(line.count(",") + 1 for line in f if "(" in line)
+        if bound != total:
+            raise ValueError(f"输出引脚数 {bound} 与预期 {total} 不一致")
+    return total, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="nxdclite展开引擎性能基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 4096, 16384, 65536],
+                        help="输出引脚数（按64向下取整）")
+    parser.add_argument("--repeat", type=int, default=3, help="每个规模重复次数，取最快一次")
+    parser.add_argument("--wide", action="store_true", help="用单个端口的嵌套笛卡尔积绑定全部引脚")
+    args = parser.parse_args()
+
+    print(f"{'引脚数':>8}  {'耗时(ms)':>10}  {'每引脚(us)':>10}")
+    baseline = None
+    for size in args.sizes:
+        total, seconds = measure(size, args.repeat, args.wide)
+        per_pin = seconds / total * 1e6
+        baseline = baseline or per_pin
+        print(f"{total:>10}  {seconds * 1e3:>10.2f}  {per_pin:>10.3f}  x{per_pin / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
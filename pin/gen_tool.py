@@ -2,62 +2,437 @@ import re
 import sys
 import os
 import argparse
+import json
+import pickle
+import hashlib
+import itertools
+from fractions import Fraction
+
+from top_ports import scan_top_ports
+
+PORT_PATTERN = re.compile(r"(\w+)\s*\((.*)\)")
+LOOP_PATTERN = re.compile(r"@(\d+|[A-Z])-(\d+|[A-Z])\s+(.*)")
+LOOP_EXPR_PATTERN = re.compile(r"\[@([^\]]+)\]")
+ARITH_TOKEN_PATTERN = re.compile(r"\s*(?:(\d+)|(@)|(//|[-+*/%()]))")
+RANGE_PATTERN = re.compile(r"([A-Za-z0-9]+)-([A-Za-z0-9]+)")
+PIN_TOKEN_PATTERN = re.compile(r"[{},]|[^{},]+")
+DIRECTIONS = ("input", "output")
+UNBOUND_OK_PORTS = ("clk", "clock", "rst", "reset", "rst_n", "reset_n")  # 由仿真程序驱动，不要求绑定
+INDEX_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build", "pin_index")
+
+
+class PinTerm:
+    """一个引脚项的语法树：由字面文本与大括号备选集合依次拼接，迭代时惰性地按笛卡尔积展开"""
+    __slots__ = ("parts",)
+
+    def __init__(self, parts):
+        self.parts = parts  # 每个元素是备选文本的元组，字面文本为单元素元组
+
+    def __len__(self):
+        count = 1
+        for choices in self.parts:
+            count *= len(choices)
+        return count
+
+    def __iter__(self):
+        for combination in itertools.product(*self.parts):
+            yield "".join(combination)
+
+    def __str__(self):
+        return "".join(c[0] if len(c) == 1 else "{" + " ".join(c) + "}" for c in self.parts)
+
+
+def expand_range(start, end):
+    """展开大括号内的范围`A-G`或`15-0`，支持正序与反序"""
+    if start.isdigit() and end.isdigit():
+        s, e = int(start), int(end)
+        step = -1 if s > e else 1
+        return tuple(str(i) for i in range(s, e + step, step))
+    if len(start) == 1 and len(end) == 1:
+        s, e = ord(start), ord(end)
+        step = -1 if s > e else 1
+        return tuple(chr(i) for i in range(s, e + step, step))
+    raise ValueError(f"Unrecognized range '{start}-{end}'")
+
+
+def parse_brace(content):
+    """解析大括号内容：空格分隔的元素，每个元素可以是范围"""
+    choices = []
+    for item in content.split():
+        match = RANGE_PATTERN.fullmatch(item)
+        if match:
+            choices.extend(expand_range(*match.groups()))
+        else:
+            choices.append(item)
+    if not choices:
+        raise ValueError("Empty brace")
+    return tuple(choices)
+
+
+def parse_pin_list(description):
+    """对端口括号内的引脚列表做一次词法与语法分析，返回PinTerm列表（逗号分隔）"""
+    terms = []
+    parts = []
+    tokens = PIN_TOKEN_PATTERN.findall(description)
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if token == "{":
+            if index + 2 >= len(tokens) or tokens[index + 2] != "}" or tokens[index + 1] in "{},":
+                raise ValueError("Unclosed, empty or nested brace")
+            parts.append(parse_brace(tokens[index + 1]))
+            index += 3
+            continue
+        if token == "}":
+            raise ValueError("Unmatched '}'")
+        if token == ",":
+            terms.append(parts)
+            parts = []
+        else:
+            parts.append((token,))
+        index += 1
+    terms.append(parts)
+
+    result = []
+    for parts in terms:
+        # 与逗号相邻的空白不属于引脚名
+        if parts and len(parts[0]) == 1:
+            parts[0] = (parts[0][0].lstrip(),)
+        if parts and len(parts[-1]) == 1:
+            parts[-1] = (parts[-1][0].rstrip(),)
+        parts = [c for c in parts if c != ("",)]
+        if not parts:
+            raise ValueError("Empty pin entry")
+        result.append(PinTerm(tuple(parts)))
+    return result
+
+
+def compile_expression(text):
+    """把`[@...]`内的算术表达式编译为闭包，只支持整数、@、+ - * / // % 与括号，不使用eval
+
+    表达式以循环变量开头，例如`[@*2+1]`对应`@*2+1`；计算使用分数，结果向零取整。
+    """
+    source = "@" + text
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = ARITH_TOKEN_PATTERN.match(source, position)
+        if not match:
+            if source[position:].strip():
+                raise ValueError(f"Invalid character in expression '[@{text}]'")
+            break
+        number, variable, operator = match.groups()
+        tokens.append(int(number) if number else (variable or operator))
+        position = match.end()
+    index = 0
+
+    def peek():
+        return tokens[index] if index < len(tokens) else None
+
+    def take():
+        nonlocal index
+        index += 1
+        return tokens[index - 1]
+
+    def atom():
+        token = peek()
+        if token is None:
+            raise ValueError(f"Incomplete expression '[@{text}]'")
+        take()
+        if isinstance(token, int):
+            value = Fraction(token)
+            return lambda i: value
+        if token == "@":
+            return lambda i: Fraction(i)
+        if token == "(":
+            node = additive()
+            if peek() != ")":
+                raise ValueError(f"Unbalanced parentheses in expression '[@{text}]'")
+            take()
+            return node
+        raise ValueError(f"Unexpected {token!r} in expression '[@{text}]'")
+
+    def unary():
+        if peek() in ("+", "-"):
+            sign = take()
+            operand = unary()
+            return operand if sign == "+" else (lambda i: -operand(i))
+        return atom()
+
+    def multiplicative():
+        node = unary()
+        while peek() in ("*", "/", "//", "%"):
+            node = binary(take(), node, unary())
+        return node
+
+    def additive():
+        node = multiplicative()
+        while peek() in ("+", "-"):
+            node = binary(take(), node, multiplicative())
+        return node
+
+    def binary(operator, left, right):
+        if operator == "+":
+            return lambda i: left(i) + right(i)
+        if operator == "-":
+            return lambda i: left(i) - right(i)
+        if operator == "*":
+            return lambda i: left(i) * right(i)
+
+        def divide(i):
+            divisor = right(i)
+            if divisor == 0:
+                raise ValueError(f"Division by zero in expression '[@{text}]' at @={i}")
+            dividend = left(i)
+            if operator == "/":
+                return dividend / divisor
+            return dividend // divisor if operator == "//" else dividend % divisor
+        return divide
+
+    node = additive()
+    if index != len(tokens):
+        raise ValueError(f"Unexpected {tokens[index]!r} in expression '[@{text}]'")
+    return lambda i: int(node(i))
+
+
+class LoopTemplate:
+    """`@start-end`循环体的编译结果：字面文本、`@`占位与算术槽位，按循环变量逐次渲染"""
+    __slots__ = ("segments",)
+
+    def __init__(self, body, letters=False):
+        segments = []
+        position = 0
+        for match in LOOP_EXPR_PATTERN.finditer(body):
+            self.add_text(segments, body[position:match.start()], letters)
+            segments.append(compile_expression(match.group(1)))
+            position = match.end()
+        self.add_text(segments, body[position:], letters)
+        self.segments = tuple(segments)
+
+    @staticmethod
+    def add_text(segments, text, letters):
+        parts = text.split("@")
+        for k, part in enumerate(parts):
+            if k:
+                # 字母循环中单独的@替换为字母，[@...]槽位仍按字符编码计算
+                segments.append(chr if letters else str)
+            if part:
+                segments.append(part)
+
+    def render(self, i):
+        return "".join(s if isinstance(s, str) else str(s(i)) for s in self.segments)
+
+
+def resolve_board_groups(boards, name, seen=()):
+    """展开extends继承链，子板卡的同名分组覆盖父板卡，值为null的分组被移除"""
+    if name not in boards:
+        raise ValueError(f"Unknown board '{name}', available: {', '.join(sorted(boards))}")
+    if name in seen:
+        raise ValueError(f"Circular 'extends' in board '{name}'")
+    board = boards[name]
+    groups = {}
+    if "extends" in board:
+        groups.update(resolve_board_groups(boards, board["extends"], seen + (name,)))
+    for group, spec in board.get("groups", {}).items():
+        if spec is None:
+            groups.pop(group, None)
+        else:
+            groups[group] = spec
+    return groups
+
+
+def iter_bits(mask):
+    """按从低到高的顺序给出位集中置位的编号"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # Python 3.10以前
+    def popcount(mask):
+        return bin(mask).count("1")
+
+
+class PinIndex:
+    """板卡引脚库的预编译索引：引脚按稠密整数编号，分组与方向均表示为位集"""
+    __slots__ = ("board", "names", "ids", "groups", "direction_masks")
+
+    def __init__(self, board, names, groups):
+        self.board = board
+        self.names = names    # 编号 -> 引脚名
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.groups = groups  # 分组名 -> (方向, 位集)
+        self.direction_masks = dict.fromkeys(DIRECTIONS, 0)
+        for direction, mask in groups.values():
+            self.direction_masks[direction] |= mask
+
+    @classmethod
+    def build(cls, descriptor, board=None):
+        """由板卡描述（boards.json的内容）构建索引，分组的引脚列表使用nxdclite引脚语法"""
+        boards = descriptor.get("boards", {})
+        board = board or descriptor.get("default")
+        names = []
+        ids = {}
+        groups = {}
+        for group, spec in resolve_board_groups(boards, board).items():
+            direction = spec.get("direction")
+            if direction not in DIRECTIONS:
+                raise ValueError(f"Group '{group}' of board '{board}' has invalid direction {direction!r}")
+            try:
+                terms = parse_pin_list(spec.get("pins", ""))
+            except ValueError as e:
+                raise ValueError(f"Group '{group}' of board '{board}': {e}") from None
+            first = len(names)
+            for term in terms:
+                for pin in term:
+                    if pin in ids:
+                        raise ValueError(f"Pin '{pin}' of board '{board}' appears in more than one group")
+                    ids[pin] = len(names)
+                    names.append(pin)
+            # 同一分组的引脚编号连续，位集即一段连续的1
+            groups[group] = (direction, ((1 << (len(names) - first)) - 1) << first)
+        return cls(board, tuple(names), groups)
+
+    def mask_of(self, pin_ids):
+        bits = bytearray((len(self.names) + 7) // 8)
+        for pin_id in pin_ids:
+            bits[pin_id >> 3] |= 1 << (pin_id & 7)
+        return int.from_bytes(bits, "little")
+
+    def names_of(self, mask):
+        return [self.names[pin_id] for pin_id in iter_bits(mask)]
+
+
+def load_pin_index(path, board=None, cache_dir=INDEX_CACHE_DIR):
+    """加载板卡引脚库索引，以描述文件内容与板卡名的哈希为键缓存预编译结果，内容不变时不再解析"""
+    with open(path, "rb") as f:
+        data = f.read()
+    key = hashlib.sha256(data + b"\0" + (board or "").encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"{key}.pickle")
+    try:
+        with open(cache_path, "rb") as f:
+            return PinIndex(*pickle.load(f))
+    except (OSError, EOFError, pickle.UnpicklingError, TypeError):
+        pass
+    try:
+        descriptor = json.loads(data)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path}: {e}") from None
+    index = PinIndex.build(descriptor, board)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.tmp{os.getpid()}"
+        with open(temp_path, "wb") as f:
+            pickle.dump((index.board, index.names, index.groups), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # 缓存只用于加速，目录不可写时直接使用本次解析的结果
+    return index
+
 
 class NXDCConverter:
-    def __init__(self, pins_db_path, verbose=False):
+    def __init__(self, board_db_path, board=None, verbose=False, cache_dir=INDEX_CACHE_DIR,
+                 hdl_paths=(), top_module=None, strict=False, ignore_ports=(), memo=None):
         self.verbose = verbose
-        self.ensure_pins_db(pins_db_path)
-        self.valid_pins = self.load_pins(pins_db_path)
+        # 引脚列表与循环行的解析结果，只依赖文本与板卡；常驻进程（scripts/watch.py）在多次转换间共享
+        self.memo = {} if memo is None else memo
+        self.hdl_paths = list(hdl_paths)  # 非空时按顶层模块的端口声明检查绑定
+        self.top_module = top_module
+        self.strict = strict
+        self.ignore_ports = set(UNBOUND_OK_PORTS) | set(ignore_ports)
+        try:
+            self.index = load_pin_index(board_db_path, board, cache_dir)
+        except (OSError, ValueError) as e:
+            print(f"\033[31m[Board Error] {e}\033[0m")
+            sys.exit(1)
         self.summary = []      # 存储格式: {"port": str, "width": int, "count": int}
-        self.used_pins = {}    # 物理引脚 -> 端口名
+        self.port_masks = []   # (端口名, 引脚位集)
+        self.used_mask = 0     # 已分配的物理引脚位集
         self.defined_ports = set() # 记录已定义的逻辑端口
+        self.errors = []       # 一次转换中收集的全部错误: (类别, 信息, 上下文)
+        self.warnings = []     # 不阻止写出的问题，--strict时作为错误处理
+        self.bindings = []     # (端口名, 物理引脚列表)，用于直接生成auto_bind.cpp
+        self.top_name = "top"
 
     def log(self, msg):
         if self.verbose:
             print(f"\033[90m[DEBUG] {msg}\033[0m")
 
-    def ensure_pins_db(self, path):
-        if not os.path.exists(path):
-            pins_data = "BTNC BTNU BTND BTNL BTNR SW0 SW1 SW2 SW3 SW4 SW5 SW6 SW7 SW8 SW9 SW10 SW11 SW12 SW13 SW14 SW15 LD0 LD1 LD2 LD3 LD4 LD5 LD6 LD7 LD8 LD9 LD10 LD11 LD12 LD13 LD14 LD15 R16 G16 B16 R17 G17 B17 SEG0A SEG0B SEG0C SEG0D SEG0E SEG0F SEG0G DEC0P SEG1A SEG1B SEG1C SEG1D SEG1E SEG1F SEG1G DEC1P SEG2A SEG2B SEG2C SEG2D SEG2E SEG2F SEG2G DEC2P SEG3A SEG3B SEG3C SEG3D SEG3E SEG3F SEG3G DEC3P SEG4A SEG4B SEG4C SEG4D SEG4E SEG4F SEG4G DEC4P SEG5A SEG5B SEG5C SEG5D SEG5E SEG5F SEG5G DEC5P SEG6A SEG6B SEG6C SEG6D SEG6E SEG6F SEG6G DEC6P SEG7A SEG7B SEG7C SEG7D SEG7E SEG7F SEG7G DEC7P VGA_VSYNC VGA_HSYNC VGA_BLANK_N VGA_R0 VGA_R1 VGA_R2 VGA_R3 VGA_R4 VGA_R5 VGA_R6 VGA_R7 VGA_G0 VGA_G1 VGA_G2 VGA_G3 VGA_G4 VGA_G5 VGA_G6 VGA_G7 VGA_B0 VGA_B1 VGA_B2 VGA_B3 VGA_B4 VGA_B5 VGA_B6 VGA_B7 UART_TX UART_RX PS2_CLK PS2_DAT"
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            with open(path, 'w') as f: f.write(pins_data)
-
-    def load_pins(self, path):
-        with open(path, 'r') as f: return set(f.read().split())
-
-    def expand_ranges_in_brackets(self, text):
-        def repl_bracket(m):
-            content = m.group(1)
-            def repl_range(rm):
-                start, end = rm.group(1), rm.group(2)
-                if start.isdigit() and end.isdigit():
-                    s, e = int(start), int(end)
-                    step = -1 if s > e else 1
-                    return " ".join([str(i) for i in range(s, e + step, step)])
-                else:
-                    s, e = ord(start), ord(end)
-                    step = -1 if s > e else 1
-                    return " ".join([chr(i) for i in range(s, e + step, step)])
-            new_content = re.sub(r"([A-Za-z0-9]+)-([A-Za-z0-9]+)", repl_range, content)
-            return "{" + new_content + "}"
-        return re.sub(r"\{([^}]+)\}", repl_bracket, text)
-
-    def expand_brackets(self, token):
-        results = [token]
-        while True:
-            new_results = []
-            expanded_any = False
-            for s in results:
-                match = re.search(r"\{([^}]+)\}", s)
-                if match:
-                    expanded_any = True
-                    prefix, content, suffix = s[:match.start()], match.group(1), s[match.end():]
-                    for item in content.strip().split():
-                        new_results.append(prefix + item + suffix)
-                else: new_results.append(s)
-            results = new_results
-            if not expanded_any: break
-        return results
+    def error(self, kind, message, context=None):
+        self.errors.append((kind, message, context))
+
+    def warn(self, kind, message, context=None):
+        (self.errors if self.strict else self.warnings).append((kind, message, context))
+
+    def scan_ports(self):
+        """读取顶层模块的端口声明，返回(模块名, 端口列表, 文件)，失败时记录错误并返回None"""
+        module = self.top_module or self.top_name
+        try:
+            ports, path = scan_top_ports(self.hdl_paths, module)
+        except (OSError, ValueError) as e:
+            self.error("Port Error", str(e))
+            return None
+        self.log(f"{path}: module {module} has {len(ports)} ports")
+        return module, ports, path
+
+    def check_ports(self, module, ports):
+        """按端口声明检查每个绑定的位宽与方向，并报告未绑定的端口"""
+        declared = {port.name: port for port in ports}
+        masks = dict(self.port_masks)
+        inputs = self.index.direction_masks["input"]
+        outputs = self.index.direction_masks["output"]
+        for port_name, pins in self.bindings:
+            port = declared.get(port_name)
+            if port is None:
+                self.error("Port Error", f"Port '{port_name}' does not exist in module '{module}'!")
+                continue
+            if port.width is not None and port.width != len(pins):
+                self.warn("Width Mismatch", f"Port '{port_name}' is {port.width} bit(s) wide but bound to {len(pins)} pin(s)")
+            wrong = masks[port_name] & {"input": outputs, "output": inputs}.get(port.direction, 0)
+            if wrong:
+                self.error("Direction Error",
+                           f"{port.direction.capitalize()} port '{port_name}' is bound to "
+                           f"{'output' if port.direction == 'input' else 'input'} pins ({', '.join(self.index.names_of(wrong))})!")
+        unbound = [port.name for port in ports if port.name not in masks and port.name not in self.ignore_ports]
+        if unbound:
+            self.warn("Unbound Port", f"Ports of '{module}' without binding: {', '.join(unbound)}")
+
+    @staticmethod
+    def group_matches(port_name, group):
+        """端口名与分组名相同，或以分组名开头且其后不是字母（如sw、SW_IN、ld0对应SW、LD）"""
+        name, group = port_name.upper(), group.upper()
+        return name == group or (name.startswith(group) and not name[len(group)].isalpha())
+
+    def generate_template(self, module, ports, source):
+        """按端口声明生成nxdclite模板：只在名字相符（端口名或其前缀与分组名相同）且方向相符的分组中分配空闲引脚，高位在前"""
+        lines = [f"top={module}", f"# 由gen_tool.py根据{source}中的模块{module}生成，请按需修改引脚"]
+        groups = {group: (direction, self.index.names_of(mask)) for group, (direction, mask) in self.index.groups.items()}
+        for port in ports:
+            comment = f"{port.direction} [{port.width - 1}:0]" if port.width else port.direction
+            # 名字完全相同的分组优先，其次是较长的前缀
+            names = sorted((group for group, (direction, _) in groups.items()
+                            if direction == port.direction and self.group_matches(port.name, group)),
+                           key=lambda group: (group.upper() != port.name.upper(), -len(group)))
+            free = [groups[group][1] for group in names]
+            if port.name in self.ignore_ports:
+                lines.append(f"# {port.name}: {comment}，由仿真程序驱动，不绑定")
+            elif port.width is None or not free:
+                lines.append(f"# {port.name} ()  # {comment}，请手动绑定")
+            elif sum(len(pins) for pins in free) < port.width:
+                lines.append(f"# {port.name} ()  # {comment}，板卡剩余的{'/'.join(names)}引脚不足")
+            else:
+                # 优先放在能容纳整个端口的第一个分组内，否则依次跨分组分配
+                fit = next((pins for pins in free if len(pins) >= port.width), None)
+                chosen = []
+                for pins in [fit] if fit else free:
+                    take = pins[:port.width - len(chosen)]
+                    del pins[:len(take)]
+                    chosen += take
+                lines.append(f"{port.name} ({', '.join(reversed(chosen))})  # {comment}")
+        return '\n'.join(lines) + '\n'
 
     def process_line(self, line):
         # 1. 支持行尾注释：剔除 # 之后的内容
@@ -65,42 +440,88 @@ class NXDCConverter:
         line = line.split('#')[0].strip()
         if not line or '=' in line: return raw_line if '=' in line else None
 
-        match = re.match(r"(\w+)\s*\((.*)\)", line)
+        match = PORT_PATTERN.match(line)
         if not match: return None
 
         port_name, description = match.groups()
         
         # 2. 重复端口检测
         if port_name in self.defined_ports:
-            print(f"\033[31m[Duplicate Port Error] Port '{port_name}' is defined multiple times!\033[0m")
-            sys.exit(1)
+            self.error("Duplicate Port Error", f"Port '{port_name}' is defined multiple times!")
+            return None
         self.defined_ports.add(port_name)
 
-        tokens = [t.strip() for t in description.split(',')]
-        expanded_pins = []
-        for token in tokens:
-            step1 = self.expand_ranges_in_brackets(token)
-            expanded_pins.extend(self.expand_brackets(step1))
-
-        # 3. 校验与颜色高亮错误定位
-        for p in expanded_pins:
-            if p not in self.valid_pins:
-                # 颜色高亮定位：将错误的引脚在原始行中用红底白字标出
-                highlight = f"\033[41;37m {p} \033[0m"
-                err_msg = raw_line.replace(p, highlight)
-                print(f"\033[31m[Syntax Error] Invalid physical pin '{p}' detected!\033[0m")
-                print(f"Context: {err_msg}")
-                sys.exit(1)
-            
-            if p in self.used_pins:
-                print(f"\033[31m[Conflict Error] Physical pin '{p}' is assigned to both '{self.used_pins[p]}' and '{port_name}'!\033[0m")
-                sys.exit(1)
-            self.used_pins[p] = port_name
+        resolved = self.memo.get(("pins", description))
+        if resolved is None:
+            resolved = self.memo[("pins", description)] = self.resolve_pins(description)
+        syntax_error, expanded_pins, pin_ids, invalid_pins = resolved
+        if syntax_error:
+            self.error("Syntax Error", syntax_error, raw_line)
+            return None
+        for p in invalid_pins:
+            # 颜色高亮定位：将错误的引脚在原始行中用红底白字标出
+            highlight = f"\033[41;37m {p} \033[0m"
+            self.error("Syntax Error", f"Invalid physical pin '{p}' detected!", raw_line.replace(p, highlight))
+        self.log(f"{port_name}: {description} -> {len(expanded_pins)} pins")
+
+        # 4. 冲突与方向检查均为位集运算
+        mask = self.index.mask_of(pin_ids)
+        if popcount(mask) != len(pin_ids):
+            seen = set()
+            for p in expanded_pins:
+                if p in seen:
+                    self.error("Conflict Error", f"Physical pin '{p}' is listed more than once in '{port_name}'!")
+                seen.add(p)
+        overlap = mask & self.used_mask
+        if overlap:
+            for owner, owner_mask in self.port_masks:
+                for p in self.index.names_of(overlap & owner_mask):
+                    self.error("Conflict Error", f"Physical pin '{p}' is assigned to both '{owner}' and '{port_name}'!")
+        inputs = mask & self.index.direction_masks["input"]
+        outputs = mask & self.index.direction_masks["output"]
+        if inputs and outputs:
+            self.error("Direction Error",
+                       f"Port '{port_name}' mixes input pins ({', '.join(self.index.names_of(inputs))}) "
+                       f"and output pins ({', '.join(self.index.names_of(outputs))})!", raw_line)
+        self.port_masks.append((port_name, mask))
+        self.used_mask |= mask
 
         # 记录摘要信息
         self.summary.append({"port": port_name, "width": len(expanded_pins)-1, "count": len(expanded_pins)})
+        self.bindings.append((port_name, expanded_pins))
         return f"{port_name} ({', '.join(expanded_pins)})"
 
+    def resolve_pins(self, description):
+        """3. 逐个展开并查找引脚编号，非法引脚记录后继续检查其余引脚；返回(语法错误, 引脚名, 引脚编号, 非法引脚)"""
+        try:
+            terms = parse_pin_list(description)
+        except ValueError as e:
+            return str(e), [], [], []
+        expanded_pins = []
+        pin_ids = []
+        invalid_pins = []
+        ids = self.index.ids
+        for term in terms:
+            for p in term:
+                pin_id = ids.get(p)
+                if pin_id is None:
+                    invalid_pins.append(p)
+                    continue
+                expanded_pins.append(p)
+                pin_ids.append(pin_id)
+        return None, expanded_pins, pin_ids, invalid_pins
+
+    def render_loop(self, start, end, body):
+        """展开@循环行，返回展开后的行列表；语法错误时抛出ValueError"""
+        rendered = self.memo.get(("loop", start, end, body))
+        if rendered is None:
+            s_val = int(start) if start.isdigit() else ord(start)
+            e_val = int(end) if end.isdigit() else ord(end)
+            step = -1 if s_val > e_val else 1
+            template = LoopTemplate(body, letters=not start.isdigit())
+            rendered = self.memo[("loop", start, end, body)] = [template.render(i) for i in range(s_val, e_val + step, step)]
+        return rendered
+
     def print_summary(self):
         if not self.summary: return
         # 4. 自动位宽对齐计算
@@ -110,9 +531,31 @@ class NXDCConverter:
             name = s["port"].ljust(max_name_len)
             width = f"[{s['width']}:0]".ljust(8)
             print(f"  Port: {name}  Width: {width}  ({s['count']} pins)")
+        print(f"\033[32m=== Pin Coverage ({self.index.board}) ===\033[0m")
+        max_group_len = max(len(g) for g in self.index.groups)
+        for group, (direction, mask) in self.index.groups.items():
+            used = popcount(mask & self.used_mask)
+            if used:
+                print(f"  Group: {group.ljust(max_group_len)}  {direction.ljust(6)}  {used}/{popcount(mask)} pins")
         print("\033[32m============================\033[0m\n")
 
-    def convert(self, input_path, output_path):
+    def generate_bind_cpp(self):
+        """由内存中的绑定表生成NVBoard的nvboard_bind_all_pins，格式与auto_pin_bind.py的输出一致"""
+        top = f"V{self.top_name}"
+        lines = ['#include <nvboard.h>', f'#include "{top}.h"', '', f'void nvboard_bind_all_pins({top}* top) {{']
+        for port, pins in self.bindings:
+            lines.append(f"\tnvboard_bind_pin( &top->{port}, {len(pins)}, {', '.join(pins)});")
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def write_output(self, path, content):
+        if self.write_if_changed(path, content):
+            self.log(f"已写入 {path}")
+        else:
+            print(f"{path} 内容未变化，保留原文件")
+
+    def convert(self, input_path, output_path=None, cpp_path=None):
+        """转换nxdclite；output_path为None时不写出.nxdc，给出cpp_path时直接生成auto_bind.cpp"""
         if not os.path.exists(input_path): return
         with open(input_path, 'r') as f: lines = f.readlines()
 
@@ -121,31 +564,95 @@ class NXDCConverter:
             line = line.strip()
             if not line: continue
             if line.startswith('@'):
-                loop_match = re.match(r"@(\d+|[A-Z])-(\d+|[A-Z])\s+(.*)", line.split('#')[0])
+                loop_match = LOOP_PATTERN.match(line.split('#')[0])
                 if loop_match:
-                    start, end, body = loop_match.groups()
-                    s_val = int(start) if start.isdigit() else ord(start)
-                    e_val = int(end) if end.isdigit() else ord(end)
-                    step = -1 if s_val > e_val else 1
-                    for i in range(s_val, e_val + step, step):
-                        current_line = body
-                        for expr in re.findall(r"\[@([^\]]+)\]", current_line):
-                            res_val = int(eval(f"{i}{expr}"))
-                            current_line = current_line.replace(f"[@{expr}]", str(res_val))
-                        processed = self.process_line(current_line.replace('@', str(i) if start.isdigit() else chr(i)))
+                    try:
+                        rendered = self.render_loop(*loop_match.groups())
+                    except ValueError as e:
+                        self.error("Syntax Error", str(e), line)
+                        continue
+                    for current_line in rendered:
+                        processed = self.process_line(current_line)
                         if processed: final_lines.append(processed)
             else:
                 processed = self.process_line(line)
                 if processed: final_lines.append(processed)
+                key, _, value = line.split('#')[0].partition('=')
+                if value and key.strip() == 'top':
+                    self.top_name = value.strip()
+
+        if self.hdl_paths:
+            scanned = self.scan_ports()
+            if scanned:
+                self.check_ports(*scanned[:2])
+        for kind, message, context in self.warnings:
+            print(f"\033[33m[{kind}] {message}\033[0m")
+            if context:
+                print(f"Context: {context}")
+
+        if self.errors:
+            # 一次报告全部错误，不写出不完整的绑定文件
+            for kind, message, context in self.errors:
+                print(f"\033[31m[{kind}] {message}\033[0m")
+                if context:
+                    print(f"Context: {context}")
+            print(f"\033[31m{len(self.errors)} error(s), no binding file written\033[0m")
+            sys.exit(1)
 
-        with open(output_path, 'w') as f: f.write('\n'.join(final_lines) + '\n')
+        if output_path:
+            self.write_output(output_path, '\n'.join(final_lines) + '\n')
+        if cpp_path:
+            self.write_output(cpp_path, self.generate_bind_cpp())
         self.print_summary()
 
+    @staticmethod
+    def content_hash(text):
+        """忽略行尾空白与空行后的内容哈希"""
+        lines = (l.rstrip() for l in text.splitlines())
+        return hashlib.sha256('\n'.join(l for l in lines if l).encode()).hexdigest()
+
+    def write_if_changed(self, output_path, content):
+        """仅在规范化内容变化时改写文件，保持mtime不变以免触发下游重新构建"""
+        if os.path.exists(output_path):
+            with open(output_path, 'r') as f:
+                if self.content_hash(f.read()) == self.content_hash(content):
+                    return False
+        temp_path = output_path + ".tmp"
+        with open(temp_path, 'w') as f: f.write(content)
+        os.replace(temp_path, output_path)
+        return True
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("input", nargs="?"); parser.add_argument("output", nargs="?")
     parser.add_argument("--verbose", "-v", action="store_true")
+    parser.add_argument("--boards", help="板卡描述文件，默认为pin/boards.json")
+    parser.add_argument("--board", help="板卡名，默认为描述文件中的default")
+    parser.add_argument("--cpp", help="同时生成NVBoard引脚绑定源文件（如src/c/auto_bind.cpp），内容未变化时不改写")
+    parser.add_argument("--no-nxdc", action="store_true", help="不写出.nxdc文件")
+    parser.add_argument("--hdl", nargs="+", default=[], metavar="FILE",
+                        help="包含顶层模块的Verilog/SystemVerilog文件，用于检查端口位宽、方向与未绑定的端口")
+    parser.add_argument("--top-module", help="顶层模块名，默认取nxdclite中的top=")
+    parser.add_argument("--strict", action="store_true", help="位宽不符与未绑定的端口也作为错误")
+    parser.add_argument("--ignore-port", action="append", default=[], metavar="NAME",
+                        help="不要求绑定的端口，clk/clock/rst/reset等已默认忽略")
+    parser.add_argument("--template", metavar="PATH", help="根据--hdl中的顶层模块生成nxdclite模板后退出")
     args = parser.parse_args()
     pwd = os.path.dirname(os.path.abspath(__file__)) + "/"
-    conv = NXDCConverter(pwd + "pins", verbose=args.verbose)
-    conv.convert(args.input or pwd+"top.nxdclite", args.output or pwd+"top.nxdc")
\ No newline at end of file
+    conv = NXDCConverter(args.boards or pwd + "boards.json", args.board, verbose=args.verbose,
+                         hdl_paths=args.hdl, top_module=args.top_module, strict=args.strict,
+                         ignore_ports=args.ignore_port)
+    if args.template:
+        if not args.hdl:
+            parser.error("--template需要通过--hdl指定顶层模块所在的文件")
+        if os.path.exists(args.template):
+            print(f"\033[31m[Template Error] {args.template} already exists\033[0m")
+            sys.exit(1)
+        scanned = conv.scan_ports()
+        if scanned is None:
+            print(f"\033[31m[{conv.errors[0][0]}] {conv.errors[0][1]}\033[0m")
+            sys.exit(1)
+        with open(args.template, 'w') as f: f.write(conv.generate_template(*scanned))
+        print(f"模板已写入 {args.template}")
+        sys.exit(0)
+    conv.convert(args.input or pwd+"top.nxdclite", None if args.no_nxdc else args.output or pwd+"top.nxdc", args.cpp)
\ No newline at end of file
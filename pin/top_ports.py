@@ -0,0 +1,255 @@
+"""
+顶层模块端口扫描：只读取指定模块的端口声明，供gen_tool.py检查引脚绑定与生成nxdclite模板
+
+Chisel生成的top.sv可能有数十MB，扫描按块读取文件，用字节正则定位`module <名称>`，
+之后只解析端口声明部分。结果按文件大小与修改时间缓存在build/port_cache/，时间变化但内容
+哈希相同时直接复用缓存。
+"""
+import os
+import re
+import json
+import hashlib
+
+CHUNK_SIZE = 1 << 20
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build", "port_cache")
+CACHE_VERSION = 1
+
+COMMENT_PATTERN = re.compile(r"//[^\n]*|/\*.*?\*/", re.S)
+DIRECTION_PATTERN = re.compile(r"\b(input|output|inout)\b")
+DECLARATION_PATTERN = re.compile(
+    r"^(?:(input|output|inout)\s+)?((?:(?:wire|reg|logic|var|signed|unsigned)\s+)*)((?:\[[^\]]*\]\s*)*)([A-Za-z_]\w*)\s*(\[[^\]]*\]\s*)*$",
+    re.S)
+RANGE_PATTERN = re.compile(r"\[\s*(-?\d+)\s*:\s*(-?\d+)\s*\]")
+
+
+class Port:
+    __slots__ = ("name", "direction", "width")
+
+    def __init__(self, name, direction, width):
+        self.name = name
+        self.direction = direction
+        self.width = width  # 位宽由参数决定时为None
+
+    def __repr__(self):
+        return f"Port({self.name!r}, {self.direction!r}, {self.width!r})"
+
+
+def packed_width(ranges):
+    """计算`[7:0][3:0]`形式的位宽，包含非整数表达式时返回None"""
+    width = 1
+    for text in re.findall(r"\[[^\]]*\]", ranges):
+        match = RANGE_PATTERN.fullmatch(text)
+        if not match:
+            return None
+        width *= abs(int(match.group(1)) - int(match.group(2))) + 1
+    return width
+
+
+def split_top_level(text, separator=","):
+    """按不在括号内的分隔符切分"""
+    items = []
+    depth = 0
+    start = 0
+    for i, c in enumerate(text):
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == separator and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return [item.strip() for item in items if item.strip()]
+
+
+def parse_declarations(items, ports, names=None):
+    """解析端口声明列表；省略方向与位宽的条目沿用前一个声明（如`input a, b`）"""
+    direction = None
+    width = 1
+    for item in items:
+        match = DECLARATION_PATTERN.match(item)
+        if not match:
+            raise ValueError(f"Unsupported port declaration '{item}'")
+        item_direction, _, ranges, name, _ = match.groups()
+        if item_direction:
+            direction = item_direction
+            width = packed_width(ranges)
+        elif ranges:
+            width = packed_width(ranges)
+        if direction is None:
+            if names is None:
+                raise ValueError(f"Port '{name}' has no direction")
+            names.append(name)  # 非ANSI风格的端口列表，方向在模块体内声明
+            continue
+        ports.append(Port(name, direction, width))
+
+
+def find_module(f, module):
+    """按块查找`module <名称>`，返回从该处开始的文本，未找到时返回None"""
+    # 开头的\b会让正则在每个位置回溯，改为命中后再检查前一个字符，速度快一个数量级
+    pattern = re.compile(rb"module\s+" + re.escape(module.encode()) + rb"\b")
+    data = b""
+    before = b""  # data之前的一个字节，块被截断后仍能检查命中前的字符
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        data += chunk
+        pending = None
+        for match in pattern.finditer(data):
+            start = match.start()
+            previous = data[start - 1:start] if start else before
+            if previous.isalnum() or previous in (b"_", b"$"):
+                continue
+            if match.end() == len(data) and chunk:
+                # \b在已读数据的末尾也成立，名字可能在下一块中继续（如top_wrapper），读入下一块后再判断
+                pending = start
+                break
+            return data[start:]
+        if not chunk:
+            return None
+        cut = max(len(data) - (len(module) + 64), 0)
+        if pending is not None:
+            cut = min(cut, pending)
+        if cut:
+            before = data[cut - 1:cut]
+            data = data[cut:]
+
+
+def read_until(f, data, marker):
+    """继续读取直到去掉注释的文本中出现marker，返回(原始字节, 文本, 是否找到)"""
+    while True:
+        text = COMMENT_PATTERN.sub(" ", data.decode(errors="replace"))
+        if marker.search(text):
+            return data, text, True
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            return data, text, False
+        data += chunk
+
+
+HEADER_END_PATTERN = re.compile(r"\)\s*;")
+ENDMODULE_PATTERN = re.compile(r"\bendmodule\b")
+
+
+def parse_header(text, module):
+    """从`module`开始的文本中解析端口，返回(端口列表, 非ANSI端口名列表)"""
+    position = re.match(r"module\s+" + re.escape(module) + r"\b", text).end()
+    rest = text[position:].lstrip()
+    if rest.startswith("#"):
+        # 跳过参数列表 #(...)
+        rest = rest[1:].lstrip()
+        depth = 0
+        for i, c in enumerate(rest):
+            depth += c == "("
+            depth -= c == ")"
+            if depth == 0:
+                rest = rest[i + 1:].lstrip()
+                break
+    if rest.startswith(";"):
+        return [], []
+    if not rest.startswith("("):
+        raise ValueError(f"Cannot find the port list of module '{module}'")
+    depth = 0
+    for i, c in enumerate(rest):
+        depth += c == "("
+        depth -= c == ")"
+        if depth == 0:
+            port_list = rest[1:i]
+            break
+    else:
+        raise ValueError(f"Unterminated port list of module '{module}'")
+    ports = []
+    names = []
+    parse_declarations(split_top_level(port_list), ports, names)
+    return ports, names
+
+
+def parse_body_declarations(text, names):
+    """非ANSI风格：在模块体中查找`input [7:0] a, b;`形式的声明，按端口列表的顺序返回"""
+    body = ENDMODULE_PATTERN.split(text, 1)[0]
+    declared = {}
+    for statement in body.split(";"):
+        statement = statement.strip()
+        if not DIRECTION_PATTERN.match(statement):
+            continue
+        ports = []
+        parse_declarations(split_top_level(statement), ports)
+        for port in ports:
+            declared[port.name] = port
+    missing = [name for name in names if name not in declared]
+    if missing:
+        raise ValueError(f"Ports without direction declaration: {', '.join(missing)}")
+    return [declared[name] for name in names]
+
+
+def scan_file(path, module):
+    """扫描单个文件，模块不在该文件中时返回None"""
+    with open(path, "rb") as f:
+        data = find_module(f, module)
+        if data is None:
+            return None
+        data, text, found = read_until(f, data, HEADER_END_PATTERN)
+        if not found and ";" not in text:
+            raise ValueError(f"Unterminated header of module '{module}'")
+        ports, names = parse_header(text, module)
+        if names:
+            _, text, _ = read_until(f, data, ENDMODULE_PATTERN)
+            ports += parse_body_declarations(text, names)
+    return ports
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_scan(path, module, cache_dir=CACHE_DIR):
+    """带缓存的扫描：大小与修改时间不变时直接使用缓存，时间变化但内容哈希相同时同样复用"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{path}\0{module}".encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"{key}.json")
+    cache = None
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+        if cache.get("version") != CACHE_VERSION:
+            cache = None
+    except (OSError, ValueError):
+        pass
+
+    if cache and (cache["size"], cache["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        return restore_ports(cache)
+    digest = file_digest(path)
+    if cache is None or digest != cache["sha256"]:
+        ports = scan_file(path, module)
+        cache = {"version": CACHE_VERSION, "sha256": digest,
+                 "ports": None if ports is None else [[p.name, p.direction, p.width] for p in ports]}
+    cache["size"], cache["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = f"{cache_path}.tmp{os.getpid()}"
+        with open(temp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        pass  # 缓存只用于加速，目录不可写时直接使用本次扫描的结果
+    return restore_ports(cache)
+
+
+def restore_ports(cache):
+    return None if cache["ports"] is None else [Port(*p) for p in cache["ports"]]
+
+
+def scan_top_ports(paths, module, cache_dir=CACHE_DIR):
+    """在给定的HDL文件中依次查找模块，返回(端口列表, 所在文件)；都未找到时抛出ValueError"""
+    for path in paths:
+        try:
+            ports = cached_scan(path, module, cache_dir)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from None
+        if ports is not None:
+            return ports, path
+    raise ValueError(f"Module '{module}' not found in {', '.join(paths)}")
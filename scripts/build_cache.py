@@ -0,0 +1,172 @@
+"""
+构建缓存：以Verilog源文件、C++源文件、头文件与构建选项的内容哈希为键，保存并恢复obj_dir与可执行文件
+
+由Makefile调用。restore在键命中时把缓存的obj_dir与可执行文件复制回原位置并返回0，未命中时返回1，
+由make继续执行Verilator与C++编译；store在构建完成后保存本次的结果。切换LANGUAGE_OPTION、
+SIMULATION_WITH_NVBOARD或BUILD_PROFILE、make clean之后，或者重新生成内容相同的generated/top.sv时，
+都可以直接恢复此前的构建。缓存总大小超过上限时按最近使用时间淘汰最旧的条目。
+
+用法: python scripts/build_cache.py restore|store --cache-dir 目录 --obj-dir 目录 --executable 路径
+                                       --flags "构建选项" --inputs 文件... [--max-size MB]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+CACHE_VERSION = 1
+CHUNK_SIZE = 1 << 20
+KEY_FILE = ".cache_key"
+META_FILE = "meta.json"
+
+
+def tool_version(command):
+    """工具版本参与计算键，升级Verilator或编译器后不会恢复旧的构建"""
+    try:
+        return subprocess.run([command, "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        return ""
+
+
+def compute_key(inputs, flags, tools=("verilator", "g++")):
+    """按文件路径与内容、构建选项和工具版本计算键；只依赖内容，与修改时间无关"""
+    digest = hashlib.sha256(f"v{CACHE_VERSION}\0{flags}\0".encode())
+    for tool in tools:
+        digest.update(f"{tool_version(tool)}\0".encode())
+    for path in sorted(set(inputs)):
+        digest.update(f"{os.path.abspath(path)}\0".encode())
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    digest.update(chunk)
+        except OSError:
+            digest.update(b"<missing>")
+        digest.update(b"\0")
+    return digest.hexdigest()[:32]
+
+
+def executable_stat(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def is_current(args, key):
+    """obj_dir与可执行文件已是该键对应的构建；可执行文件被其他构建配置覆盖时不成立"""
+    try:
+        with open(os.path.join(args.obj_dir, KEY_FILE)) as f:
+            marker = json.load(f)
+        return marker["key"] == key and marker["executable"] == executable_stat(args.executable)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def write_marker(args, key):
+    with open(os.path.join(args.obj_dir, KEY_FILE), "w") as f:
+        json.dump({"key": key, "executable": executable_stat(args.executable)}, f)
+
+
+def tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def copy_tree(src, dst, stamp):
+    """复制目录并把所有文件的修改时间设为同一时刻，避免Verilator生成的Makefile因先后顺序重新编译"""
+    shutil.copytree(src, dst, copy_function=shutil.copy)
+    for root, _, names in os.walk(dst):
+        for name in names:
+            os.utime(os.path.join(root, name), ns=(stamp, stamp))
+
+
+def restore(args, key):
+    if is_current(args, key):
+        return True
+    executable = os.path.abspath(args.executable)
+    entry = os.path.join(args.cache_dir, key)
+    if not os.path.isfile(os.path.join(entry, META_FILE)):
+        return False
+    stamp = time.time_ns()
+    shutil.rmtree(args.obj_dir, ignore_errors=True)
+    copy_tree(os.path.join(entry, "obj_dir"), args.obj_dir, stamp)
+    os.makedirs(os.path.dirname(executable), exist_ok=True)
+    shutil.copy(os.path.join(entry, "executable"), executable)
+    os.utime(executable, ns=(stamp, stamp))
+    os.utime(os.path.join(entry, META_FILE))  # 记录最近使用时间
+    print(f"[BUILD CACHE] restored {key}")
+    return True
+
+
+def store(args, key):
+    entry = os.path.join(args.cache_dir, key)
+    if os.path.isfile(os.path.join(entry, META_FILE)):
+        os.utime(os.path.join(entry, META_FILE))
+    else:
+        # 先写入临时目录再重命名，并发的构建不会读到写了一半的条目
+        temp = os.path.join(args.cache_dir, f".{key}.tmp{os.getpid()}")
+        shutil.rmtree(temp, ignore_errors=True)
+        shutil.copytree(args.obj_dir, os.path.join(temp, "obj_dir"), ignore=shutil.ignore_patterns(KEY_FILE))
+        shutil.copy(args.executable, os.path.join(temp, "executable"))
+        with open(os.path.join(temp, META_FILE), "w") as f:
+            json.dump({"version": CACHE_VERSION, "size": tree_size(temp), "created": time.time()}, f)
+        try:
+            os.rename(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)  # 其他进程已保存同一个键
+    evict(args.cache_dir, args.max_size * (1 << 20), keep=key)
+    print(f"[BUILD CACHE] stored {key}")
+    return True
+
+
+def evict(cache_dir, max_bytes, keep=None):
+    """总大小超过上限时按最近使用时间从旧到新删除条目，刚保存的条目保留"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        meta_path = os.path.join(cache_dir, name, META_FILE)
+        try:
+            with open(meta_path) as f:
+                size = json.load(f)["size"]
+            entries.append((os.path.getmtime(meta_path), size, name))
+        except (OSError, ValueError, KeyError):
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        total -= size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按内容哈希保存与恢复Verilator构建结果")
+    parser.add_argument("action", choices=("restore", "store"))
+    parser.add_argument("--cache-dir", required=True, help="缓存目录")
+    parser.add_argument("--obj-dir", required=True, help="Verilator的--Mdir目录")
+    parser.add_argument("--executable", required=True, help="可执行文件路径")
+    parser.add_argument("--flags", default="", help="Verilator、编译与链接选项")
+    parser.add_argument("--inputs", nargs="*", default=[], help="参与计算键的源文件与生成的文件")
+    parser.add_argument("--max-size", type=int, default=2048, help="缓存总大小上限（MB）")
+    args = parser.parse_args()
+
+    key = compute_key(args.inputs, args.flags)
+    os.makedirs(args.cache_dir, exist_ok=True)
+    try:
+        done = restore(args, key) if args.action == "restore" else store(args, key)
+        if done:
+            write_marker(args, key)
+    except OSError as e:
+        # 缓存只用于加速，出错时回退为正常构建；恢复了一半的obj_dir不能留给增量编译
+        print(f"[BUILD CACHE WARNING] {args.action} failed: {e}")
+        if args.action == "restore":
+            shutil.rmtree(args.obj_dir, ignore_errors=True)
+        done = False
+    sys.exit(0 if done or args.action == "store" else 1)
+
+
+if __name__ == "__main__":
+    main()
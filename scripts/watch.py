@@ -0,0 +1,188 @@
+"""
+监视模式：常驻进程轮询testbench CSV（或约束随机激励描述JSON）、同目录下的波形层次列表（*.scopes）、make.cfg、
+top.nxdclite、boards.json与顶层HDL文件，变化时在进程内重新生成输出
+
+与每次make都启动新的解释器相比，csv2c.py与gen_tool.py只导入一次，正则已编译，板卡引脚库索引与
+nxdclite中各端口引脚列表、@循环行的解析结果保留在内存中，只有内容变化的行需要重新解析。文件只是
+修改时间变化而内容相同时不做任何事。输出文件内容未变化时不改写，生成后更新make使用的时间戳文件，
+因此随后的make不会重复转换；给出--make时在每次更新后调用make。
+
+用法: python scripts/watch.py --csv testbench/testbench0.csv --config include/sim_config.h [--nxdclite pin/top.nxdclite]
+                             [--library 其他CSV ...] [--make [目标]] [--interval 秒]
+"""
+import os
+import sys
+import io
+import glob
+import time
+import hashlib
+import argparse
+import subprocess
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "testbench"))
+sys.path.insert(0, os.path.join(ROOT, "pin"))
+
+import csv2c
+import randstim
+import gen_tool
+
+
+class WatchedFile:
+    """按(大小, 修改时间)检测变化，变化时再比较内容哈希，只被touch的文件不算变化"""
+    __slots__ = ("path", "stat", "digest")
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self.digest = None
+
+    def changed(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        key = stat and (stat.st_size, stat.st_mtime_ns)
+        if key == self.stat:
+            return False
+        self.stat = key
+        digest = None
+        if stat:
+            with open(self.path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        if digest == self.digest:
+            return False
+        self.digest = digest
+        return True
+
+
+def touch(path):
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a"):
+            os.utime(path)
+
+
+def testbench_dependencies(args):
+    """与Makefile中TB_STAMP的依赖一致：make.cfg以及各testbench所在目录下的*.scopes，
+    另加上次转换时trace scope file指定的波形层次列表（可以不在这些目录中）"""
+    paths = [args.cfg] + ([args.scope_file] if args.scope_file else [])
+    for directory in sorted({os.path.dirname(os.path.abspath(path)) for path in [args.csv, *(args.library or [])]}):
+        paths += sorted(glob.glob(os.path.join(directory, "*.scopes")))
+    return paths
+
+
+def convert_testbench(args):
+    """在进程内运行csv2c（.json描述由randstim生成），成功返回True；转换输出只在出错时显示"""
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            if args.csv.endswith(".json"):
+                config, written = randstim.convert_spec(randstim.RandomSpec(args.csv), args.config, args.stimulus,
+                                                   args.binary, trace_path=args.trace_config)
+            elif args.library is not None:
+                config, written = csv2c.convert_library([args.csv, *args.library], args.config, args.stimulus,
+                                                   trace_path=args.trace_config)
+            else:
+                config, written = csv2c.convert_testbench(args.csv, args.config, args.stimulus, args.binary,
+                                                     trace_path=args.trace_config)
+    except (ValueError, FileNotFoundError) as e:
+        print(log.getvalue(), end="")
+        print(f"\033[31m[TB ERROR] {e}\033[0m")
+        return False
+    scope_file = config.get("TRACE_SCOPE_FILE", "").strip()
+    args.scope_file = scope_file and os.path.join(os.path.dirname(os.path.abspath(args.csv)), scope_file)
+    changed = [os.path.basename(path) for path, was_written in written.items() if was_written]
+    print(f"[TB] {os.path.basename(args.csv)}: " + (f"更新 {', '.join(changed)}" if changed else "输出未变化"))
+    touch(args.tb_stamp)
+    return True
+
+
+def convert_binding(args, memo):
+    """在进程内运行gen_tool，板卡引脚库未变化时复用上次的解析结果"""
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            converter = gen_tool.NXDCConverter(args.boards, args.board, hdl_paths=args.hdl, memo=memo)
+            converter.convert(args.nxdclite, args.nxdc, args.cpp)
+    except SystemExit:
+        # gen_tool在报告全部错误后以退出码1结束，常驻进程中只显示错误并继续监视
+        print(log.getvalue(), end="")
+        return False
+    for kind, message, _ in converter.warnings:
+        print(f"\033[33m[{kind}] {message}\033[0m")
+    print(f"[BIND] {os.path.basename(args.nxdclite)}: {len(converter.bindings)} 个端口")
+    touch(args.bind_stamp)
+    return True
+
+
+def run_make(target):
+    print(f"[MAKE] {target}")
+    result = subprocess.run(["make", "-C", ROOT, target])
+    if result.returncode != 0:
+        print(f"\033[31m[MAKE ERROR] make {target} 返回 {result.returncode}\033[0m")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="监视激励与引脚约束文件，变化时在常驻进程内重新生成")
+    parser.add_argument("--csv", help="testbench CSV或约束随机激励描述（.json）")
+    parser.add_argument("--config", default=os.path.join(ROOT, "include", "sim_config.h"), help="sim_config.h路径")
+    parser.add_argument("--stimulus", help="sim_stimulus.h路径，默认与sim_config.h同目录")
+    parser.add_argument("--trace-config", help="sim_trace.vlt路径，默认与sim_config.h同目录")
+    parser.add_argument("--binary", metavar="STIM_FILE", help="输出二进制激励文件")
+    parser.add_argument("--library", nargs="*", metavar="CSV", help="编译为激励库，后跟一起编译的其他testbench CSV")
+    parser.add_argument("--cfg", default=os.path.join(ROOT, "make.cfg"), help="make.cfg路径，变化时重新生成")
+    parser.add_argument("--tb-stamp", help="转换成功后更新的时间戳文件（Makefile的TB_STAMP）")
+    parser.add_argument("--nxdclite", help="引脚约束文件，给出时同时监视引脚绑定")
+    parser.add_argument("--nxdc", help="输出的.nxdc文件")
+    parser.add_argument("--cpp", help="输出的auto_bind.cpp")
+    parser.add_argument("--boards", default=os.path.join(ROOT, "pin", "boards.json"), help="板卡描述文件")
+    parser.add_argument("--board", help="板卡名，默认为描述文件中的default")
+    parser.add_argument("--hdl", nargs="+", default=[], metavar="FILE", help="包含顶层模块的HDL文件，用于端口检查")
+    parser.add_argument("--bind-stamp", help="生成成功后更新的时间戳文件（Makefile的BIND_STAMP）")
+    parser.add_argument("--make", nargs="?", const="all", metavar="TARGET", help="每次更新后运行make，默认目标all")
+    parser.add_argument("--interval", type=float, default=0.2, help="轮询间隔（秒）")
+    args = parser.parse_args()
+    if not args.csv and not args.nxdclite:
+        parser.error("至少需要--csv或--nxdclite之一")
+    if args.library is not None and (not args.csv or args.binary):
+        parser.error("--library需要--csv，且不能与--binary同时使用")
+    if args.library is not None and args.csv.endswith(".json"):
+        parser.error("--library只接受testbench CSV，约束随机激励描述不能编译进激励库")
+    args.scope_file = None
+    args.stimulus = args.stimulus or os.path.join(os.path.dirname(args.config), "sim_stimulus.h")
+
+    testbench_files = [WatchedFile(path) for path in [args.csv, *(args.library or [])]] if args.csv else []
+    # 层次列表文件可能在监视期间新建，每次轮询重新查找；删除的文件保留在表中，删除本身也算变化
+    dependency_files = {}
+    board_file = WatchedFile(args.boards)
+    binding_files = [WatchedFile(path) for path in [args.nxdclite, *args.hdl]] if args.nxdclite else []
+    memo = {}
+
+    print(f"监视 {', '.join(os.path.relpath(f.path) for f in testbench_files + binding_files)}，Ctrl-C 退出")
+    try:
+        while True:
+            updated = False
+            if testbench_files:
+                for path in testbench_dependencies(args):
+                    if path not in dependency_files:
+                        dependency_files[path] = WatchedFile(path)
+            if any([f.changed() for f in testbench_files + list(dependency_files.values())]):
+                updated |= convert_testbench(args)
+            if binding_files:
+                # 引脚列表的解析结果依赖板卡引脚库，描述文件变化时丢弃
+                board_changed = board_file.changed()
+                if board_changed:
+                    memo = {}
+                if any([f.changed() for f in binding_files]) or board_changed:
+                    updated |= convert_binding(args, memo)
+            if updated and args.make:
+                run_make(args.make)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print()
+
+
+if __name__ == "__main__":
+    main()
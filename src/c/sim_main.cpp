@@ -1,8 +1,11 @@
 #include "top_module_name.h"
 #include "verilated.h"
-#include "verilated_fst_c.h"
 #include "sim_main.h"
+#if ENABLE_TRACE == 1
+#include "verilated_fst_c.h"
+#endif
 #include "sim_config.h"
+#include "sim_stimulus.h"
 #include <stdarg.h>
 #ifdef NVBOARD
 #include <nvboard.h>
@@ -10,21 +13,981 @@
 #include <cstdio>
 #include <cstdlib>
 #include <csignal>
+#include <cerrno>
+#include <cstring>
+#include <vector>
+#include <algorithm>
+#if ENABLE_BINARY_STIMULUS == 1 || ENABLE_CHECKPOINT == 1
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+#if ENABLE_CHECKPOINT == 1
+#include "verilated_save.h"
+#endif
 #ifdef NVBOARD
 void nvboard_bind_all_pins(Vtop *top);
 #endif 
 VerilatedContext *contextp = new VerilatedContext;
 Vtop *top = new Vtop(contextp);
+#if ENABLE_TRACE == 1
 VerilatedFstC *tfp = new VerilatedFstC;
+#endif
 vluint64_t T = 0;
 vluint64_t clk = 0;
 
+std::string plusarg_or(const char *prefix, const char *fallback)
+{
+    // commandArgsPlusMatch返回完整的"+prefix..."参数，未匹配时返回空串
+    const char *match = contextp->commandArgsPlusMatch(prefix);
+    if (match[0] == '\0')
+        return fallback;
+    return std::string(match + 1 + strlen(prefix));
+}
+
+bool wave_enabled = ENABLE_WAVEFROM_ACQUISITION;
+static std::string wave_file = WAVEFILE;
+static std::string report_file;
+static std::chrono::steady_clock::time_point wall_start;
+
+void wave_init()
+{
+    wave_file = plusarg_or("wave=", WAVEFILE);
+    wave_enabled = ENABLE_TRACE && plusarg_or("wave-dump=", ENABLE_WAVEFROM_ACQUISITION ? "1" : "0") != "0";
+}
+
+const char *wave_path()
+{
+    return wave_file.c_str();
+}
+
+#ifndef VERILATOR_TRACE_WINDOWS
+#define VERILATOR_TRACE_WINDOWS(X)
+#endif
+#ifndef VERILATOR_TRACE_SCOPES
+#define VERILATOR_TRACE_SCOPES(X)
+#endif
+
+struct TraceWindow
+{
+    uint64_t start;
+    uint64_t stop;
+};
+
+#define TRACE_WINDOW_ENTRY(start, stop) {start, stop},
+#if ENABLE_TRACE == 1
+#define TRACE_SCOPE_DUMPVARS(scope) tfp->dumpvars(TRACE_DEPTH, scope);
+#else
+#define TRACE_SCOPE_DUMPVARS(scope)
+#endif
+
+static const TraceWindow trace_windows[] = {VERILATOR_TRACE_WINDOWS(TRACE_WINDOW_ENTRY){0, 0}};
+
+// 波形采集状态：当前窗口游标与触发条件满足后的记录截止时刻
+static struct
+{
+    const TraceWindow *window;
+    const TraceWindow *end;
+    bool always;
+    uint64_t trigger_until;
+    bool opened;
+} trace = {trace_windows, trace_windows + sizeof(trace_windows) / sizeof(TraceWindow) - 1, false, 0, false};
+
+void trace_init()
+{
+    // 没有配置窗口与触发条件时全程记录
+#ifdef TRACE_TRIGGER_CONDITION
+    trace.always = false;
+#else
+    trace.always = trace.window == trace.end;
+#endif
+    if (wave_enabled)
+    {
+        VERILATOR_TRACE_SCOPES(TRACE_SCOPE_DUMPVARS)
+    }
+}
+
+bool trace_should_dump(uint64_t t)
+{
+    if (!wave_enabled)
+        return false;
+    bool on = trace.always;
+    while (trace.window < trace.end && trace.window->stop <= t)
+        trace.window++;
+    if (trace.window < trace.end && trace.window->start <= t)
+        on = true;
+#ifdef TRACE_TRIGGER_CONDITION
+    if (TRACE_TRIGGER_CONDITION)
+        trace.trigger_until = TRACE_TRIGGER_DURATION ? t + TRACE_TRIGGER_DURATION : UINT64_MAX;
+    if (t < trace.trigger_until)
+        on = true;
+#endif
+#if ENABLE_TRACE == 1
+    if (on && !tfp->isOpen())
+    {
+        tfp->open(wave_path());
+        trace.opened = true;
+    }
+#endif
+    return on;
+}
+
+void report_init()
+{
+    // 退出阶段不再解析命令行参数，路径在初始化时取出
+    report_file = plusarg_or("report=", "");
+    wall_start = std::chrono::steady_clock::now();
+}
+
+void report_write()
+{
+    if (report_file.empty())
+        return;
+    FILE *f = fopen(report_file.c_str(), "w");
+    if (!f)
+    {
+        fprintf(stderr, "[REPORT ERROR] %s: %s\n", report_file.c_str(), strerror(errno));
+        return;
+    }
+    double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - wall_start).count();
+    fprintf(f, "{");
+#if ENABLE_TESTBENCH_LIBRARY == 1
+    fprintf(f, "\"testbench\": \"%s\", ", testbench->name);
+#endif
+    fprintf(f, "\"ticks\": %llu, \"cycles\": %llu, \"seconds\": %.6f, \"finished\": %s, \"quiescent\": %s, "
+               "\"expect_total\": %llu, \"expect_failed\": %llu}\n",
+            (unsigned long long)T, (unsigned long long)(T / (2 * HALF_CLK_CYCLE)), seconds,
+            contextp->gotFinish() ? "true" : "false", quiescent ? "true" : "false",
+            (unsigned long long)expect_total(), (unsigned long long)expect_failed());
+    fclose(f);
+}
+
+#if ENABLE_PROFILING == 1
+uint64_t profile_ns[PROFILE_PHASE_COUNT];
+uint64_t profile_calls[PROFILE_PHASE_COUNT];
+static const char *profile_phase_names[PROFILE_PHASE_COUNT] = {
+    "stim", "eval", "dump", "expect", "nvboard_update", "nvboard_wait"};
+static std::string profile_file;
+static uint64_t profile_start_ns;
+
+void profile_init()
+{
+    profile_file = plusarg_or("profile=", PROFILEFILE);
+    profile_start_ns = profile_now();
+}
+
+void profile_write()
+{
+    // 在波形文件关闭之后调用，此时文件大小即为本次运行写出的波形字节数
+    uint64_t seconds_ns = profile_now() - profile_start_ns;
+    long long trace_bytes = 0;
+    if (trace.opened)
+    {
+        FILE *wave = fopen(wave_path(), "rb");
+        if (wave)
+        {
+            fseek(wave, 0, SEEK_END);
+            trace_bytes = ftell(wave);
+            fclose(wave);
+        }
+    }
+    FILE *f = fopen(profile_file.c_str(), "w");
+    if (!f)
+    {
+        fprintf(stderr, "[PROFILE ERROR] %s: %s\n", profile_file.c_str(), strerror(errno));
+        return;
+    }
+    fprintf(f, "{\"version\": 1, \"ticks\": %llu, \"seconds\": %.9f, \"trace_bytes\": %lld, \"phases\": {",
+            (unsigned long long)T, seconds_ns / 1e9, trace_bytes);
+    for (int i = 0; i < PROFILE_PHASE_COUNT; i++)
+        fprintf(f, "%s\"%s\": {\"calls\": %llu, \"seconds\": %.9f}", i ? ", " : "", profile_phase_names[i],
+                (unsigned long long)profile_calls[i], profile_ns[i] / 1e9);
+    fprintf(f, "}}\n");
+    fclose(f);
+}
+#endif
+
+#ifndef VERILATOR_STIM_PINS
+#define VERILATOR_STIM_PINS(X)
+#endif
+#ifndef VERILATOR_INITIAL_GENERATORS
+#define VERILATOR_INITIAL_GENERATORS(X)
+#endif
+#ifndef VERILATOR_FOREVER_GENERATORS
+#define VERILATOR_FOREVER_GENERATORS(X)
+#endif
+#ifndef VERILATOR_STIM_GENERATOR_VALUES
+#define VERILATOR_STIM_GENERATOR_VALUES
+#endif
+#ifndef VERILATOR_EXPECT_SIGNALS
+#define VERILATOR_EXPECT_SIGNALS(X)
+#endif
+#ifndef VERILATOR_EXPECTS
+#define VERILATOR_EXPECTS(X)
+#endif
+#ifndef CHECKPOINT_KEY
+#define CHECKPOINT_KEY 0
+#endif
+#ifndef QUIESCENCE_START
+#define QUIESCENCE_START UINT64_MAX
+#endif
+#ifndef VERILATOR_QUIESCENCE_SIGNALS
+#define VERILATOR_QUIESCENCE_SIGNALS(X) VERILATOR_EXPECT_SIGNALS(X)
+#endif
+
+#if ENABLE_CHECKPOINT == 1
+// INITIAL块的标识，二进制激励模式下由激励文件提供
+static uint64_t checkpoint_key = CHECKPOINT_KEY;
+#endif
+
+#define STIM_PIN_ENUM(pin) STIM_PIN_##pin,
+#define STIM_PIN_NAME(pin) #pin,
+#define STIM_PIN_CASE(pin)     \
+    case STIM_PIN_##pin:       \
+        top->pin = value;      \
+        break;
+#define STIM_GEN_ENTRY(pin, kind, start, period, count, a, b) {start, period, count, a, b, STIM_PIN_##pin, kind},
+#define EXPECT_SIGNAL_ENUM(signal) EXPECT_SIGNAL_##signal,
+#define EXPECT_SIGNAL_NAME(signal) #signal,
+#define EXPECT_SIGNAL_CASE(signal) \
+    case EXPECT_SIGNAL_##signal:   \
+        return top->signal;
+#define EXPECT_ENTRY(time, signal, value, mask, line) {time, value, mask, EXPECT_SIGNAL_##signal, line},
+#define QUIESCE_SIGNAL_ENUM(signal) QUIESCE_SIGNAL_##signal,
+#define QUIESCE_SIGNAL_SAMPLE(signal) changed |= quiescence_sample(QUIESCE_SIGNAL_##signal, top->signal);
+
+enum StimPin
+{
+    VERILATOR_STIM_PINS(STIM_PIN_ENUM)
+    STIM_PIN_COUNT
+};
+
+enum ExpectSignal
+{
+    VERILATOR_EXPECT_SIGNALS(EXPECT_SIGNAL_ENUM)
+    EXPECT_SIGNAL_COUNT
+};
+
+enum QuiesceSignal
+{
+    VERILATOR_QUIESCENCE_SIGNALS(QUIESCE_SIGNAL_ENUM)
+    QUIESCE_SIGNAL_COUNT
+};
+
+static const char *const expect_signal_names[] = {VERILATOR_EXPECT_SIGNALS(EXPECT_SIGNAL_NAME) nullptr};
+#if ENABLE_BINARY_STIMULUS == 1
+static const char *const stim_pin_names[] = {VERILATOR_STIM_PINS(STIM_PIN_NAME) nullptr};
+#endif
+
+// 编译进来的生成器表，末尾的空项仅用于避免空数组
+static const StimGenerator stim_initial_generators[] = {VERILATOR_INITIAL_GENERATORS(STIM_GEN_ENTRY){}};
+static const StimGenerator stim_forever_generators[] = {VERILATOR_FOREVER_GENERATORS(STIM_GEN_ENTRY){}};
+static const uint64_t stim_generator_values[] = {VERILATOR_STIM_GENERATOR_VALUES 0};
+static const StimExpect expect_table[] = {VERILATOR_EXPECTS(EXPECT_ENTRY){}};
+
+struct StimActiveGenerator
+{
+    const StimGenerator *def;
+    uint64_t next;
+    uint64_t k;
+    uint64_t state;
+    uint32_t pin;
+};
+
+// 激励引擎状态：二进制激励记录的游标与当前块内活动的生成器
+static struct
+{
+    void *map;
+    size_t size;
+    uint32_t *pin_map;
+    const StimRecord *sections[2];
+    const StimRecord *sections_end[2];
+    const StimRecord *cursor;
+    const StimRecord *end;
+    uint64_t base;
+    const StimGenerator *generators[2];
+    uint64_t generator_counts[2];
+    const uint64_t *generator_values;
+    std::vector<StimActiveGenerator> active;
+    uint64_t generator_next;
+} stim = {
+    nullptr, 0, nullptr, {}, {}, nullptr, nullptr, 0,
+    {stim_initial_generators, stim_forever_generators},
+    {sizeof(stim_initial_generators) / sizeof(StimGenerator) - 1,
+     sizeof(stim_forever_generators) / sizeof(StimGenerator) - 1},
+    stim_generator_values, {}, UINT64_MAX};
+
+static void stim_set_pin(uint32_t pin, uint64_t value)
+{
+    switch (pin)
+    {
+        VERILATOR_STIM_PINS(STIM_PIN_CASE)
+    default:
+        break;
+    }
+}
+
+// 期望值检查状态：按时间排序的期望表及其游标
+static struct
+{
+    const StimExpect *cursor;
+    const StimExpect *end;
+    uint32_t *signal_map;
+    uint64_t total;
+    uint64_t failed;
+} expect = {expect_table, expect_table + sizeof(expect_table) / sizeof(StimExpect) - 1, nullptr,
+            sizeof(expect_table) / sizeof(StimExpect) - 1, 0};
+
+// 每次检查最多打印的不匹配条数，其余只计数
+#define EXPECT_REPORT_LIMIT 100
+
+static uint64_t expect_get(uint32_t signal)
+{
+    switch (signal)
+    {
+        VERILATOR_EXPECT_SIGNALS(EXPECT_SIGNAL_CASE)
+    default:
+        return 0;
+    }
+}
+
+uint64_t expect_total()
+{
+    return expect.total;
+}
+
+uint64_t expect_failed()
+{
+    return expect.failed;
+}
+
+// 静止检测状态：起点（最后一次激励或期望的时刻）之前每次求值都记录观察信号的值，
+// 之后连续quiescence_limit个时间单位没有变化时结束仿真；二进制激励模式下起点由激励文件计算
+bool quiescent = false;
+uint64_t quiescence_limit = 0;
+static struct
+{
+    uint64_t start;
+    uint64_t last_change;
+    uint64_t values[QUIESCE_SIGNAL_COUNT + 1];
+} quiesce = {QUIESCENCE_START, 0, {}};
+
+static inline bool quiescence_sample(uint32_t signal, uint64_t value)
+{
+    bool changed = quiesce.values[signal] != value;
+    quiesce.values[signal] = value;
+    return changed;
+}
+
+void quiescence_init()
+{
+    uint64_t cycles = strtoull(plusarg_or("quiesce=", std::to_string(QUIESCENCE_CYCLES).c_str()).c_str(), nullptr, 10);
+#ifdef NVBOARD
+    // 输入来自界面，随时可能变化
+    cycles = 0;
+#endif
+    if (cycles == 0)
+        return;
+    if (QUIESCE_SIGNAL_COUNT == 0)
+    {
+        fprintf(stderr, "[QUIESCENCE WARNING] no signals to watch, set quiescence signals or add EXPECT rows\n");
+        return;
+    }
+    if (quiesce.start == UINT64_MAX)
+    {
+        fprintf(stderr, "[QUIESCENCE WARNING] the FOREVER block keeps driving inputs, quiescence detection is disabled\n");
+        return;
+    }
+    quiescence_limit = cycles * (ENABLE_CLK_INPUT ? 2 * HALF_CLK_CYCLE : 1);
+}
+
+void quiescence_check(uint64_t t)
+{
+    bool changed = false;
+    VERILATOR_QUIESCENCE_SIGNALS(QUIESCE_SIGNAL_SAMPLE)
+    if (changed || t <= quiesce.start)
+    {
+        quiesce.last_change = t;
+        return;
+    }
+    uint64_t since = quiesce.last_change > quiesce.start ? quiesce.last_change : quiesce.start;
+    if (t - since >= quiescence_limit)
+    {
+        quiescent = true;
+        fprintf(stderr, "[QUIESCENCE] outputs unchanged since T=%llu, stopping at T=%llu\n",
+                (unsigned long long)since, (unsigned long long)t);
+    }
+}
+
+// 快进模式下不跳过静止检测到期的时刻
+static uint64_t quiescence_deadline()
+{
+    if (!quiescence_limit || quiescent)
+        return UINT64_MAX;
+    return (quiesce.last_change > quiesce.start ? quiesce.last_change : quiesce.start) + quiescence_limit;
+}
+
+#if ENABLE_BINARY_STIMULUS == 1
+static void stim_fail(const char *path, const char *reason)
+{
+    fprintf(stderr, "[STIM ERROR] %s: %s\n", path, reason);
+    exit(1);
+}
+
+// 读取名字表中的一项：4字节长度后接名字，超出end时报告文件被截断
+static std::string stim_read_name(const char *path, const char *&p, const char *end)
+{
+    uint32_t len;
+    if ((size_t)(end - p) < sizeof(len))
+        stim_fail(path, "truncated stimulus file");
+    memcpy(&len, p, sizeof(len));
+    p += sizeof(len);
+    if (len > (size_t)(end - p))
+        stim_fail(path, "truncated stimulus file");
+    std::string name(p, len);
+    p += len;
+    return name;
+}
+
+// 生成器在长度为block_end的块内最后一次赋值的相对时间，块内没有赋值时返回0
+static uint64_t stim_generator_last_time(const StimGenerator *gen, uint64_t block_end)
+{
+    if (gen->start >= block_end)
+        return 0;
+    uint64_t fires = (block_end - 1 - gen->start) / gen->period;
+    if (gen->count && gen->count - 1 < fires)
+        fires = gen->count - 1;
+    return gen->start + fires * gen->period;
+}
+
+void stim_open(const char *path)
+{
+    int fd = open(path, O_RDONLY);
+    if (fd < 0)
+        stim_fail(path, strerror(errno));
+    struct stat st;
+    if (fstat(fd, &st) != 0 || (size_t)st.st_size < sizeof(StimHeader))
+        stim_fail(path, "file too small");
+    stim.size = st.st_size;
+    stim.map = mmap(nullptr, stim.size, PROT_READ, MAP_PRIVATE, fd, 0);
+    ::close(fd);
+    if (stim.map == MAP_FAILED)
+        stim_fail(path, strerror(errno));
+
+    const char *base = (const char *)stim.map;
+    const StimHeader *header = (const StimHeader *)base;
+    if (memcmp(header->magic, STIM_MAGIC, sizeof(header->magic)) != 0)
+        stim_fail(path, "bad magic, not a stimulus file");
+    if (header->version != STIM_VERSION)
+        stim_fail(path, "unsupported stimulus file version, regenerate it with csv2c.py");
+    uint64_t count = header->initial_count + header->forever_count;
+    uint64_t generator_count = header->initial_generator_count + header->forever_generator_count;
+    if (header->records_offset < sizeof(StimHeader) || header->records_offset > stim.size ||
+        count > (stim.size - header->records_offset) / sizeof(StimRecord) ||
+        header->generators_offset > stim.size ||
+        generator_count > (stim.size - header->generators_offset) / sizeof(StimGenerator) ||
+        header->values_offset > stim.size ||
+        header->values_count > (stim.size - header->values_offset) / sizeof(uint64_t) ||
+        header->expects_offset > stim.size ||
+        header->expect_count > (stim.size - header->expects_offset) / sizeof(StimExpect))
+        stim_fail(path, "truncated stimulus file");
+
+    // 将文件中的引脚名表映射到编译进来的引脚，名字表位于文件头与事件记录之间
+    stim.pin_map = new uint32_t[header->pin_count];
+    const char *p = base + sizeof(StimHeader);
+    const char *names_end = base + header->records_offset;
+    for (uint32_t i = 0; i < header->pin_count; i++)
+    {
+        std::string name = stim_read_name(path, p, names_end);
+        uint32_t id = 0;
+        while (id < STIM_PIN_COUNT && name != stim_pin_names[id])
+            id++;
+        if (id == STIM_PIN_COUNT)
+        {
+            fprintf(stderr, "[STIM ERROR] %s: pin '%s' is not compiled into the simulator, rerun make tb\n",
+                    path, name.c_str());
+            exit(1);
+        }
+        stim.pin_map[i] = id;
+    }
+
+    // 期望信号名表紧跟在引脚名表之后
+    expect.signal_map = new uint32_t[header->expect_signal_count];
+    for (uint32_t i = 0; i < header->expect_signal_count; i++)
+    {
+        std::string name = stim_read_name(path, p, names_end);
+        uint32_t id = 0;
+        while (id < EXPECT_SIGNAL_COUNT && name != expect_signal_names[id])
+            id++;
+        if (id == EXPECT_SIGNAL_COUNT)
+        {
+            fprintf(stderr, "[STIM ERROR] %s: expected signal '%s' is not compiled into the simulator, rerun make tb\n",
+                    path, name.c_str());
+            exit(1);
+        }
+        expect.signal_map[i] = id;
+    }
+
+    const StimRecord *records = (const StimRecord *)(base + header->records_offset);
+    stim.sections[STIM_SECTION_INITIAL] = records;
+    stim.sections_end[STIM_SECTION_INITIAL] = records + header->initial_count;
+    stim.sections[STIM_SECTION_FOREVER] = records + header->initial_count;
+    stim.sections_end[STIM_SECTION_FOREVER] = records + count;
+    stim.cursor = stim.end = records;
+
+    // 周期为0会使生成器永远停在同一时刻，repeat的取值范围必须落在值表内
+    const StimGenerator *generators = (const StimGenerator *)(base + header->generators_offset);
+    for (uint64_t i = 0; i < generator_count; i++)
+    {
+        const StimGenerator &gen = generators[i];
+        if (gen.period == 0)
+            stim_fail(path, "generator with a zero period");
+        if (gen.pin >= header->pin_count || gen.kind > STIM_GEN_REPEAT)
+            stim_fail(path, "corrupted generator table");
+        if (gen.kind == STIM_GEN_REPEAT &&
+            (gen.b == 0 || gen.a > header->values_count || gen.b > header->values_count - gen.a))
+            stim_fail(path, "generator values out of range");
+    }
+    stim.generators[STIM_SECTION_INITIAL] = generators;
+    stim.generator_counts[STIM_SECTION_INITIAL] = header->initial_generator_count;
+    stim.generators[STIM_SECTION_FOREVER] = generators + header->initial_generator_count;
+    stim.generator_counts[STIM_SECTION_FOREVER] = header->forever_generator_count;
+    stim.generator_values = (const uint64_t *)(base + header->values_offset);
+
+    expect.cursor = (const StimExpect *)(base + header->expects_offset);
+    expect.end = expect.cursor + header->expect_count;
+    expect.total = header->expect_count;
+#if ENABLE_CHECKPOINT == 1
+    checkpoint_key = header->checkpoint_key;
+#endif
+
+    // 静止检测的起点：INITIAL块最后一次激励与最后一个期望中较晚的一个，FOREVER块中有激励时不检测
+    if (ENABLE_FOREVER_BLOCK && (header->forever_count || header->forever_generator_count))
+    {
+        quiesce.start = UINT64_MAX;
+        return;
+    }
+    uint64_t last = header->expect_count ? expect.end[-1].time : 0;
+    if (ENABLE_INITIAL_BLOCK)
+    {
+        if (header->initial_count)
+            last = std::max(last, stim.sections_end[STIM_SECTION_INITIAL][-1].time);
+        for (uint64_t i = 0; i < header->initial_generator_count; i++)
+            last = std::max(last, stim_generator_last_time(&generators[i], INITIAL_BLOCK_MAX_STIMULATE_TIME));
+    }
+    quiesce.start = last;
+}
+
+void stim_close()
+{
+    if (stim.map)
+        munmap(stim.map, stim.size);
+    delete[] stim.pin_map;
+    delete[] expect.signal_map;
+    stim.map = nullptr;
+    stim.pin_map = nullptr;
+    expect.signal_map = nullptr;
+    expect.cursor = expect.end = nullptr;
+    stim.generator_counts[STIM_SECTION_INITIAL] = stim.generator_counts[STIM_SECTION_FOREVER] = 0;
+}
+#endif
+
+void stim_begin(int section, uint64_t base)
+{
+#if ENABLE_BINARY_STIMULUS == 1
+    stim.cursor = stim.sections[section];
+    stim.end = stim.sections_end[section];
+#endif
+    stim.base = base;
+
+    // 生成器的时间同样相对于块起点，每次进入块时重新开始
+    stim.active.clear();
+    stim.generator_next = UINT64_MAX;
+    for (uint64_t i = 0; i < stim.generator_counts[section]; i++)
+    {
+        const StimGenerator *def = &stim.generators[section][i];
+        StimActiveGenerator gen = {def, base + def->start, 0, def->a, def->pin};
+        if (stim.pin_map)
+            gen.pin = stim.pin_map[def->pin];
+        stim.active.push_back(gen);
+        stim.generator_next = gen.next < stim.generator_next ? gen.next : stim.generator_next;
+    }
+}
+
+static uint64_t stim_generator_value(StimActiveGenerator &gen)
+{
+    const StimGenerator *def = gen.def;
+    switch (def->kind)
+    {
+    case STIM_GEN_RANDOM:
+        // xorshift64，种子不能为0
+        gen.state ^= gen.state << 13;
+        gen.state ^= gen.state >> 7;
+        gen.state ^= gen.state << 17;
+        return gen.state;
+    case STIM_GEN_REPEAT:
+        return stim.generator_values[def->a + gen.k % def->b];
+    default:
+        return def->a + gen.k * def->b;
+    }
+}
+
+static void stim_apply_generators(uint64_t t)
+{
+    uint64_t next = UINT64_MAX;
+    for (StimActiveGenerator &gen : stim.active)
+    {
+        while (gen.next <= t)
+        {
+            stim_set_pin(gen.pin, stim_generator_value(gen));
+            gen.k++;
+            if (gen.def->count && gen.k >= gen.def->count)
+                gen.next = UINT64_MAX;
+            else
+                gen.next += gen.def->period;
+        }
+        next = gen.next < next ? gen.next : next;
+    }
+    stim.generator_next = next;
+}
+
+void stim_apply(uint64_t t)
+{
+#if ENABLE_BINARY_STIMULUS == 1
+    while (stim.cursor < stim.end && stim.base + stim.cursor->time <= t)
+    {
+        stim_set_pin(stim.pin_map[stim.cursor->pin], stim.cursor->value);
+        stim.cursor++;
+    }
+#endif
+    if (t >= stim.generator_next)
+        stim_apply_generators(t);
+}
+
+uint64_t stim_next_time()
+{
+    uint64_t next = stim.generator_next;
+#if ENABLE_BINARY_STIMULUS == 1
+    if (stim.cursor < stim.end && stim.base + stim.cursor->time < next)
+        next = stim.base + stim.cursor->time;
+#endif
+    return next;
+}
+
+void expect_check(uint64_t t)
+{
+    while (expect.cursor < expect.end && expect.cursor->time <= t)
+    {
+        const StimExpect *e = expect.cursor++;
+        uint32_t signal = expect.signal_map ? expect.signal_map[e->signal] : e->signal;
+        uint64_t actual = expect_get(signal);
+        if (((actual & e->mask) == e->value) && e->time == t)
+            continue;
+        if (++expect.failed <= EXPECT_REPORT_LIMIT)
+        {
+            if (e->time != t)
+                fprintf(stderr, "[EXPECT MISMATCH] T=%llu %s: expectation was skipped (csv line %u)\n",
+                        (unsigned long long)e->time, expect_signal_names[signal], e->line);
+            else
+                fprintf(stderr, "[EXPECT MISMATCH] T=%llu %s: expected 0x%llx mask 0x%llx, got 0x%llx (csv line %u)\n",
+                        (unsigned long long)t, expect_signal_names[signal], (unsigned long long)e->value,
+                        (unsigned long long)e->mask, (unsigned long long)actual, e->line);
+        }
+    }
+}
+
+uint64_t expect_next_time()
+{
+    return expect.cursor < expect.end ? expect.cursor->time : UINT64_MAX;
+}
+
+uint64_t expect_finish()
+{
+    // 仿真提前结束时尚未到达的期望同样计为失败
+    uint64_t unchecked = expect.end - expect.cursor;
+    expect.failed += unchecked;
+    expect.cursor = expect.end;
+    if (expect.total == 0)
+        return 0;
+    if (expect.failed - unchecked > EXPECT_REPORT_LIMIT)
+        fprintf(stderr, "[EXPECT] %llu more mismatches not shown\n",
+                (unsigned long long)(expect.failed - unchecked - EXPECT_REPORT_LIMIT));
+    if (unchecked)
+        fprintf(stderr, "[EXPECT] %llu expectations were never reached before the simulation ended\n",
+                (unsigned long long)unchecked);
+    fprintf(stderr, "[EXPECT] %llu/%llu passed\n",
+            (unsigned long long)(expect.total - expect.failed), (unsigned long long)expect.total);
+    return expect.failed;
+}
+
+#if ENABLE_CHECKPOINT == 1
+// 检查点文件：魔数、INITIAL块标识、模型标识、T、clk、仿真时间，之后是Verilator序列化的模型状态；
+// 模型标识由Makefile根据HDL源文件与Verilator选项计算，重新构建了不同的模型时不会恢复旧的状态
+#define CHECKPOINT_MAGIC 0x32305450434b564dULL
+
+static void expect_skip_until(uint64_t t)
+{
+    // 从检查点恢复时INITIAL块内的期望没有执行，不计入总数
+    while (expect.cursor < expect.end && expect.cursor->time < t)
+    {
+        expect.cursor++;
+        expect.total--;
+    }
+}
+
+static std::string checkpoint_path()
+{
+    char name[32];
+    snprintf(name, sizeof(name), "/%016llx.ckpt", (unsigned long long)checkpoint_key);
+    return plusarg_or("checkpoint-file=", (std::string(CHECKPOINTDIR) + name).c_str());
+}
+
+bool checkpoint_restore()
+{
+    std::string mode = plusarg_or("checkpoint=", CHECKPOINT_MODE);
+    if (mode != "restore" && mode != "auto")
+        return false;
+    std::string path = checkpoint_path();
+    if (access(path.c_str(), R_OK) != 0)
+    {
+        if (mode == "auto")
+            return false;
+        fprintf(stderr, "[CHECKPOINT ERROR] %s: %s\n", path.c_str(), strerror(errno));
+        exit(1);
+    }
+
+    VerilatedRestore os;
+    os.open(path.c_str());
+    uint64_t magic, key, model_key, time;
+    os >> magic >> key >> model_key;
+    if (magic != CHECKPOINT_MAGIC || key != checkpoint_key || model_key != CHECKPOINT_MODEL_KEY)
+    {
+        os.close();
+        const char *what = magic == CHECKPOINT_MAGIC && key == checkpoint_key ? "the compiled model" : "the INITIAL block";
+        if (mode == "auto")
+        {
+            fprintf(stderr, "[CHECKPOINT] %s does not match %s, replaying the INITIAL block\n", path.c_str(), what);
+            return false;
+        }
+        fprintf(stderr, "[CHECKPOINT ERROR] %s does not match %s, rerun with +checkpoint=save\n", path.c_str(), what);
+        exit(1);
+    }
+    os >> T >> clk >> time;
+    os >> *top;
+    os.close();
+    contextp->time(time);
+    expect_skip_until(T);
+    fprintf(stderr, "[CHECKPOINT] restored T=%llu from %s\n", (unsigned long long)T, path.c_str());
+    return true;
+}
+
+void checkpoint_save()
+{
+    std::string mode = plusarg_or("checkpoint=", CHECKPOINT_MODE);
+    if (mode != "save" && mode != "auto")
+        return;
+    std::string path = checkpoint_path();
+    if (!plusarg_or("checkpoint-file=", "")[0])
+        mkdir(CHECKPOINTDIR, 0755);
+
+    // 先写临时文件再改名，并发运行的用例不会读到写了一半的检查点
+    std::string temp = path + ".tmp." + std::to_string(getpid());
+    VerilatedSave os;
+    os.open(temp.c_str());
+    uint64_t magic = CHECKPOINT_MAGIC, key = checkpoint_key, model_key = CHECKPOINT_MODEL_KEY, time = contextp->time();
+    os << magic << key << model_key << T << clk << time;
+    os << *top;
+    os.close();
+    if (rename(temp.c_str(), path.c_str()) != 0)
+    {
+        fprintf(stderr, "[CHECKPOINT ERROR] %s: %s\n", path.c_str(), strerror(errno));
+        std::remove(temp.c_str());
+    }
+}
+#endif
+
+#ifdef NVBOARD
+static struct
+{
+    uint64_t frequency; // 目标频率，0表示不限速
+    uint64_t fps;
+    uint64_t check_interval;
+    uint64_t countdown;
+    uint64_t t0;
+    uint64_t frames;
+    bool started;
+    std::chrono::steady_clock::duration frame;
+    std::chrono::steady_clock::time_point start;
+    std::chrono::steady_clock::time_point next_frame;
+} pace;
+
+void nvboard_pace_init()
+{
+    // 未设置NVBOARD_SIM_FREQUENCY时沿用DELAY_WHILE_RUNNING_NVBOARD（每个时间单位的毫秒数）换算出的频率
+    uint64_t frequency = NVBOARD_SIM_FREQUENCY ? NVBOARD_SIM_FREQUENCY
+                         : DELAY_WHILE_RUNNING_NVBOARD > 0 ? 1000 / DELAY_WHILE_RUNNING_NVBOARD : 0;
+    pace.frequency = strtoull(plusarg_or("nvboard-freq=", std::to_string(frequency).c_str()).c_str(), nullptr, 10);
+    pace.fps = strtoull(plusarg_or("nvboard-fps=", std::to_string(NVBOARD_FRAME_RATE).c_str()).c_str(), nullptr, 10);
+    if (pace.fps == 0)
+        pace.fps = NVBOARD_FRAME_RATE;
+    pace.frame = std::chrono::duration_cast<std::chrono::steady_clock::duration>(std::chrono::duration<double>(1.0 / pace.fps));
+    // 读取时钟有开销，限速时每帧检查约8次，不限速时每256个时间单位检查一次
+    pace.check_interval = pace.frequency ? std::max<uint64_t>(1, pace.frequency / (pace.fps * 8)) : 256;
+}
+
+static void nvboard_frame(std::chrono::steady_clock::time_point now)
+{
+    PROFILE(PROFILE_NVBOARD_UPDATE, NVBOARD_UPDATE);
+    pace.frames++;
+    pace.next_frame += pace.frame;
+    if (pace.next_frame < now)
+        pace.next_frame = now + pace.frame; // 落后时不补帧
+}
+
+void nvboard_pace(uint64_t t)
+{
+    if (pace.countdown--)
+        return;
+    pace.countdown = pace.check_interval - 1;
+    auto now = std::chrono::steady_clock::now();
+    if (!pace.started)
+    {
+        pace.started = true;
+        pace.start = now;
+        pace.next_frame = now;
+        pace.t0 = t;
+    }
+    if (pace.frequency)
+    {
+        // 领先目标时休眠到应到达的时刻，休眠期间仍按帧率刷新界面
+        auto due = pace.start + std::chrono::duration_cast<std::chrono::steady_clock::duration>(
+                                    std::chrono::duration<double>((double)(t - pace.t0) / pace.frequency));
+        while (now < due)
+        {
+            PROFILE(PROFILE_NVBOARD_WAIT, std::this_thread::sleep_until(std::min(due, pace.next_frame)));
+            now = std::chrono::steady_clock::now();
+            if (now >= pace.next_frame)
+                nvboard_frame(now);
+        }
+    }
+    if (now >= pace.next_frame)
+        nvboard_frame(now);
+}
+
+void nvboard_pace_report()
+{
+    if (!pace.started)
+        return;
+    double seconds = std::chrono::duration<double>(std::chrono::steady_clock::now() - pace.start).count();
+    if (seconds <= 0)
+        return;
+    double rate = (T - pace.t0) / seconds;
+    if (pace.frequency)
+        fprintf(stderr, "[NVBOARD] %.0f ticks/s (target %llu, %.1f%%), %.1f fps (target %llu)\n", rate,
+                (unsigned long long)pace.frequency, rate * 100 / pace.frequency, pace.frames / seconds,
+                (unsigned long long)pace.fps);
+    else
+        fprintf(stderr, "[NVBOARD] %.0f ticks/s (unpaced), %.1f fps (target %llu)\n", rate, pace.frames / seconds,
+                (unsigned long long)pace.fps);
+}
+#endif
+
+#if ENABLE_TESTBENCH_LIBRARY == 1
+// 每个testbench的生成器、取值与期望表以及INITIAL/FOREVER块函数，末尾的空项仅用于避免空数组；
+// 块内的VERILATOR_END_CHECK跳转到所在函数的end标签
+#define TESTBENCH_DEFINE(name, ...)                                                                        \
+    static const StimGenerator testbench_##name##_initial_generators[] = {                                 \
+        VERILATOR_INITIAL_GENERATORS_##name(STIM_GEN_ENTRY){}};                                             \
+    static const StimGenerator testbench_##name##_forever_generators[] = {                                 \
+        VERILATOR_FOREVER_GENERATORS_##name(STIM_GEN_ENTRY){}};                                             \
+    static const uint64_t testbench_##name##_generator_values[] = {VERILATOR_STIM_GENERATOR_VALUES_##name 0}; \
+    static const StimExpect testbench_##name##_expects[] = {VERILATOR_EXPECTS_##name(EXPECT_ENTRY){}};     \
+    static bool testbench_##name##_initial_block()                                                        \
+    {                                                                                                      \
+        VERILATOR_TESTBENCH_INITIAL_##name();                                                              \
+        return true;                                                                                       \
+    end:                                                                                                   \
+        return false;                                                                                      \
+    }                                                                                                      \
+    static void testbench_##name##_forever_block()                                                        \
+    {                                                                                                      \
+        VERILATOR_TESTBENCH_FOREVER_##name();                                                              \
+    end:;                                                                                                  \
+    }
+#define TESTBENCH_ENTRY(name, ...)                                                                          \
+    {#name, __VA_ARGS__, testbench_##name##_initial_block, testbench_##name##_forever_block,               \
+     testbench_##name##_initial_generators,                                                                \
+     sizeof(testbench_##name##_initial_generators) / sizeof(StimGenerator) - 1,                            \
+     testbench_##name##_forever_generators,                                                                \
+     sizeof(testbench_##name##_forever_generators) / sizeof(StimGenerator) - 1,                            \
+     testbench_##name##_generator_values, testbench_##name##_expects,                                      \
+     sizeof(testbench_##name##_expects) / sizeof(StimExpect) - 1, CHECKPOINT_KEY_##name,                   \
+     QUIESCENCE_START_##name},
+
+VERILATOR_TESTBENCHES(TESTBENCH_DEFINE)
+static const TestbenchConfig testbenches[] = {VERILATOR_TESTBENCHES(TESTBENCH_ENTRY)};
+const TestbenchConfig *testbench = testbenches;
+
+void testbench_select()
+{
+    // 未知的名字在退出前不改变testbench，退出时的报告仍可读取配置
+    std::string name = plusarg_or("tb=", testbenches[0].name);
+    const TestbenchConfig *selected = nullptr;
+    for (const TestbenchConfig &entry : testbenches)
+        if (name == entry.name)
+            selected = &entry;
+    if (!selected)
+    {
+        fprintf(stderr, "[TB ERROR] testbench '%s' is not compiled into the simulator, available:", name.c_str());
+        for (const TestbenchConfig &entry : testbenches)
+            fprintf(stderr, " %s", entry.name);
+        fprintf(stderr, "\n");
+        exit(1);
+    }
+    testbench = selected;
+    stim.generators[STIM_SECTION_INITIAL] = testbench->initial_generators;
+    stim.generator_counts[STIM_SECTION_INITIAL] = testbench->initial_generator_count;
+    stim.generators[STIM_SECTION_FOREVER] = testbench->forever_generators;
+    stim.generator_counts[STIM_SECTION_FOREVER] = testbench->forever_generator_count;
+    stim.generator_values = testbench->generator_values;
+    expect.cursor = testbench->expects;
+    expect.end = testbench->expects + testbench->expect_count;
+    expect.total = testbench->expect_count;
+    quiesce.start = testbench->quiescence_start;
+#if ENABLE_CHECKPOINT == 1
+    checkpoint_key = testbench->checkpoint_key;
+#endif
+}
+#endif
+
+uint64_t verilator_next_time(uint64_t t)
+{
+    // 至少前进一个时间单位，与do-while步进循环的语义一致
+    uint64_t next = t > T ? t : T + 1;
+    if (ENABLE_CLK_INPUT)
+    {
+        uint64_t edge = (T / HALF_CLK_CYCLE + 1) * HALF_CLK_CYCLE;
+        next = edge < next ? edge : next;
+    }
+    uint64_t event = stim_next_time();
+    next = event < next ? event : next;
+    uint64_t check = expect_next_time();
+    next = check < next ? check : next;
+    uint64_t deadline = quiescence_deadline();
+    next = deadline > T && deadline < next ? deadline : next;
+    if (ENABLE_LIMIT_TIME_STIMULATION && MAX_TIME_SIM > T && MAX_TIME_SIM < next)
+        next = MAX_TIME_SIM;
+    return next;
+}
+
 void close()
 {
+#ifdef NVBOARD
+    nvboard_pace_report();
+#endif
+    report_write();
     VERILATOR_FREE();
-    #if ENABLE_WAVEFROM_ACQUISITION==0
-    std::remove(WAVEFILE);
-    #endif
 }
 void signal_handler(int sig) {
     std::exit(0); 
@@ -39,9 +1002,13 @@ int main(int argc, char **argv)
     nvboard_init();
 #endif 
     VERILATOR_INIT(argc, argv);
-    VERILATOR_MAIN_INITIAL_BLOCK();
+    if (!VERILATOR_CHECKPOINT_RESTORE())
+    {
+        VERILATOR_MAIN_INITIAL_BLOCK();
+        VERILATOR_CHECKPOINT_SAVE();
+    }
     VERILATOR_MAIN_FOREVER_BLOCK();
 end:
-    exit(0);
+    exit(expect_finish() ? 1 : 0);
     return 0;
 }
\ No newline at end of file
@@ -0,0 +1,117 @@
+"""
+构建配置基准测试：以make.cfg中的各个BUILD_PROFILE分别构建仿真程序，运行同一个参考testbench并比较吞吐量
+
+参考testbench在进程内转换为二进制激励，各配置的构建目录位于build/bench/builds/<哈希>-<配置>/，
+已是最新时直接复用。每个配置串行运行若干次取最快的一次，以仿真程序自身统计的耗时计算每秒仿真周期数
+（时钟关闭时为每秒仿真时间单位数），结果写入JSON汇总文件。
+
+用法: python testbench/bench.py [参考CSV] [--profiles debug fast ...] [--repeat N] [--summary 路径]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from regress import ROOT, TESTBENCH, convert_case, build_simulator, run_case
+
+BENCH = os.path.join(ROOT, "build", "bench")
+PROFILES = ("debug", "fast", "trace-light", "max-throughput")
+
+
+def run_profile(case, profile, args):
+    """构建并多次运行单个配置，返回结果字典"""
+    result = {"profile": profile, "status": "fail", "build_seconds": None, "ticks": None, "cycles": None,
+              "seconds": None, "cycles_per_second": None, "ticks_per_second": None}
+    begin = time.perf_counter()
+    executable, error = build_simulator(f"{case['key']}-{profile}", case["dir"],
+                                        [f"BUILD_PROFILE={profile}", *args.make_arg], root=BENCH)
+    result["build_seconds"] = round(time.perf_counter() - begin, 3)
+    if error:
+        result["status"] = "build-error"
+        result["error"] = error
+        return result
+
+    run_dir = os.path.join(BENCH, "runs", profile)
+    os.makedirs(run_dir, exist_ok=True)
+    plusargs = [f"+wave-dump={int(args.waves)}", *args.plusarg]
+    for _ in range(args.repeat):
+        run = run_case(case["name"], executable, case["stim"], run_dir, args.timeout, plusargs)
+        if run["status"] != "pass":
+            result["status"] = run["status"]
+            result["log"] = run["log"]
+            return result
+        with open(os.path.join(run_dir, "report.json")) as f:
+            report = json.load(f)
+        # 取最快的一次，减少调度与缓存预热带来的波动
+        if result["seconds"] is None or report["seconds"] < result["seconds"]:
+            result.update(ticks=report["ticks"], cycles=report.get("cycles"), seconds=report["seconds"])
+    result["status"] = "pass"
+    if result["seconds"]:
+        result["ticks_per_second"] = round(result["ticks"] / result["seconds"], 1)
+        if result["cycles"]:
+            result["cycles_per_second"] = round(result["cycles"] / result["seconds"], 1)
+    return result
+
+
+def throughput(result):
+    return result["cycles_per_second"] or result["ticks_per_second"] or 0.0
+
+
+def print_table(results):
+    base = next((throughput(r) for r in results if r["status"] == "pass"), 0.0)
+    print(f"\n{'配置':<13}  状态        构建(s)     耗时(s)        周期数      周期/秒    相对")
+    for r in results:
+        seconds = f"{r['seconds']:.4f}" if r["seconds"] is not None else "-"
+        cycles = r["cycles"] if r["cycles"] is not None else "-"
+        rate = f"{throughput(r):.0f}" if r["status"] == "pass" else "-"
+        speedup = f"{throughput(r) / base:.2f}x" if base and r["status"] == "pass" else "-"
+        print(f"{r['profile']:<15}  {r['status']:<11}  {r['build_seconds']:>8}  {seconds:>10}  {cycles:>12}  "
+              f"{rate:>11}  {speedup:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较各构建配置在参考testbench上的仿真吞吐量")
+    parser.add_argument("csv", nargs="?", default=os.path.join(TESTBENCH, "testbench0.csv"),
+                        help="参考testbench CSV，默认testbench/testbench0.csv")
+    parser.add_argument("--profiles", nargs="+", choices=PROFILES, default=list(PROFILES), help="参与比较的构建配置")
+    parser.add_argument("--repeat", type=int, default=3, help="每个配置的运行次数，取最快的一次")
+    parser.add_argument("--timeout", type=float, default=600, help="单次运行的超时时间（秒）")
+    parser.add_argument("--waves", action="store_true", help="运行时记录波形（max-throughput不含波形记录）")
+    parser.add_argument("--summary", default=os.path.join(BENCH, "summary.json"), help="JSON汇总文件路径")
+    parser.add_argument("--make-arg", action="append", default=[], metavar="VAR=VALUE",
+                        help="传递给make的额外变量，例如VERILATOR_THREADS=4")
+    parser.add_argument("--plusarg", action="append", default=[], metavar="+ARG", help="传递给仿真程序的额外参数")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv):
+        print(f"错误: 找不到参考testbench {args.csv}")
+        sys.exit(1)
+    case = convert_case(os.path.abspath(args.csv), root=BENCH)
+    if case["error"]:
+        print(f"[CONVERT ERROR] {case['name']}: {case['error']}")
+        sys.exit(1)
+
+    results = []
+    for profile in args.profiles:
+        print(f"构建并运行 {profile}")
+        result = run_profile(case, profile, args)
+        results.append(result)
+        if result["status"] != "pass":
+            print(f"[{result['status'].upper()}] {profile}: {result.get('error') or result.get('log')}")
+
+    passed = [r for r in results if r["status"] == "pass"]
+    best = max(passed, key=throughput)["profile"] if passed else None
+    summary = {"csv": case["csv"], "repeat": args.repeat, "waves": args.waves, "best": best, "profiles": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.summary)), exist_ok=True)
+    with open(args.summary, "w") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print_table(results)
+    if best:
+        print(f"\n最快的构建配置为 {best}，可在make.cfg中设置BUILD_PROFILE={best}；汇总写入 {args.summary}")
+    sys.exit(0 if len(passed) == len(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
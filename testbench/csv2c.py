@@ -2,7 +2,11 @@ import sys
 import csv
 import re
 import os
-from collections import defaultdict
+import struct
+import argparse
+import hashlib
+from array import array
+from itertools import chain
 
 # CSV中的配置名到宏定义名的映射
 CONFIG_MAPPING = {
@@ -14,71 +18,359 @@ CONFIG_MAPPING = {
     'enable INITIAL block': 'ENABLE_INITIAL_BLOCK',
     'INITIAL block max stimulate time': 'INITIAL_BLOCK_MAX_STIMULATE_TIME',
     'enable FOREVER block': 'ENABLE_FOREVER_BLOCK',
-    'FOREVER block cycle': 'FOREVER_BLOCK_CYCLE'
+    'FOREVER block cycle': 'FOREVER_BLOCK_CYCLE',
+    'trace windows': 'TRACE_WINDOWS',
+    'trace trigger': 'TRACE_TRIGGER',
+    'trace trigger duration': 'TRACE_TRIGGER_DURATION',
+    'trace depth': 'TRACE_DEPTH',
+    'trace include scopes': 'TRACE_INCLUDE_SCOPES',
+    'trace exclude scopes': 'TRACE_EXCLUDE_SCOPES',
+    'trace scope file': 'TRACE_SCOPE_FILE',
+    'checkpoint mode': 'CHECKPOINT_MODE',
+    'auto settle margin': 'AUTO_SETTLE_MARGIN',
+    'quiescence cycles': 'QUIESCENCE_CYCLES',
+    'quiescence signals': 'QUIESCENCE_SIGNALS'
 }
 
+# 检查点模式：off不使用，save执行INITIAL块后保存，restore必须从检查点恢复，auto检查点有效时恢复否则执行并保存
+CHECKPOINT_MODES = ('off', 'save', 'restore', 'auto')
+# 影响INITIAL块结束时模型状态的配置，参与检查点标识的计算
+CHECKPOINT_CONFIG_KEYS = ('ENABLE_INITIAL_BLOCK', 'INITIAL_BLOCK_MAX_STIMULATE_TIME',
+                          'ENABLE_CLK_INPUT', 'HALF_CLK_CYCLE', 'CLK_PIN_NAME')
+
+# sim_config.h中必须存在的宏及其默认值
+REQUIRED_MACROS = {
+    'ENABLE_LIMIT_TIME_STIMULATION': '1',
+    'MAX_TIME_SIM': '20',
+    'HALF_CLK_CYCLE': '2',
+    'ENABLE_CLK_INPUT': '0',
+    'CLK_PIN_NAME': 'clk',
+    'ENABLE_INITIAL_BLOCK': '1',
+    'INITIAL_BLOCK_MAX_STIMULATE_TIME': '20',
+    'ENABLE_FOREVER_BLOCK': '0',
+    'FOREVER_BLOCK_CYCLE': '20',
+    'ENABLE_BINARY_STIMULUS': '0'
+}
+
+# 激励库中每个testbench独立的配置，运行时从所选testbench的TestbenchConfig读取，
+# 顺序需与sim_main.h中TestbenchConfig的字段保持一致；其余配置在编译时确定，取自第一个CSV
+TESTBENCH_CONFIG_KEYS = ('ENABLE_LIMIT_TIME_STIMULATION', 'MAX_TIME_SIM', 'HALF_CLK_CYCLE', 'ENABLE_CLK_INPUT',
+                         'ENABLE_INITIAL_BLOCK', 'INITIAL_BLOCK_MAX_STIMULATE_TIME', 'ENABLE_FOREVER_BLOCK',
+                         'FOREVER_BLOCK_CYCLE')
+
+# 波形采集相关的配置，不直接输出为宏，由generate_trace_config转换
+TRACE_CONFIG_KEYS = ('TRACE_WINDOWS', 'TRACE_TRIGGER', 'TRACE_TRIGGER_DURATION', 'TRACE_DEPTH',
+                     'TRACE_INCLUDE_SCOPES', 'TRACE_EXCLUDE_SCOPES', 'TRACE_SCOPE_FILE')
+# 可设为auto的时长配置，由激励中最后一次活动的时间加上稳定余量（auto settle margin，默认两个时钟周期）得出；
+# 按依赖顺序排列，MAX_TIME_SIM取决于两个块的时长
+AUTO_CONFIG_KEYS = ('INITIAL_BLOCK_MAX_STIMULATE_TIME', 'FOREVER_BLOCK_CYCLE', 'MAX_TIME_SIM')
+
+TRACE_TRIGGER_PATTERN = re.compile(r"^(\w+)\s*(==|!=|>=|<=|>|<)\s*(\S+)$")
+
+# Verilog风格数值字面量的进制
+VERILOG_BASES = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+# 激励值打包为64位无符号整数
+MAX_VALUE = (1 << 64) - 1
+
+# 二进制激励文件格式，需与sim_main.h中的StimHeader/StimRecord/StimGenerator/StimExpect保持一致
+# 文件头: 魔数, 版本, 引脚数, INITIAL记录数, FOREVER记录数, 记录区偏移,
+#         INITIAL生成器数, FOREVER生成器数, 生成器区偏移, 取值表长度, 取值表偏移,
+#         期望信号数, 保留, 期望数, 期望区偏移, INITIAL块检查点标识
+# 名字表: 先是引脚名再是期望信号名，每项为u32长度+名字，整体按8字节对齐
+# 记录: 时间, 值, 引脚ID, 保留
+# 生成器: 起始时间, 周期, 次数, 参数a, 参数b, 引脚ID, 种类
+# 期望: 时间, 期望值, 掩码, 信号ID, CSV行号
+STIM_MAGIC = b'MVSTIM\0\0'
+STIM_VERSION = 4
+STIM_HEADER = struct.Struct('<8sIIQQQQQQQQIIQQQ')
+STIM_RECORD = struct.Struct('<QQII')
+STIM_GENERATOR = struct.Struct('<QQQQQII')
+STIM_EXPECT = struct.Struct('<QQQII')
+# 每批写出的记录数
+STIM_BATCH = 4096
+
+# 运行时生成器的种类，需与sim_main.h中的StimGeneratorKind保持一致
+GENERATOR_KINDS = {'counter': 0, 'random': 1, 'repeat': 2}
+GENERATOR_MACROS = ('STIM_GEN_COUNTER', 'STIM_GEN_RANDOM', 'STIM_GEN_REPEAT')
+# 各生成器参数列表中周期所在的位置
+GENERATOR_PERIOD_ARGS = {'counter': 2, 'ramp': 2, 'random': 1, 'repeat': 0}
+GENERATOR_PATTERN = re.compile(r"(\w+)\s*\((.*)\)$")
+
+# 循环折叠：一个周期最多包含的步数，以及折叠所需的最少重复次数
+FOLD_MAX_BODY = 16
+FOLD_MIN_REPEAT = 4
+
+class Generator:
+    """运行时激励生成器：从块内start时刻起每隔period对引脚赋值一次，共count次（0表示持续到块结束）"""
+    __slots__ = ('kind', 'pin', 'start', 'period', 'count', 'a', 'b', 'values')
+
+    def __init__(self, kind, pin, start, period, count=0, a=0, b=0, values=()):
+        self.kind = kind
+        self.pin = pin
+        self.start = start
+        self.period = period
+        self.count = count
+        self.a = a
+        self.b = b
+        self.values = values
+
+class EventStore:
+    """列式事件存储：整数时间、驻留后的引脚ID、打包为64位无符号整数的值"""
+    __slots__ = ('pin_names', 'pin_ids', 'times', 'pins', 'values',
+                 'group_times', 'group_offsets', 'generators')
+
+    def __init__(self, pin_names=None, pin_ids=None):
+        # 引脚名驻留表在同一个testbench的各个块之间共享
+        self.pin_names = [] if pin_names is None else pin_names
+        self.pin_ids = {} if pin_ids is None else pin_ids
+        self.times = array('Q')
+        self.pins = array('I')
+        self.values = array('Q')
+        # 排序后填充：每个时间点一组，group_offsets末尾多一个哨兵
+        self.group_times = array('Q')
+        self.group_offsets = array('Q')
+        # 运行时生成器保持符号形式，不展开为事件
+        self.generators = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def intern(self, pin):
+        """返回引脚名对应的ID，首次出现时分配新ID"""
+        pin_id = self.pin_ids.get(pin)
+        if pin_id is None:
+            pin_id = len(self.pin_names)
+            self.pin_ids[pin] = pin_id
+            self.pin_names.append(pin)
+        return pin_id
+
+    def append(self, time, pin, value):
+        self.times.append(time)
+        self.pins.append(self.intern(pin))
+        self.values.append(value)
+
+    def used_pins(self):
+        """块内实际用到的引脚ID，按ID排序"""
+        return sorted(set(self.pins))
+
+    def groups(self):
+        """按时间顺序产出 (时间, [(引脚ID, 值), ...])，仅对validate_and_sort_events的结果有效"""
+        offsets = self.group_offsets
+        pins = self.pins
+        values = self.values
+        for i, time in enumerate(self.group_times):
+            yield time, [(pins[j], values[j]) for j in range(offsets[i], offsets[i + 1])]
+
+class ExpectStore:
+    """列式期望值存储：绝对仿真时间、驻留后的输出信号ID、期望值、比较掩码及其所在的CSV行号"""
+    __slots__ = ('signal_names', 'signal_ids', 'times', 'signals', 'values', 'masks', 'lines')
+
+    def __init__(self, signal_names=None, signal_ids=None):
+        self.signal_names = [] if signal_names is None else signal_names
+        self.signal_ids = {} if signal_ids is None else signal_ids
+        self.times = array('Q')
+        self.signals = array('I')
+        self.values = array('Q')
+        self.masks = array('Q')
+        self.lines = array('I')
+
+    def __len__(self):
+        return len(self.times)
+
+    def intern(self, signal):
+        signal_id = self.signal_ids.get(signal)
+        if signal_id is None:
+            signal_id = len(self.signal_names)
+            self.signal_ids[signal] = signal_id
+            self.signal_names.append(signal)
+        return signal_id
+
+    def append(self, time, signal, value, mask, line):
+        self.times.append(time)
+        self.signals.append(self.intern(signal))
+        self.values.append(value & mask)
+        self.masks.append(mask)
+        self.lines.append(line)
+
+    def __iter__(self):
+        """产出 (时间, 信号ID, 期望值, 掩码, 行号)"""
+        return zip(self.times, self.signals, self.values, self.masks, self.lines)
+
+
+def parse_value(text):
+    """解析激励值：支持十进制、0x/0o/0b前缀以及Verilog风格的8'hFF，结果打包为64位无符号整数"""
+    s = text.strip().replace('_', '')
+    if "'" in s:
+        width, _, literal = s.partition("'")
+        base = VERILOG_BASES.get(literal[:1].lower())
+        if base is None:
+            raise ValueError(f"无法识别的数值 '{text}'")
+        value = int(literal[1:], base)
+        if width and value >= (1 << int(width)):
+            raise ValueError(f"数值 '{text}' 超出声明的位宽")
+    elif s.lstrip('-').isdigit():
+        value = int(s, 10)
+    else:
+        try:
+            value = int(s, 0)
+        except ValueError:
+            # 激励打包为64位整数供二进制播放器与优化器使用，符号值无法在生成时求值
+            raise ValueError(f"'{text}' 不是数值字面量，宏、枚举或C表达式需改写为数值") from None
+    if value < 0:
+        value &= MAX_VALUE
+    if value > MAX_VALUE:
+        raise ValueError(f"数值 '{text}' 超过64位")
+    return value
+
+
+def parse_time(text):
+    """解析事件或期望的时间：十进制整数，不能为负数或超过64位"""
+    time = int(text)
+    if time < 0:
+        raise ValueError(f"时间 '{text}' 不能为负数")
+    if time > MAX_VALUE:
+        raise ValueError(f"时间 '{text}' 超过64位")
+    return time
+
+
+def parse_expect_value(text, mask_text=""):
+    """解析期望值，返回(值, 掩码)：二/八/十六进制的Verilog字面量中x、z或?所在的位不参与比较，
+    mask_text非空时再与给定掩码相与"""
+    s = text.strip().replace('_', '')
+    mask = MAX_VALUE
+    if "'" in s and re.search(r"[xXzZ?]", s):
+        width, _, literal = s.partition("'")
+        base = VERILOG_BASES.get(literal[:1].lower())
+        if base in (None, 10):
+            raise ValueError(f"无法识别的期望值 '{text}'")
+        bits = base.bit_length() - 1
+        value = unknown = 0
+        for digit in literal[1:]:
+            value <<= bits
+            unknown <<= bits
+            if digit in 'xXzZ?':
+                unknown |= (1 << bits) - 1
+            else:
+                value |= int(digit, base)
+        mask &= ~unknown
+        if width and value >= (1 << int(width)):
+            raise ValueError(f"数值 '{text}' 超出声明的位宽")
+        if value > MAX_VALUE:
+            raise ValueError(f"数值 '{text}' 超过64位")
+    else:
+        value = parse_value(s)
+    if mask_text.strip():
+        mask &= parse_value(mask_text)
+    return value & mask, mask
+
+
+def parse_generator(text, start, pin):
+    """解析生成器表达式，例如 counter(0 1 10)；text不是生成器时返回None
+
+    counter(起始值 步长 周期 [次数])  ramp(起始值 终止值 周期)
+    random(种子 周期 [次数])          repeat(周期 值0 值1 ...)
+    参数之间可用空格或逗号分隔
+    """
+    match = GENERATOR_PATTERN.match(text.strip())
+    if not match:
+        return None
+    name = match.group(1).lower()
+    texts = [arg for arg in re.split(r"[\s,]+", match.group(2).strip()) if arg]
+    args = [parse_value(arg) for arg in texts]
+
+    if name == 'counter' and len(args) in (3, 4):
+        gen = Generator(GENERATOR_KINDS['counter'], pin, start, args[2], args[3] if len(args) > 3 else 0, args[0], args[1])
+    elif name == 'ramp' and len(args) == 3:
+        # 逐1递增或递减直到终止值，等价于定长的计数器
+        low, high = args[0], args[1]
+        step = 1 if high >= low else MAX_VALUE
+        gen = Generator(GENERATOR_KINDS['counter'], pin, start, args[2], abs(high - low) + 1, low, step)
+    elif name == 'random' and len(args) in (2, 3):
+        if args[0] == 0:
+            raise ValueError(f"生成器 '{text}' 的种子不能为0")
+        gen = Generator(GENERATOR_KINDS['random'], pin, start, args[1], args[2] if len(args) > 2 else 0, args[0])
+    elif name == 'repeat' and len(args) >= 2:
+        gen = Generator(GENERATOR_KINDS['repeat'], pin, start, args[0], values=args[1:])
+    else:
+        raise ValueError(f"无法识别的生成器 '{text}'")
+
+    # parse_value把负数按补码打包，周期为负时会变成极大的正数，需按原文检查
+    if texts[GENERATOR_PERIOD_ARGS[name]].startswith('-'):
+        raise ValueError(f"生成器 '{text}' 的周期不能为负数")
+    if gen.period == 0:
+        raise ValueError(f"生成器 '{text}' 的周期不能为0")
+    return gen
+
+def format_value(value):
+    """将打包的值格式化为C字面量"""
+    if value > 0xFFFFFFFF:
+        return f"{value:#x}ULL"
+    return str(value)
+
+
+def config_macro_name(config_name):
+    """使用映射表把CSV中的配置名转换为标准宏名，未收录的配置名转为大写并以下划线连接"""
+    return CONFIG_MAPPING.get(config_name, config_name.upper().replace(' ', '_'))
+
 def parse_testbench_csv(csv_path):
-    """解析testbench.csv文件，返回配置、INITIAL事件和FOREVER事件"""
-    initial_events = []
-    forever_events = []
+    """流式解析testbench.csv文件，返回配置、INITIAL事件存储、FOREVER事件存储和期望值存储"""
     config = {}
-    
+    initial_events = EventStore()
+    # FOREVER与INITIAL共享引脚ID
+    forever_events = EventStore(initial_events.pin_names, initial_events.pin_ids)
+    expects = ExpectStore()
+
     if not os.path.exists(csv_path):
         raise FileNotFoundError(f"CSV文件不存在: {csv_path}")
-    
-    with open(csv_path, 'r') as f:
+
+    with open(csv_path, 'r', newline='') as f:
         reader = csv.reader(f)
-        
-        # 读取第一行（表头）
-        try:
-            header = next(reader)
-        except StopIteration:
-            return config, initial_events, forever_events
-        
-        # 读取后续行
+
+        # 跳过第一行（表头）
+        if next(reader, None) is None:
+            return config, initial_events, forever_events, expects
+
+        # 逐行读取，直接写入列式存储
         for row in reader:
-            # 解析INITIAL部分（列0-4）
-            if len(row) > 1 and row[1].strip():  # 有时间值
-                time_ps = row[1].strip()
-                pin = row[2].strip() if len(row) > 2 else ""
-                value = row[3].strip() if len(row) > 3 else ""
-                note = row[4].strip() if len(row) > 4 else ""
-                
-                if time_ps and pin and value:
-                    initial_events.append({
-                        'time': time_ps,
-                        'pin': pin,
-                        'value': value,
-                        'note': note
-                    })
-            
-            # 解析FOREVER部分（列5-9）
-            if len(row) > 6 and row[6].strip():  # 有时间值
-                time_ps = row[6].strip()
-                pin = row[7].strip() if len(row) > 7 else ""
-                value = row[8].strip() if len(row) > 8 else ""
-                note = row[9].strip() if len(row) > 9 else ""
-                
-                if time_ps and pin and value:
-                    forever_events.append({
-                        'time': time_ps,
-                        'pin': pin,
-                        'value': value,
-                        'note': note
-                    })
-            
+            width = len(row)
+            # INITIAL部分（列0-4）与FOREVER部分（列5-9）
+            for store, col, block_name in ((initial_events, 1, 'INITIAL'), (forever_events, 6, 'FOREVER')):
+                if width <= col + 2:
+                    continue
+                time_ps = row[col].strip()
+                pin = row[col + 1].strip()
+                value = row[col + 2].strip()
+                if not (time_ps and pin and value):
+                    continue
+                try:
+                    if '(' in value:
+                        store.generators.append(parse_generator(value, parse_time(time_ps), store.intern(pin)))
+                    else:
+                        store.append(parse_time(time_ps), pin, parse_value(value))
+                except ValueError as e:
+                    raise ValueError(f"{block_name}块第{reader.line_num}行: 时间 '{time_ps}' 或值 '{value}' 无效 ({e})")
+
             # 解析Configuration部分（列10-12）
-            if len(row) > 10 and row[10].strip():  # 有配置名
+            if width > 11 and row[10].strip():
                 config_name = row[10].strip().lower()
-                config_value = row[11].strip() if len(row) > 11 else ""
-                note = row[12].strip() if len(row) > 12 else ""
-                
+                config_value = row[11].strip()
+
                 if config_name and config_value:
-                    # 使用映射表转换为标准宏名
-                    macro_name = CONFIG_MAPPING.get(config_name, config_name.upper().replace(' ', '_'))
-                    config[macro_name] = config_value
-    
-    return config, initial_events, forever_events
+                    config[config_macro_name(config_name)] = config_value
+
+            # EXPECT部分（列13-18）：时间、输出信号、期望值、可选掩码
+            if width > 16:
+                time_ps = row[14].strip()
+                signal = row[15].strip()
+                value = row[16].strip()
+                if time_ps and signal and value:
+                    mask = row[17] if width > 17 else ""
+                    try:
+                        expects.append(parse_time(time_ps), signal, *parse_expect_value(value, mask), reader.line_num)
+                    except ValueError as e:
+                        raise ValueError(f"EXPECT块第{reader.line_num}行: 时间 '{time_ps}'、值 '{value}' 或掩码 '{mask}' 无效 ({e})")
+
+    return config, initial_events, forever_events, expects
 
 def parse_sim_config_h(config_h_path):
     """解析现有的sim_config.h文件（如果需要）"""
@@ -113,10 +405,9 @@ def parse_sim_config_h(config_h_path):
     return config
 
 def validate_and_sort_events(events, max_time_config_name, config, block_name):
-    """验证事件并排序，检查同时同引脚的赋值冲突，验证时间合法性"""
-    if not events:
-        return []
-    
+    """一次排序后单遍扫描：过滤超时事件、检查同时同引脚的赋值冲突并按时间分组"""
+    sorted_events = EventStore(events.pin_names, events.pin_ids)
+
     # 获取最大时间
     max_time = None
     if max_time_config_name in config:
@@ -124,191 +415,646 @@ def validate_and_sort_events(events, max_time_config_name, config, block_name):
             max_time = int(config[max_time_config_name])
         except ValueError:
             print(f"警告: {max_time_config_name} 的值 '{config[max_time_config_name]}' 不是有效的整数")
-    
-    # 按时间分组
-    time_groups = defaultdict(list)
-    
-    for event in events:
-        time_str = event['time']
-        pin = event['pin']
-        
-        # 检查时间是否为数字
-        try:
-            time_val = int(time_str)
-        except ValueError:
-            raise ValueError(f"{block_name}块中时间 '{time_str}' 不是有效的整数")
-        
+
+    # 生成器只检查起始时间
+    for gen in events.generators:
+        if max_time is not None and gen.start >= max_time:
+            print(f"警告: {block_name}块中引脚 {events.pin_names[gen.pin]} 的生成器起始时间 {gen.start} >= {max_time_config_name}({max_time})，生成器将被忽略")
+            continue
+        sorted_events.generators.append(gen)
+
+    if not len(events):
+        return sorted_events
+
+    times = events.times
+    pins = events.pins
+
+    # (时间, 引脚)打包为单个整数作为排序键；已按序输入时跳过排序
+    keys = [(t << 32) | p for t, p in zip(times, pins)]
+    if all(a <= b for a, b in zip(keys, keys[1:])):
+        order = range(len(keys))
+    else:
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+    del keys
+
+    ignored = 0
+    last_time = last_pin = None
+    for i in order:
+        time_val = times[i]
+        pin = pins[i]
+
         # 检查时间是否超过最大时间
         if max_time is not None and time_val >= max_time:
-            print(f"警告: {block_name}块中时间 {time_val} >= {max_time_config_name}({max_time})，事件将被忽略")
+            ignored += 1
             continue
-        
-        time_groups[time_str].append(event)
-    
-    # 检查冲突
-    valid_events = []
-    for time_str, time_events in time_groups.items():
-        pins = {}
-        for event in time_events:
-            pin = event['pin']
-            if pin in pins:
-                raise ValueError(f"{block_name}块中时间 {time_str} 时，引脚 {pin} 被多次赋值")
-            pins[pin] = event['value']
-            valid_events.append(event)
-    
-    # 按时间排序（转为整数比较）
-    try:
-        sorted_events = sorted(valid_events, key=lambda x: int(x['time']))
-    except ValueError:
-        # 如果时间不是数字，按字符串排序
-        sorted_events = sorted(valid_events, key=lambda x: x['time'])
-    
+
+        if time_val != last_time:
+            sorted_events.group_times.append(time_val)
+            sorted_events.group_offsets.append(len(sorted_events.times))
+            last_time = time_val
+        elif pin == last_pin:
+            raise ValueError(f"{block_name}块中时间 {time_val} 时，引脚 {events.pin_names[pin]} 被多次赋值")
+        last_pin = pin
+
+        sorted_events.times.append(time_val)
+        sorted_events.pins.append(pin)
+        sorted_events.values.append(events.values[i])
+    sorted_events.group_offsets.append(len(sorted_events.times))
+
+    if ignored:
+        print(f"警告: {block_name}块中 {ignored} 个事件的时间 >= {max_time_config_name}({max_time})，事件将被忽略")
+
     return sorted_events
 
-def generate_initial_block_code(events, config):
-    """生成VERILATOR_MAIN_INITIAL_BLOCK宏的代码"""
-    lines = []
-    
-    # 添加ENABLE_INITIAL_BLOCK检查
-    lines.append("    if (!ENABLE_INITIAL_BLOCK)")
-    lines.append("        break;")
-    
-    if not events:
-        # 如果没有事件，直接STEP到最大时间
-        lines.append("    VERILATOR_STEP_AND_EVAL_UNTIL(INITIAL_BLOCK_MAX_STIMULATE_TIME);")
-        return lines
-    
-    # 获取所有引脚
-    pins = set()
-    for event in events:
-        pins.add(event['pin'])
-    
-    # t=0时的显式赋值
-    zero_time_assignments = {}
-    for event in events:
-        if event['time'] == '0':
-            zero_time_assignments[event['pin']] = event['value']
-    
-    # 为t=0时未显式赋值的引脚赋值为0
-    for pin in pins:
-        if pin not in zero_time_assignments:
-            lines.append(f"    VERILATOR_SWITCH_INPUT_TO({pin}, 0);")
-    
-    # 添加t=0时的显式赋值
-    for pin, value in zero_time_assignments.items():
-        lines.append(f"    VERILATOR_SWITCH_INPUT_TO({pin}, {value});")
-    
-    # 按时间顺序处理事件（排除t=0）
-    non_zero_events = [e for e in events if e['time'] != '0']
-    
-    if non_zero_events:
-        # 按时间分组
-        time_events = defaultdict(list)
-        for event in non_zero_events:
-            time_events[event['time']].append(event)
-        
-        # 获取所有时间并排序
-        times = list(time_events.keys())
+def validate_steps(steps, pin_names, max_time_config_name, config, block_name):
+    """validate_and_sort_events的流式版本，用于不经过CSV直接产生的步序列：时间必须严格递增，
+    同一步内同一引脚只能赋值一次，超时的步被丢弃；只保存上一步的时间，内存占用与步数无关"""
+    max_time = int(config.get(max_time_config_name, REQUIRED_MACROS[max_time_config_name]))
+    ignored = 0
+    last_time = -1
+    for time, writes in steps:
+        if time <= last_time:
+            raise ValueError(f"{block_name}块中时间 {time} 出现在时间 {last_time} 之后，步序列必须按时间严格递增")
+        last_time = time
+        if time >= max_time:
+            ignored += len(writes)
+            continue
+        if len(writes) > 1 and len({pin for pin, _ in writes}) != len(writes):
+            pins = [pin for pin, _ in writes]
+            pin = next(pin for pin in pins if pins.count(pin) > 1)
+            raise ValueError(f"{block_name}块中时间 {time} 时，引脚 {pin_names[pin]} 被多次赋值")
+        yield time, writes
+    if ignored:
+        print(f"警告: {block_name}块中 {ignored} 个事件的时间 >= {max_time_config_name}({max_time})，事件将被忽略")
+
+def validate_and_sort_expects(expects, config):
+    """按(时间, 信号)排序期望值，丢弃仿真结束后才会到达的期望，同一时间同一信号只能有一个期望"""
+    sorted_expects = ExpectStore(expects.signal_names, expects.signal_ids)
+    max_time = None
+    if config.get('ENABLE_LIMIT_TIME_STIMULATION', '0').strip() == '1':
         try:
-            times.sort(key=lambda x: int(x))
+            max_time = int(config.get('MAX_TIME_SIM', ''))
         except ValueError:
-            times.sort()
-        
-        # 处理每个时间点的事件
-        current_time = '0'
-        for time in times:
-            # STEP到当前时间
-            if current_time != time:
-                lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL({time});")
-                current_time = time
-            
-            # 添加该时间点的所有赋值
-            for event in time_events[time]:
-
-                lines.append(f"    VERILATOR_SWITCH_INPUT_TO({event['pin']}, {event['value']});")
-    
-    # 最后执行STEP到INITIAL_BLOCK_MAX_STIMULATE_TIME
-    max_time = config.get('INITIAL_BLOCK_MAX_STIMULATE_TIME', '20')
-    if 'current_time' in locals() and current_time != max_time:
-        lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL(INITIAL_BLOCK_MAX_STIMULATE_TIME);")
+            pass
+
+    ignored = 0
+    last = None
+    for time, signal, value, mask, line in sorted(expects, key=lambda e: (e[0], e[1])):
+        if max_time is not None and time >= max_time:
+            ignored += 1
+            continue
+        if last == (time, signal):
+            raise ValueError(f"EXPECT块第{line}行: 时间 {time} 时信号 {expects.signal_names[signal]} 有多个期望值")
+        last = (time, signal)
+        sorted_expects.times.append(time)
+        sorted_expects.signals.append(signal)
+        sorted_expects.values.append(value)
+        sorted_expects.masks.append(mask)
+        sorted_expects.lines.append(line)
+
+    if ignored:
+        print(f"警告: EXPECT块中 {ignored} 个期望的时间 >= MAX_TIME_SIM({max_time})，期望将被忽略")
+    return sorted_expects
+
+def is_auto(value):
+    return value is not None and value.strip().lower() == 'auto'
+
+def config_int(config, key):
+    """读取非负整数配置，未设置时使用默认值，不是非负整数时抛出ValueError"""
+    value = config.get(key, REQUIRED_MACROS[key]).strip()
+    if not value.isdigit():
+        raise ValueError(f"{key} 的值 '{value}' 不是有效的非负整数")
+    return int(value)
+
+def config_enabled(config, key):
+    return config.get(key, REQUIRED_MACROS[key]).strip() == '1'
+
+def settle_margin(config):
+    """auto时长在最后一次活动之后保留的稳定时间，默认两个时钟周期"""
+    if 'AUTO_SETTLE_MARGIN' not in config:
+        return 4 * config_int(config, 'HALF_CLK_CYCLE')
+    value = config['AUTO_SETTLE_MARGIN'].strip()
+    if not value.isdigit():
+        raise ValueError(f"auto settle margin 的值 '{value}' 不是有效的非负整数")
+    return int(value)
+
+def auto_bound(last, margin):
+    """最后一次活动（None表示没有）之后再保留margin的时长，至少为1"""
+    return max(1, (0 if last is None else last + 1) + margin)
+
+def block_last_time(events, block_end=None):
+    """块内最后一次赋值的相对时间，块内没有激励时返回None
+
+    block_end为块时长，超出的事件与生成器赋值不计入，持续到块结束的生成器计到块内最后一次赋值；
+    block_end为None（时长本身为auto）时这样的生成器没有确定的结束时间，抛出ValueError
+    """
+    last = max((t for t in events.times if block_end is None or t < block_end), default=None)
+    for gen in events.generators:
+        if block_end is not None and gen.start >= block_end:
+            continue
+        fires = gen.count - 1 if gen.count else None
+        if block_end is not None:
+            within = (block_end - 1 - gen.start) // gen.period
+            fires = within if fires is None else min(fires, within)
+        elif fires is None:
+            raise ValueError(f"引脚 {events.pin_names[gen.pin]} 的生成器持续到块结束，块时长不能为auto")
+        end = gen.start + gen.period * fires
+        last = end if last is None else max(last, end)
+    return last
+
+def last_stimulus_time(config, initial_last, forever_last, expect_last):
+    """启用的块中最后一次赋值与最后一个期望的绝对时间，都没有时返回None
+
+    initial_last/forever_last为块内的相对时间（None表示没有），FOREVER块只计第一个周期，排在INITIAL块之后
+    """
+    times = [expect_last]
+    forever_start = 0
+    if config_enabled(config, 'ENABLE_INITIAL_BLOCK'):
+        times.append(initial_last)
+        forever_start = config_int(config, 'INITIAL_BLOCK_MAX_STIMULATE_TIME')
+    if config_enabled(config, 'ENABLE_FOREVER_BLOCK') and forever_last is not None:
+        times.append(forever_start + forever_last)
+    return max((t for t in times if t is not None), default=None)
+
+def resolve_auto_bounds(config, initial_events, forever_events, expects):
+    """把值为auto的块时长与仿真时长替换为最后一次活动的时间加上稳定余量，在过滤超时事件之前调用
+
+    没有FOREVER块时仿真在INITIAL块结束时停止，INITIAL块的时长同时覆盖全部期望
+    """
+    auto = [key for key in AUTO_CONFIG_KEYS if is_auto(config.get(key))]
+    if not auto:
+        return
+    margin = settle_margin(config)
+    expect_last = max(expects.times, default=None)
+    for key, events, block_name in (('INITIAL_BLOCK_MAX_STIMULATE_TIME', initial_events, 'INITIAL'),
+                                    ('FOREVER_BLOCK_CYCLE', forever_events, 'FOREVER')):
+        if key not in auto:
+            continue
+        try:
+            last = block_last_time(events)
+        except ValueError as e:
+            raise ValueError(f"{block_name}块中{e}") from e
+        if block_name == 'INITIAL' and not config_enabled(config, 'ENABLE_FOREVER_BLOCK') and expect_last is not None:
+            last = expect_last if last is None else max(last, expect_last)
+        config[key] = str(auto_bound(last, margin))
+    if 'MAX_TIME_SIM' in auto:
+        initial_last = block_last_time(initial_events, config_int(config, 'INITIAL_BLOCK_MAX_STIMULATE_TIME'))
+        forever_last = block_last_time(forever_events, config_int(config, 'FOREVER_BLOCK_CYCLE'))
+        last = last_stimulus_time(config, initial_last, forever_last, expect_last)
+        config['MAX_TIME_SIM'] = str(auto_bound(last, margin))
+    for key in auto:
+        print(f"{key} 为auto，根据激励设置为 {config[key]}（稳定余量 {margin}）")
+
+def quiescence_start(config, initial_events, forever_events, expects):
+    """运行时静止检测的起点：最后一次激励或期望的绝对时间，之后输出不再变化即可提前结束；
+    启用的FOREVER块中有激励（输入一直在变化）或块时长不是整数时返回None，不做检测"""
+    try:
+        if config_enabled(config, 'ENABLE_FOREVER_BLOCK') and \
+                block_last_time(forever_events, config_int(config, 'FOREVER_BLOCK_CYCLE')) is not None:
+            return None
+        initial_last = block_last_time(initial_events, config_int(config, 'INITIAL_BLOCK_MAX_STIMULATE_TIME'))
+    except ValueError:
+        return None
+    return last_stimulus_time(config, initial_last, None, max(expects.times, default=None)) or 0
+
+def format_quiescence_start(start):
+    return 'UINT64_MAX' if start is None else f"{start}ULL"
+
+def initial_checkpoint_key(events, config):
+    """INITIAL块的64位标识：由INITIAL事件、生成器、引脚表与相关配置计算，用于判断检查点是否仍然有效"""
+    h = hashlib.sha256()
+    for key in CHECKPOINT_CONFIG_KEYS:
+        h.update(f"{key}={config.get(key, '')};".encode())
+    h.update("\0".join(events.pin_names).encode())
+    for column in (events.times, events.pins, events.values):
+        h.update(column.tobytes())
+    for gen in events.generators:
+        h.update(repr((gen.kind, gen.pin, gen.start, gen.period, gen.count, gen.a, gen.b, tuple(gen.values))).encode())
+    return int.from_bytes(h.digest()[:8], 'little')
+
+def iter_block_steps(events):
+    """按时间顺序产出块内的 (时间, [(引脚ID, 值), ...])；t=0步为块内未显式赋值的引脚补默认值0"""
+    groups = events.groups()
+    first = next(groups, None)
+    if first is None:
+        return
+    if first[0] == 0:
+        zero_writes = first[1]
     else:
-        lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL(INITIAL_BLOCK_MAX_STIMULATE_TIME);")
-    
-    return lines
+        zero_writes = []
+        groups = chain([first], groups)
+    assigned = {pin for pin, _ in zero_writes}
+    defaults = [(pin, 0) for pin in events.used_pins() if pin not in assigned]
+    yield 0, defaults + zero_writes
+    yield from groups
 
-def generate_forever_block_code(events, config):
-    """生成VERILATOR_MAIN_FOREVER_BLOCK宏的代码"""
+class StepLoop:
+    """折叠后的周期性步序列：body中的步每隔period重复count次，patterns给出每个写入值的变化规律"""
+    __slots__ = ('count', 'period', 'body', 'patterns')
+
+    def __init__(self, count, period, body, patterns):
+        self.count = count
+        self.period = period
+        self.body = body
+        self.patterns = patterns
+
+def eliminate_redundant_writes(steps, volatile_pins=()):
+    """去除不改变引脚当前值的写入，并合并因此变空的步；t=0步及volatile_pins（由生成器驱动）的写入全部保留"""
+    state = {}
+    for time, writes in steps:
+        if time:
+            writes = [(pin, value) for pin, value in writes
+                      if pin in volatile_pins or state.get(pin) != value]
+            if not writes:
+                continue
+        for pin, value in writes:
+            state[pin] = value
+        yield time, writes
+
+def _value_patterns(v0, v1):
+    """由相邻两个周期的值推导候选规律：等差、左移或右移"""
+    patterns = [('add', v1 - v0)]
+    shift = v1.bit_length() - v0.bit_length()
+    if v0 and shift > 0 and v1 == v0 << shift:
+        patterns.append(('shl', shift))
+    if v1 and shift < 0 and v1 == v0 >> -shift:
+        patterns.append(('shr', -shift))
+    return patterns
+
+def _pattern_value(v0, pattern, k):
+    """第k个周期按规律得到的值，超出64位或移位越界时返回None"""
+    kind, stride = pattern
+    if kind == 'add':
+        value = v0 + k * stride
+        return value if 0 <= value <= MAX_VALUE else None
+    if k * stride >= 64:
+        return None
+    value = v0 << (k * stride) if kind == 'shl' else v0 >> (k * stride)
+    return value if value <= MAX_VALUE else None
+
+def _match_period(steps, i, m):
+    """以steps[i:i+m]为周期体向后匹配，返回(重复次数, 周期时长, 每个写入的规律)"""
+    n = len(steps)
+    if i + 2 * m > n:
+        return 1, 0, None
+    body = steps[i:i + m]
+    period = steps[i + m][0] - steps[i][0]
+
+    # 第二个周期确定候选规律
+    candidates = []
+    for j, (time, writes) in enumerate(body):
+        next_time, next_writes = steps[i + m + j]
+        if next_time - time != period or [p for p, _ in writes] != [p for p, _ in next_writes]:
+            return 1, period, None
+        candidates.append([_value_patterns(v0, v1) for (_, v0), (_, v1) in zip(writes, next_writes)])
+
+    # 之后的周期逐个筛选候选规律，任一写入没有可用规律时停止
+    k = 2
+    while i + (k + 1) * m <= n:
+        narrowed = []
+        for j, (time, writes) in enumerate(body):
+            step_time, step_writes = steps[i + k * m + j]
+            if step_time - time != k * period or len(step_writes) != len(writes):
+                break
+            step_candidates = []
+            for (pin, v0), (step_pin, value), patterns in zip(writes, step_writes, candidates[j]):
+                kept = [pt for pt in patterns if step_pin == pin and _pattern_value(v0, pt, k) == value]
+                if not kept:
+                    break
+                step_candidates.append(kept)
+            else:
+                narrowed.append(step_candidates)
+                continue
+            break
+        if len(narrowed) != m:
+            break
+        candidates = narrowed
+        k += 1
+    return k, period, [[patterns[0] for patterns in step] for step in candidates]
+
+def fold_periodic_steps(steps):
+    """将重复的时间与数值模式折叠为StepLoop，其余步原样保留；t=0步不参与折叠"""
+    steps = list(steps)
+    folded = steps[:1]
+    i = 1
+    n = len(steps)
+    while i < n:
+        best = None
+        for m in range(1, FOLD_MAX_BODY + 1):
+            if i + m * FOLD_MIN_REPEAT > n:
+                break
+            # 已找到的周期的整数倍只会重复覆盖同一段激励
+            if best is not None and m % len(best.body) == 0:
+                continue
+            count, period, patterns = _match_period(steps, i, m)
+            if count >= FOLD_MIN_REPEAT and (best is None or count * m > best.count * len(best.body)):
+                best = StepLoop(count, period, steps[i:i + m], patterns)
+        if best is None:
+            folded.append(steps[i])
+            i += 1
+        else:
+            folded.append(best)
+            i += best.count * len(best.body)
+    return folded
+
+def _pattern_expr(v0, pattern):
+    """生成循环体中第stim_i个周期的值表达式"""
+    kind, stride = pattern
+    if kind == 'add':
+        if stride == 0:
+            return format_value(v0)
+        step = "stim_i" if abs(stride) == 1 else f"stim_i * {format_value(abs(stride))}"
+        if v0 == 0:
+            return step
+        return f"{format_value(v0)} {'+' if stride > 0 else '-'} {step}"
+    op = '<<' if kind == 'shl' else '>>'
+    shift = "stim_i" if stride == 1 else f"stim_i * {stride}"
+    return f"((vluint64_t){format_value(v0)} {op} ({shift}))"
+
+def generate_block_code(steps, pin_names, enable_macro, end_macro, time_offset="", stim_begin=None):
+    """生成块宏的代码行，steps可包含StepLoop，time_offset为每个时间点追加的偏移表达式，
+    stim_begin非空时先启动激励引擎的对应分区（运行时生成器）"""
     lines = []
-    
-    # 添加ENABLE_FOREVER_BLOCK检查
-    lines.append("    if (!ENABLE_FOREVER_BLOCK)")
+
+    # 添加ENABLE检查
+    lines.append(f"    if (!{enable_macro})")
     lines.append("        break;")
-    
-    if not events:
-        # 如果没有事件，直接STEP到周期时间
-        lines.append("    VERILATOR_STEP_AND_EVAL_UNTIL(FOREVER_BLOCK_CYCLE + T_start);")
-        return lines
-    
-    # 获取所有引脚
-    pins = set()
-    for event in events:
-        pins.add(event['pin'])
-    
-    # t=0时的显式赋值
-    zero_time_assignments = {}
-    for event in events:
-        if event['time'] == '0':
-            zero_time_assignments[event['pin']] = event['value']
-    
-    # 为t=0时未显式赋值的引脚赋值为0
-    for pin in pins:
-        if pin not in zero_time_assignments:
-            lines.append(f"    VERILATOR_SWITCH_INPUT_TO({pin}, 0);")
-    
-    # 添加t=0时的显式赋值
-    for pin, value in zero_time_assignments.items():
-        lines.append(f"    VERILATOR_SWITCH_INPUT_TO({pin}, {value});")
-    
-    # 按时间顺序处理事件（排除t=0）
-    non_zero_events = [e for e in events if e['time'] != '0']
-    
-    if non_zero_events:
-        # 按时间分组
-        time_events = defaultdict(list)
-        for event in non_zero_events:
-            time_events[event['time']].append(event)
-        
-        # 获取所有时间并排序
-        times = list(time_events.keys())
+    if stim_begin:
+        lines.append(f"    VERILATOR_STIM_BEGIN({stim_begin});")
+
+    for step in steps:
+        if isinstance(step, StepLoop):
+            lines.append(f"    for (vluint64_t stim_i = 0; stim_i < {step.count}; stim_i++)")
+            lines.append("    {")
+            for (time, writes), patterns in zip(step.body, step.patterns):
+                lines.append(f"        VERILATOR_STEP_AND_EVAL_UNTIL({time} + stim_i * {step.period}{time_offset});")
+                for (pin, value), pattern in zip(writes, patterns):
+                    lines.append(f"        VERILATOR_SWITCH_INPUT_TO({pin_names[pin]}, {_pattern_expr(value, pattern)});")
+            lines.append("    }")
+            continue
+        time, writes = step
+        # STEP到当前时间（t=0无需STEP）
+        if time:
+            lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL({time}{time_offset});")
+        for pin, value in writes:
+            lines.append(f"    VERILATOR_SWITCH_INPUT_TO({pin_names[pin]}, {format_value(value)});")
+
+    # 最后执行STEP到块结束时间
+    lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL({end_macro}{time_offset});")
+    return lines
+
+def generate_player_block_code(section, enable_macro, end_macro, base="0", time_offset=""):
+    """二进制激励模式下的块宏代码：从播放器的对应分区开始，事件在步进循环中按时间施加"""
+    return [
+        f"    if (!{enable_macro})",
+        "        break;",
+        f"    VERILATOR_STIM_BEGIN({section}, {base});",
+        f"    VERILATOR_STEP_AND_EVAL_UNTIL({end_macro}{time_offset});",
+    ]
+
+def collect_generator_values(*generator_lists):
+    """为repeat生成器分配共享取值表，回填各生成器的a(偏移)与b(长度)，返回取值表"""
+    values = []
+    for generators in generator_lists:
+        for gen in generators:
+            if gen.kind == GENERATOR_KINDS['repeat']:
+                gen.a, gen.b = len(values), len(gen.values)
+                values.extend(gen.values)
+    return values
+
+def write_binary_stimulus(output_path, pin_names, initial_steps, forever_steps,
+                          initial_generators=(), forever_generators=(), expects=None, checkpoint_key=0):
+    """流式写出二进制激励文件，initial_steps/forever_steps为iter_block_steps形式的迭代器，
+    内容与已有文件相同时不替换，返回(各块记录数, 是否写入)"""
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    expects = expects if expects is not None else ExpectStore()
+    table = bytearray()
+    for name in chain(pin_names, expects.signal_names):
+        encoded = name.encode()
+        table += struct.pack('<I', len(encoded)) + encoded
+    table += bytes(-(STIM_HEADER.size + len(table)) % 8)
+    records_offset = STIM_HEADER.size + len(table)
+    values = collect_generator_values(initial_generators, forever_generators)
+
+    counts = []
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        # 各区的数量与偏移在写完后回填
+        f.write(bytes(STIM_HEADER.size))
+        f.write(table)
+        for steps in (initial_steps, forever_steps):
+            count = 0
+            batch = bytearray()
+            for time, writes in steps:
+                for pin, value in writes:
+                    batch += STIM_RECORD.pack(time, value, pin, 0)
+                    count += 1
+                    if count % STIM_BATCH == 0:
+                        f.write(batch)
+                        batch.clear()
+            f.write(batch)
+            counts.append(count)
+
+        generators_offset = f.tell()
+        for gen in chain(initial_generators, forever_generators):
+            f.write(STIM_GENERATOR.pack(gen.start, gen.period, gen.count, gen.a, gen.b, gen.pin, gen.kind))
+        values_offset = f.tell()
+        f.write(struct.pack(f'<{len(values)}Q', *values))
+        expects_offset = f.tell()
+        for time, signal, value, mask, line in expects:
+            f.write(STIM_EXPECT.pack(time, value, mask, signal, line))
+
+        f.seek(0)
+        f.write(STIM_HEADER.pack(STIM_MAGIC, STIM_VERSION, len(pin_names), counts[0], counts[1], records_offset,
+                                 len(initial_generators), len(forever_generators), generators_offset,
+                                 len(values), values_offset,
+                                 len(expects.signal_names), 0, len(expects), expects_offset, checkpoint_key))
+    return counts, replace_if_changed(temp_path, output_path)
+
+def generator_rows(generators, pin_names):
+    """生成器表的X宏参数行：引脚、种类、起始时间、周期、次数、参数a、参数b"""
+    return [f"X({pin_names[gen.pin]}, {GENERATOR_MACROS[gen.kind]}, {gen.start}, {gen.period}, {gen.count}, "
+            f"{format_value(gen.a)}, {format_value(gen.b)})" for gen in generators]
+
+def expect_rows(expects):
+    """期望表的X宏参数行：时间、信号、期望值、掩码、CSV行号"""
+    return [f"X({time}, {expects.signal_names[signal]}, {format_value(value)}, {format_value(mask)}, {line})"
+            for time, signal, value, mask, line in expects]
+
+def generate_stim_tables(pin_names, initial_generators=(), forever_generators=(), expects=None, expect_table=True,
+                         checkpoint_key=None, quiescence_start=None):
+    """生成激励引擎使用的X宏：引脚表、两个块的生成器表、repeat生成器的取值表以及期望值检查表；
+    expect_table为False时只生成期望信号表，期望值由二进制激励文件提供"""
+    content = "\n#define VERILATOR_STIM_PINS(X) \\\n"
+    content += " \\\n".join(f"    X({pin})" for pin in pin_names) + "\n"
+
+    if checkpoint_key is not None:
+        content += f"\n#define CHECKPOINT_KEY {checkpoint_key:#018x}ULL\n"
+    if quiescence_start is not None:
+        content += f"#define QUIESCENCE_START {quiescence_start}\n"
+
+    if expects is not None and expects.signal_names:
+        content += "\n#define VERILATOR_EXPECT_SIGNALS(X) \\\n"
+        content += " \\\n".join(f"    X({signal})" for signal in expects.signal_names) + "\n"
+        if expect_table and len(expects):
+            content += "\n#define VERILATOR_EXPECTS(X) \\\n"
+            content += " \\\n".join(f"    {row}" for row in expect_rows(expects)) + "\n"
+
+    values = collect_generator_values(initial_generators, forever_generators)
+    for macro, generators in (('VERILATOR_INITIAL_GENERATORS', initial_generators),
+                              ('VERILATOR_FOREVER_GENERATORS', forever_generators)):
+        if not generators:
+            continue
+        content += f"\n#define {macro}(X) \\\n"
+        content += " \\\n".join(f"    {row}" for row in generator_rows(generators, pin_names)) + "\n"
+    if values:
+        content += "\n#define VERILATOR_STIM_GENERATOR_VALUES " + ", ".join(format_value(v) for v in values) + ",\n"
+    return content
+
+def generate_initial_block_code(steps, pin_names, config, with_generators=False):
+    """生成VERILATOR_MAIN_INITIAL_BLOCK宏的代码"""
+    return generate_block_code(steps, pin_names, 'ENABLE_INITIAL_BLOCK', 'INITIAL_BLOCK_MAX_STIMULATE_TIME',
+                               stim_begin='STIM_SECTION_INITIAL, 0' if with_generators else None)
+
+def generate_forever_block_code(steps, pin_names, config, with_generators=False):
+    """生成VERILATOR_MAIN_FOREVER_BLOCK宏的代码"""
+    return generate_block_code(steps, pin_names, 'ENABLE_FOREVER_BLOCK', 'FOREVER_BLOCK_CYCLE', ' + T_start',
+                               stim_begin='STIM_SECTION_FOREVER, T_start' if with_generators else None)
+
+def write_if_changed(output_path, content):
+    """按归一化内容的哈希写出生成的头文件，哈希记录在首行；内容未变化时保留原文件及其mtime，返回是否写入"""
+    normalized = "\n".join(line.rstrip() for line in content.splitlines()) + "\n"
+    stamp = f"// content-hash: {hashlib.sha256(normalized.encode()).hexdigest()[:16]}\n"
+    if os.path.exists(output_path):
+        with open(output_path, 'r') as f:
+            if f.readline() == stamp:
+                return False
+    temp_path = output_path + ".tmp"
+    with open(temp_path, 'w') as f:
+        f.write(stamp + normalized)
+    os.replace(temp_path, output_path)
+    return True
+
+def replace_if_changed(temp_path, output_path):
+    """用temp_path替换output_path，两者内容哈希相同时丢弃temp_path，返回是否替换"""
+    def digest(path):
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.digest()
+
+    if (os.path.exists(output_path) and os.path.getsize(output_path) == os.path.getsize(temp_path)
+            and digest(output_path) == digest(temp_path)):
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, output_path)
+    return True
+
+def parse_trace_windows(text):
+    """解析波形采集窗口，例如 "100-200 500-"，返回按起点排序并合并重叠后的[(起点, 终点)]，终点为None表示直到仿真结束"""
+    windows = []
+    for item in re.split(r"[\s,;]+", text.strip()):
+        if not item:
+            continue
+        start, sep, stop = item.partition('-')
         try:
-            times.sort(key=lambda x: int(x))
+            start = int(start)
+            stop = int(stop) if stop else None
         except ValueError:
-            times.sort()
-        
-        # 处理每个时间点的事件
-        current_time = '0'
-        for time in times:
-            # STEP到当前时间
-            if current_time != time:
-                lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL({time} + T_start);")
-                current_time = time
-            
-            # 添加该时间点的所有赋值
-            for event in time_events[time]:
-                
-                lines.append(f"    VERILATOR_SWITCH_INPUT_TO({event['pin']}, {event['value']});")
-    
-    # 最后执行STEP到FOREVER_BLOCK_CYCLE
-    max_time = config.get('FOREVER_BLOCK_CYCLE', '20')
-    if 'current_time' in locals() and current_time != max_time:
-        lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL(FOREVER_BLOCK_CYCLE + T_start);")
-    else:
-        lines.append(f"    VERILATOR_STEP_AND_EVAL_UNTIL(FOREVER_BLOCK_CYCLE + T_start);")
-    
+            raise ValueError(f"无法识别的波形窗口 '{item}'，格式应为 起点-终点 或 起点-")
+        if not sep or (stop is not None and stop <= start):
+            raise ValueError(f"无法识别的波形窗口 '{item}'，格式应为 起点-终点 或 起点-")
+        windows.append((start, stop))
+    merged = []
+    for start, stop in sorted(windows):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1]):
+            last = merged[-1][1]
+            merged[-1] = (merged[-1][0], None if last is None or stop is None else max(last, stop))
+        else:
+            merged.append((start, stop))
+    return merged
+
+def generate_trace_config(config):
+    """把波形采集相关的配置转换为sim_config.h中的宏，返回宏定义行；配置无效时抛出ValueError
+
+    trace windows          -> VERILATOR_TRACE_WINDOWS(X)，X(起点, 终点)
+    trace trigger          -> TRACE_TRIGGER_CONDITION，例如 "io_c == 3"
+    trace trigger duration -> TRACE_TRIGGER_DURATION，触发后记录的时长，0表示直到仿真结束
+    trace depth            -> TRACE_DEPTH
+    trace include scopes   -> VERILATOR_TRACE_SCOPES(X)，只记录这些层次
+    """
+    lines = []
+    if config.get('TRACE_WINDOWS', '').strip():
+        windows = parse_trace_windows(config['TRACE_WINDOWS'])
+        lines.append("#define VERILATOR_TRACE_WINDOWS(X) " + " ".join(
+            f"X({start}, {'UINT64_MAX' if stop is None else stop})" for start, stop in windows))
+
+    trigger = config.get('TRACE_TRIGGER', '').strip()
+    if trigger:
+        match = TRACE_TRIGGER_PATTERN.match(trigger)
+        if not match:
+            raise ValueError(f"无法识别的波形触发条件 '{trigger}'，格式应为 信号 比较符 值，例如 io_c == 3")
+        signal, op, value = match.groups()
+        lines.append(f"#define TRACE_TRIGGER_CONDITION (top->{signal} {op} {format_value(parse_value(value))})")
+
+    for key in ('TRACE_TRIGGER_DURATION', 'TRACE_DEPTH'):
+        value = config.get(key, '').strip()
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"{key} 的值 '{value}' 不是有效的非负整数")
+            lines.append(f"#define {key} {value}")
+
+    scopes = config.get('TRACE_INCLUDE_SCOPES', '').split()
+    if scopes:
+        lines.append("#define VERILATOR_TRACE_SCOPES(X) " + " ".join(f'X("{scope}")' for scope in scopes))
     return lines
 
-def generate_sim_config_h(config, initial_lines, forever_lines, output_path):
-    """生成sim_config.h文件"""
+def load_trace_scope_file(path):
+    """读取波形层次列表文件（可由wave_activity.py --emit生成），每行为 include 层次 或 exclude 层次，#开始注释
+
+    返回(include层次列表, exclude层次列表)，格式错误时抛出ValueError
+    """
+    includes, excludes = [], []
+    try:
+        with open(path, 'r') as f:
+            for line_num, line in enumerate(f, 1):
+                words = line.split('#')[0].split()
+                if not words:
+                    continue
+                if len(words) != 2 or words[0] not in ('include', 'exclude'):
+                    raise ValueError(f"{path}第{line_num}行: 格式应为 include 层次 或 exclude 层次")
+                (includes if words[0] == 'include' else excludes).append(words[1])
+    except OSError as e:
+        raise ValueError(f"无法读取波形层次列表 {path}: {e.strerror}") from None
+    return includes, excludes
+
+def merge_trace_scope_file(config, csv_path):
+    """把trace scope file中的层次追加到trace include/exclude scopes，相对路径以CSV所在目录为基准"""
+    scope_file = config.get('TRACE_SCOPE_FILE', '').strip()
+    if not scope_file:
+        return
+    includes, excludes = load_trace_scope_file(os.path.join(os.path.dirname(os.path.abspath(csv_path)), scope_file))
+    for key, scopes in (('TRACE_INCLUDE_SCOPES', includes), ('TRACE_EXCLUDE_SCOPES', excludes)):
+        if scopes:
+            config[key] = ' '.join(config.get(key, '').split() + scopes)
+
+def generate_sim_trace_vlt(config, output_path):
+    """生成Verilator配置文件，trace exclude scopes中的层次在Verilator转换时即关闭波形跟踪"""
+    content = "`verilator_config\n"
+    for scope in config.get('TRACE_EXCLUDE_SCOPES', '').split():
+        content += f'tracing_off -scope "{scope}"\n'
+    return content, write_if_changed(output_path, content)
+
+def format_checkpoint_mode(value):
+    """检查点模式格式化为C字符串字面量，值无效时抛出ValueError"""
+    mode = value.strip().lower()
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError(f"checkpoint mode 的值 '{value}' 无效，可选 {'/'.join(CHECKPOINT_MODES)}")
+    return f'"{mode}"'
+
+def generate_sim_config_h(config, output_path):
+    """生成sim_config.h文件，只包含配置宏"""
     content = """#ifndef __SIM_CONFIG__
 #define __SIM_CONFIG__
 #include "sim_main.h"
@@ -341,27 +1087,44 @@ def generate_sim_config_h(config, initial_lines, forever_lines, output_path):
                 content += f"#define {macro} {value}\n"
 
     # 添加其他宏（按字母顺序排序）
-    other_macros = sorted([k for k in config.keys() if k not in preferred_order])
+    other_macros = sorted([k for k in config.keys()
+                           if k not in preferred_order and k not in TRACE_CONFIG_KEYS and k != 'QUIESCENCE_SIGNALS'])
     for macro in other_macros:
-        content += f"#define {macro} {config[macro]}\n"
-
-    # 确保必要的宏存在
-    required_macros = {
-        'ENABLE_LIMIT_TIME_STIMULATION': '1',
-        'MAX_TIME_SIM': '20',
-        'HALF_CLK_CYCLE': '2',
-        'ENABLE_CLK_INPUT': '0',
-        'CLK_PIN_NAME': 'clk',
-        'ENABLE_INITIAL_BLOCK': '1',
-        'INITIAL_BLOCK_MAX_STIMULATE_TIME': '20',
-        'ENABLE_FOREVER_BLOCK': '0',
-        'FOREVER_BLOCK_CYCLE': '20'
-    }
-
-    for macro, default in required_macros.items():
+        value = format_checkpoint_mode(config[macro]) if macro == 'CHECKPOINT_MODE' else config[macro]
+        content += f"#define {macro} {value}\n"
+
+    # 静止检测观察的输出信号，未设置时观察期望信号
+    quiescence_signals = config.get('QUIESCENCE_SIGNALS', '').split()
+    if quiescence_signals:
+        content += "\n#define VERILATOR_QUIESCENCE_SIGNALS(X) " + " ".join(f"X({s})" for s in quiescence_signals) + "\n"
+
+    # 波形采集窗口、触发条件与层次
+    trace_lines = generate_trace_config(config)
+    if trace_lines:
+        content += "\n" + "\n".join(trace_lines) + "\n"
+
+    # 确保必要的宏存在；激励库中每个testbench独立的配置由sim_main.h映射到所选testbench，
+    # 时钟引脚只在有testbench使用时钟时定义
+    library = config.get('ENABLE_TESTBENCH_LIBRARY') == '1'
+    for macro, default in REQUIRED_MACROS.items():
+        if library and (macro in TESTBENCH_CONFIG_KEYS or macro == 'CLK_PIN_NAME'):
+            continue
         if macro not in config:
             content += f"#define {macro} {default}\n"
 
+    content += "\n#endif //__SIM_CONFIG__\n"
+    return content, write_if_changed(output_path, content)
+
+def generate_sim_stimulus_h(initial_lines, forever_lines, output_path, stim_tables=""):
+    """生成sim_stimulus.h文件，包含激励引擎X宏（stim_tables）与INITIAL/FOREVER块宏"""
+    content = """#ifndef __SIM_STIMULUS__
+#define __SIM_STIMULUS__
+#include "sim_config.h"
+"""
+
+    # 添加激励引擎的引脚表与生成器表
+    content += stim_tables
+
     # 添加INITIAL_BLOCK宏
     content += "\n#define VERILATOR_MAIN_INITIAL_BLOCK()                                   \\\n"
     content += "    do                                                                   \\\n"
@@ -399,120 +1162,321 @@ def generate_sim_config_h(config, initial_lines, forever_lines, output_path):
         content += "        VERILATOR_STEP_AND_EVAL_UNTIL(FOREVER_BLOCK_CYCLE + T_start) \\\n"
     
     content += "    } while (1)\n"
-    
-    content += "\n#endif //__SIM_CONFIG__\n"
-    
-    # 写入文件
-    with open(output_path, 'w') as f:
-        f.write(content)
-    
-    return content
+
+    content += "\n#endif //__SIM_STIMULUS__\n"
+    return content, write_if_changed(output_path, content)
+
+def format_x_macro(head, rows):
+    """格式化每行一项的宏定义，rows为空时宏展开为空"""
+    if not rows:
+        return f"\n#define {head}\n"
+    return f"\n#define {head} \\\n" + " \\\n".join(f"    {row}" for row in rows) + "\n"
+
+def generate_library_stimulus_h(testbenches, pin_names, signal_names, output_path):
+    """生成激励库模式的sim_stimulus.h：共享的引脚表与期望信号表、testbench列表，以及每个testbench
+    带名字后缀的生成器表、取值表、期望表、检查点标识与INITIAL/FOREVER块宏，由sim_main.cpp展开为各自的函数
+
+    testbenches为[(名字, CSV路径, 配置值, 生成器列表对, 期望值, 检查点标识, 静止检测起点, INITIAL代码行, FOREVER代码行)]
+    """
+    content = """#ifndef __SIM_STIMULUS__
+#define __SIM_STIMULUS__
+#include "sim_config.h"
+"""
+    content += format_x_macro("VERILATOR_STIM_PINS(X)", [f"X({pin})" for pin in pin_names])
+    if signal_names:
+        content += format_x_macro("VERILATOR_EXPECT_SIGNALS(X)", [f"X({signal})" for signal in signal_names])
+    content += format_x_macro("VERILATOR_TESTBENCHES(X)",
+                              [f"X({name}, {', '.join(values)})" for name, _, values, *_ in testbenches])
+
+    for name, csv_path, _, (tb_pins, initial_generators, forever_generators), expects, checkpoint_key, \
+            quiescence, initial_lines, forever_lines in testbenches:
+        content += f"\n// {name}: {os.path.basename(csv_path)}\n"
+        content += f"#define CHECKPOINT_KEY_{name} {checkpoint_key:#018x}ULL\n"
+        content += f"#define QUIESCENCE_START_{name} {format_quiescence_start(quiescence)}\n"
+        values = collect_generator_values(initial_generators, forever_generators)
+        content += format_x_macro(f"VERILATOR_INITIAL_GENERATORS_{name}(X)", generator_rows(initial_generators, tb_pins))
+        content += format_x_macro(f"VERILATOR_FOREVER_GENERATORS_{name}(X)", generator_rows(forever_generators, tb_pins))
+        content += f"\n#define VERILATOR_STIM_GENERATOR_VALUES_{name}" + "".join(f" {format_value(v)}," for v in values) + "\n"
+        content += format_x_macro(f"VERILATOR_EXPECTS_{name}(X)", expect_rows(expects))
+        content += format_x_macro(f"VERILATOR_TESTBENCH_INITIAL_{name}()",
+                                  ["do", "{", *(f"    {line}" for line in initial_lines), "} while (0)"])
+        content += format_x_macro(f"VERILATOR_TESTBENCH_FOREVER_{name}()",
+                                  ["vluint64_t T_start;", "do", "{", "    T_start = T;",
+                                   *(f"    {line}" for line in forever_lines), "} while (1)"])
+
+    content += "\n#endif //__SIM_STIMULUS__\n"
+    return content, write_if_changed(output_path, content)
+
+def check_config(config):
+    """先检查波形、检查点与静止检测配置，避免写出一半输出后才发现配置错误"""
+    generate_trace_config(config)
+    if 'CHECKPOINT_MODE' in config:
+        format_checkpoint_mode(config['CHECKPOINT_MODE'])
+    if not config.get('QUIESCENCE_CYCLES', '0').strip().isdigit():
+        raise ValueError(f"quiescence cycles 的值 '{config['QUIESCENCE_CYCLES']}' 不是有效的非负整数")
+    for signal in config.get('QUIESCENCE_SIGNALS', '').split():
+        if not signal.isidentifier():
+            raise ValueError(f"quiescence signals 中的 '{signal}' 不是有效的信号名")
+
+def load_testbench(csv_path, config_h_path=None, binary=False):
+    """解析并校验单个testbench CSV，返回(配置, 排序后的INITIAL事件, 排序后的FOREVER事件, 排序后的期望值)
+
+    config_h_path为已有配置的来源（None表示不合并），校验失败时抛出ValueError
+    """
+    # 解析CSV文件
+    csv_config, initial_events, forever_events, expects = parse_testbench_csv(csv_path)
+
+    # 解析现有配置（如果有）
+    existing_config = parse_sim_config_h(config_h_path)
+    if '__SIM_CONFIG__' in existing_config:
+        del existing_config['__SIM_CONFIG__']
+    # 合并配置（CSV中的配置优先级更高）
+    config = {**existing_config, **csv_config}
+    config['ENABLE_BINARY_STIMULUS'] = '1' if binary else '0'
+    merge_trace_scope_file(config, csv_path)
+    check_config(config)
+    resolve_auto_bounds(config, initial_events, forever_events, expects)
+
+    # 验证和排序INITIAL事件
+    try:
+        sorted_initial_events = validate_and_sort_events(
+            initial_events, 
+            'INITIAL_BLOCK_MAX_STIMULATE_TIME', 
+            config, 
+            'INITIAL'
+        )
+        print(f"\n验证后保留 {len(sorted_initial_events)} 个INITIAL事件")
+    except ValueError as e:
+        raise ValueError(f"INITIAL事件: {e}") from e
+
+    # 验证和排序FOREVER事件
+    try:
+        sorted_forever_events = validate_and_sort_events(
+            forever_events, 
+            'FOREVER_BLOCK_CYCLE', 
+            config, 
+            'FOREVER'
+        )
+        print(f"验证后保留 {len(sorted_forever_events)} 个FOREVER事件")
+    except ValueError as e:
+        raise ValueError(f"FOREVER事件: {e}") from e
+
+    # 验证和排序期望值
+    expects = validate_and_sort_expects(expects, config)
+    if len(expects):
+        print(f"验证后保留 {len(expects)} 个EXPECT期望")
+    return config, sorted_initial_events, sorted_forever_events, expects
+
+def block_steps(events, generator_pins, optimize=True):
+    """块内的步序列：消除冗余写入并合并空步（optimize为False时保持原样）"""
+    steps = iter_block_steps(events)
+    if optimize:
+        steps = eliminate_redundant_writes(steps, generator_pins)
+    return steps
+
+def write_outputs(config, pin_names, initial_steps, forever_steps, output_path, stimulus_path, binary_path=None,
+                  optimize=True, trace_path=None, initial_generators=(), forever_generators=(), expects=None,
+                  checkpoint_key=0, quiescence_start=None):
+    """由两个块的步序列生成sim_config.h、sim_stimulus.h、sim_trace.vlt以及可选的二进制激励文件
+
+    initial_steps/forever_steps为iter_block_steps形式的迭代器；二进制模式下流式写出，内存占用与步数无关，
+    否则周期性激励折叠为循环后展开为块宏。quiescence_start为静止检测的起点（None表示不检测），
+    二进制模式下由仿真程序根据激励文件计算。返回{输出文件路径: 是否写入}
+    """
+    expects = expects if expects is not None else ExpectStore()
+    written = {}
+    if binary_path:
+        # 激励写入二进制文件，块宏只负责驱动播放器
+        counts, written[binary_path] = write_binary_stimulus(binary_path, pin_names, initial_steps, forever_steps,
+                                                             initial_generators, forever_generators, expects,
+                                                             checkpoint_key)
+        print(f"二进制激励写入 {binary_path}: INITIAL {counts[0]} 条, FOREVER {counts[1]} 条记录")
+        initial_lines = generate_player_block_code(
+            'STIM_SECTION_INITIAL', 'ENABLE_INITIAL_BLOCK', 'INITIAL_BLOCK_MAX_STIMULATE_TIME')
+        forever_lines = generate_player_block_code(
+            'STIM_SECTION_FOREVER', 'ENABLE_FOREVER_BLOCK', 'FOREVER_BLOCK_CYCLE', 'T_start', ' + T_start')
+        stim_tables = generate_stim_tables(pin_names, expects=expects, expect_table=False)
+    else:
+        # 周期性激励折叠为循环
+        if optimize:
+            initial_steps = fold_periodic_steps(initial_steps)
+            forever_steps = fold_periodic_steps(forever_steps)
+
+        # 生成INITIAL_BLOCK宏代码
+        with_generators = bool(initial_generators or forever_generators)
+        initial_lines = generate_initial_block_code(initial_steps, pin_names, config, with_generators)
+
+        # 生成FOREVER_BLOCK宏代码
+        forever_lines = generate_forever_block_code(forever_steps, pin_names, config, with_generators)
+        stim_tables = generate_stim_tables(pin_names, initial_generators, forever_generators, expects,
+                                           checkpoint_key=checkpoint_key,
+                                           quiescence_start=format_quiescence_start(quiescence_start))
+
+    # 配置与激励分别生成，内容未变化的文件不会被改写
+    _, written[output_path] = generate_sim_config_h(config, output_path)
+    trace_path = trace_path or os.path.join(os.path.dirname(output_path), "sim_trace.vlt")
+    _, written[trace_path] = generate_sim_trace_vlt(config, trace_path)
+    _, written[stimulus_path] = generate_sim_stimulus_h(initial_lines, forever_lines, stimulus_path, stim_tables)
+    return written
+
+def convert_testbench(csv_path, output_path, stimulus_path, binary_path=None, config_h_path=None, optimize=True,
+                      trace_path=None):
+    """将testbench CSV转换为sim_config.h、sim_stimulus.h、sim_trace.vlt以及可选的二进制激励文件
+
+    config_h_path为已有配置的来源（None表示不合并），trace_path默认与sim_config.h同目录，校验失败时抛出ValueError。
+    返回(配置字典, {输出文件路径: 是否写入})
+    """
+    config, sorted_initial_events, sorted_forever_events, expects = load_testbench(csv_path, config_h_path,
+                                                                                   bool(binary_path))
+
+    checkpoint_key = initial_checkpoint_key(sorted_initial_events, config)
+    quiescence = quiescence_start(config, sorted_initial_events, sorted_forever_events, expects)
+
+    # 激励优化：消除冗余写入并合并空步
+    pin_names = sorted_initial_events.pin_names
+    initial_generators = sorted_initial_events.generators
+    forever_generators = sorted_forever_events.generators
+    generator_pins = {gen.pin for gen in initial_generators + forever_generators}
+    initial_steps = block_steps(sorted_initial_events, generator_pins, optimize)
+    forever_steps = block_steps(sorted_forever_events, generator_pins, optimize)
+
+    written = write_outputs(config, pin_names, initial_steps, forever_steps, output_path, stimulus_path, binary_path,
+                            optimize, trace_path, initial_generators, forever_generators, expects, checkpoint_key,
+                            quiescence)
+    return config, written
+
+def testbench_name(csv_path):
+    """激励库中testbench的名字：CSV文件名去掉扩展名，非标识符字符替换为下划线，运行时以+tb=名字选择"""
+    return re.sub(r"\W", "_", os.path.splitext(os.path.basename(csv_path))[0])
+
+def testbench_config_values(config):
+    """按TESTBENCH_CONFIG_KEYS的顺序返回每个testbench独立的配置值，不是非负整数时抛出ValueError"""
+    values = []
+    for key in TESTBENCH_CONFIG_KEYS:
+        value = config.get(key, REQUIRED_MACROS[key]).strip()
+        if not value.isdigit():
+            raise ValueError(f"{key} 的值 '{value}' 不是有效的非负整数")
+        values.append(value)
+    if int(config.get('HALF_CLK_CYCLE', REQUIRED_MACROS['HALF_CLK_CYCLE'])) == 0:
+        raise ValueError("HALF_CLK_CYCLE 不能为0")
+    return values
+
+def convert_library(csv_paths, output_path, stimulus_path, optimize=True, trace_path=None):
+    """将多个testbench CSV编译为同一个激励库，仿真程序运行时以+tb=名字选择，未指定时使用第一个
+
+    每个testbench的激励块、生成器表、期望表、检查点标识与TESTBENCH_CONFIG_KEYS中的配置相互独立；
+    波形采集、检查点模式等编译期配置取自第一个CSV，与之不同时给出警告，使用时钟的testbench必须使用
+    同一个时钟引脚。校验失败时抛出ValueError，返回(生成sim_config.h所用的配置, {输出文件路径: 是否写入})
+    """
+    if not csv_paths:
+        raise ValueError("激励库至少需要一个testbench CSV")
+    testbenches = []
+    pin_names, signal_names = [], []
+    clock_pins = set()
+    shared = None
+    for csv_path in csv_paths:
+        name = testbench_name(csv_path)
+        if any(tb[0] == name for tb in testbenches):
+            raise ValueError(f"激励库中存在同名的testbench '{name}'（{csv_path}）")
+        print(f"\n[{name}] {csv_path}")
+        try:
+            config, initial_events, forever_events, expects = load_testbench(csv_path)
+            values = testbench_config_values(config)
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from e
+
+        if shared is None:
+            shared = config
+        for key in sorted(set(config) | set(shared)):
+            if key in TESTBENCH_CONFIG_KEYS or key in ('CLK_PIN_NAME', 'AUTO_SETTLE_MARGIN'):
+                continue
+            if config.get(key) != shared.get(key):
+                print(f"警告: {name} 的 {key} 与 {testbenches[0][0]} 不同，激励库使用 {testbenches[0][0]} 的设置")
+        if config.get('ENABLE_CLK_INPUT', REQUIRED_MACROS['ENABLE_CLK_INPUT']).strip() == '1':
+            clock_pins.add(config.get('CLK_PIN_NAME', REQUIRED_MACROS['CLK_PIN_NAME']).strip())
+
+        checkpoint_key = initial_checkpoint_key(initial_events, config)
+        quiescence = quiescence_start(config, initial_events, forever_events, expects)
+        initial_generators = initial_events.generators
+        forever_generators = forever_events.generators
+        generator_pins = {gen.pin for gen in initial_generators + forever_generators}
+        initial_steps = block_steps(initial_events, generator_pins, optimize)
+        forever_steps = block_steps(forever_events, generator_pins, optimize)
+        if optimize:
+            initial_steps = fold_periodic_steps(initial_steps)
+            forever_steps = fold_periodic_steps(forever_steps)
+        tb_pins = initial_events.pin_names
+        initial_lines = generate_initial_block_code(initial_steps, tb_pins, config, bool(generator_pins))
+        forever_lines = generate_forever_block_code(forever_steps, tb_pins, config, bool(generator_pins))
+
+        # 引脚与期望信号按名字合并，编译进来的枚举覆盖全部testbench
+        pin_names += [pin for pin in tb_pins if pin not in pin_names]
+        signal_names += [signal for signal in expects.signal_names if signal not in signal_names]
+        testbenches.append((name, csv_path, values, (tb_pins, initial_generators, forever_generators), expects,
+                            checkpoint_key, quiescence, initial_lines, forever_lines))
+
+    if len(clock_pins) > 1:
+        raise ValueError(f"激励库中的testbench使用了不同的时钟引脚 {', '.join(sorted(clock_pins))}，时钟引脚在编译时确定")
+    config = {key: value for key, value in shared.items() if key not in TESTBENCH_CONFIG_KEYS and key != 'CLK_PIN_NAME'}
+    if clock_pins:
+        config['CLK_PIN_NAME'] = clock_pins.pop()
+    config['ENABLE_TESTBENCH_LIBRARY'] = '1'
+    print(f"\n激励库包含 {len(testbenches)} 个testbench: {', '.join(tb[0] for tb in testbenches)}")
+
+    written = {}
+    _, written[output_path] = generate_sim_config_h(config, output_path)
+    trace_path = trace_path or os.path.join(os.path.dirname(output_path), "sim_trace.vlt")
+    _, written[trace_path] = generate_sim_trace_vlt(config, trace_path)
+    _, written[stimulus_path] = generate_library_stimulus_h(testbenches, pin_names, signal_names, stimulus_path)
+    return config, written
 
 def main():
     if len(sys.argv) < 2:
-        print("用法: python csv2c.py testbench.csv [sim_config.h]")
+        print("用法: python csv2c.py testbench.csv [sim_config.h] [--stimulus sim_stimulus.h] [--binary stimulus.stim] [--library 其他CSV ...] [--no-merge]")
         print("说明: 如果提供sim_config.h，将读取其中的配置，否则从CSV提取配置")
-        print("      输出文件为sim_config.h")
+        print("      配置宏输出到sim_config.h，激励块宏输出到同目录的sim_stimulus.h")
+        print("      输出内容未变化时不会重写文件")
+        print("      --binary 将激励写入二进制文件，由仿真程序运行时读取，修改激励无需重新编译")
+        print("      --library 将多个testbench编译为激励库，仿真程序运行时以+tb=名字选择")
         print("\n配置映射关系:")
         for csv_name, macro_name in CONFIG_MAPPING.items():
             print(f"  {csv_name} -> {macro_name}")
         sys.exit(1)
 
     
-    csv_path =sys.argv[1]
-    config_h_path =sys.argv[2] if len(sys.argv) > 2 else None
-    output_path = config_h_path if config_h_path else "include/sim_config.h"
+    parser = argparse.ArgumentParser()
+    parser.add_argument("csv_path")
+    parser.add_argument("config_h_path", nargs="?")
+    parser.add_argument("--stimulus", metavar="STIMULUS_H", help="激励块宏的输出文件，默认为sim_config.h同目录下的sim_stimulus.h")
+    parser.add_argument("--trace-config", metavar="VLT", help="波形层次过滤的Verilator配置文件，默认为sim_config.h同目录下的sim_trace.vlt")
+    parser.add_argument("--binary", metavar="STIM_FILE", help="输出二进制激励文件")
+    parser.add_argument("--no-merge", action="store_true", help="不读取已有sim_config.h中的配置")
+    parser.add_argument("--no-optimize", action="store_true", help="关闭冗余写入消除与循环折叠")
+    parser.add_argument("--library", nargs="*", metavar="CSV",
+                        help="编译为激励库，后跟与csv_path一起编译的其他testbench CSV，仿真程序运行时以+tb=名字选择")
+    args = parser.parse_args()
+    if args.library is not None and args.binary:
+        parser.error("--library与--binary不能同时使用，二进制激励本身已可在运行时切换")
+
+    csv_path = args.csv_path
+    config_h_path = None if args.no_merge else args.config_h_path
+    output_path = args.config_h_path if args.config_h_path else "include/sim_config.h"
+    stimulus_path = args.stimulus or os.path.join(os.path.dirname(output_path), "sim_stimulus.h")
     
     try:
-        # 解析CSV文件
-        csv_config, initial_events, forever_events = parse_testbench_csv(csv_path)
-        """
-        print("从CSV文件解析到的配置:")
-        for key, value in csv_config.items():
-            print(f"  {key}: {value}")
-        
-        """
-        
-        # 解析现有配置（如果有）
-        existing_config = parse_sim_config_h(config_h_path)
-        if '__SIM_CONFIG__' in existing_config:
-            del existing_config['__SIM_CONFIG__']
-        # 合并配置（CSV中的配置优先级更高）
-        config = {**existing_config, **csv_config}
-        """
-        print(config)
-        
-        print(f"\n从CSV文件解析到 {len(initial_events)} 个INITIAL事件:")
-        for event in initial_events:
-            print(f"  时间 {event['time']}: {event['pin']} = {event['value']}")
-        
-        print(f"\n从CSV文件解析到 {len(forever_events)} 个FOREVER事件:")
-        for event in forever_events:
-            print(f"  时间 {event['time']}: {event['pin']} = {event['value']}")
-        
-        if existing_config:
-            print(f"\n从sim_config.h解析到 {len(existing_config)} 个配置项")
-        
-        """
-        
-        
-        # 验证和排序INITIAL事件
-        try:
-            sorted_initial_events = validate_and_sort_events(
-                initial_events, 
-                'INITIAL_BLOCK_MAX_STIMULATE_TIME', 
-                config, 
-                'INITIAL'
-            )
-            print(f"\n验证后保留 {len(sorted_initial_events)} 个INITIAL事件")
-        except ValueError as e:
-            print(f"INITIAL事件验证错误: {e}")
-            sys.exit(1)
-        
-        # 验证和排序FOREVER事件
-        try:
-            sorted_forever_events = validate_and_sort_events(
-                forever_events, 
-                'FOREVER_BLOCK_CYCLE', 
-                config, 
-                'FOREVER'
-            )
-            print(f"验证后保留 {len(sorted_forever_events)} 个FOREVER事件")
-        except ValueError as e:
-            print(f"FOREVER事件验证错误: {e}")
-            sys.exit(1)
-        
-        # 生成INITIAL_BLOCK宏代码
-        initial_lines = generate_initial_block_code(sorted_initial_events, config)
-        
-        # 生成FOREVER_BLOCK宏代码
-        forever_lines = generate_forever_block_code(sorted_forever_events, config)
-        
-        # 生成sim_config.h文件
-        output_content = generate_sim_config_h(config, initial_lines, forever_lines, output_path)
-        """
-        print(f"\n成功生成 {output_path}")
-        print(f"INITIAL_BLOCK生成 {len(initial_lines)} 行代码")
-        print(f"FOREVER_BLOCK生成 {len(forever_lines)} 行代码")
-        
-        # 打印生成的宏内容供检查
-        print("\n生成的VERILATOR_MAIN_INITIAL_BLOCK宏内容预览:")
-        print("#define VERILATOR_MAIN_INITIAL_BLOCK()                                   \\")
-        for line in initial_lines:
-            print(f"    {line}")
-        
-        print("\n生成的VERILATOR_MAIN_FOREVER_BLOCK宏内容预览:")
-        print("#define VERILATOR_MAIN_FOREVER_BLOCK()                               \\")
-        for line in forever_lines:
-            print(f"    {line}")
-        
-        """
-        
+        if args.library is not None:
+            _, written = convert_library([csv_path, *args.library], output_path, stimulus_path,
+                                         not args.no_optimize, args.trace_config)
+        else:
+            _, written = convert_testbench(csv_path, output_path, stimulus_path, args.binary,
+                                           config_h_path, not args.no_optimize, args.trace_config)
         
         # 如果输出目录不是当前目录，显示完整路径
-        full_output_path = os.path.abspath(output_path)
-        if full_output_path != os.path.abspath("."):
-            print(f"\n输出文件位置: {full_output_path}")
+        print()
+        for path, changed in written.items():
+            full_output_path = os.path.abspath(path)
+            if full_output_path != os.path.abspath("."):
+                print(f"输出文件位置: {full_output_path}" + ("" if changed else "（内容未变化）"))
         
     except FileNotFoundError as e:
         print(f"错误: {e}")
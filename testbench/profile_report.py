@@ -0,0 +1,108 @@
+"""
+性能剖析报告：读取ENABLE_PROFILING=1的仿真程序在退出时写出的profile.json
+
+输出每秒仿真时间单位数、各阶段（激励、求值、波形记录、EXPECT检查、NVBOARD刷新与等待）的
+调用次数、耗时、占比与单次耗时，以及每个时间单位平均写出的波形字节数。给出两个文件时以第一个为
+基准对比两次运行。
+
+用法: python testbench/profile_report.py profile.json [基准profile.json]
+"""
+import sys
+import json
+import argparse
+
+PROFILE_VERSION = 1
+PHASE_NAMES = {
+    "stim": "激励",
+    "eval": "求值",
+    "dump": "波形记录",
+    "expect": "EXPECT检查",
+    "nvboard_update": "NVBOARD刷新",
+    "nvboard_wait": "NVBOARD等待",
+}
+
+
+def load_profile(path):
+    """读取并校验剖析文件，补充其他耗时（未计入任何阶段的循环开销）"""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except OSError as e:
+        raise ValueError(f"{path}: {e.strerror}") from None
+    except json.JSONDecodeError as e:
+        raise ValueError(f"{path}: 不是有效的JSON ({e})") from None
+    if profile.get("version") != PROFILE_VERSION:
+        raise ValueError(f"{path}: 不支持的剖析文件版本 {profile.get('version')}")
+    measured = sum(phase["seconds"] for phase in profile["phases"].values())
+    profile["other_seconds"] = max(profile["seconds"] - measured, 0.0)
+    return profile
+
+
+def ticks_per_second(profile):
+    return profile["ticks"] / profile["seconds"] if profile["seconds"] else 0.0
+
+
+def bytes_per_tick(profile):
+    return profile["trace_bytes"] / profile["ticks"] if profile["ticks"] else 0.0
+
+
+def phase_rows(profile):
+    """返回[(阶段名, 调用次数, 耗时)]，跳过未被调用的阶段，最后是其他耗时"""
+    rows = [(PHASE_NAMES.get(name, name), phase["calls"], phase["seconds"])
+            for name, phase in profile["phases"].items() if phase["calls"]]
+    rows.append(("其他", None, profile["other_seconds"]))
+    return rows
+
+
+def print_profile(path, profile):
+    print(f"{path}")
+    print(f"仿真时长 {profile['ticks']}，耗时 {profile['seconds']:.3f}s，{ticks_per_second(profile):.0f} 时长/秒")
+    if profile["trace_bytes"]:
+        print(f"波形 {profile['trace_bytes']} 字节，{bytes_per_tick(profile):.2f} 字节/时长")
+    total = profile["seconds"] or 1.0
+    print(f"\n{'阶段':<12}{'调用次数':>10}{'耗时(s)':>12}{'占比':>8}{'单次(ns)':>12}")
+    for name, calls, seconds in phase_rows(profile):
+        per_call = f"{seconds / calls * 1e9:.1f}" if calls else "-"
+        calls = calls if calls is not None else "-"
+        print(f"{name:<12}{calls:>12}{seconds:>12.6f}{seconds / total:>9.1%}{per_call:>12}")
+
+
+def ratio(new, base):
+    return f"{new / base:.2f}x" if base else "-"
+
+
+def print_comparison(path, profile, base_path, base):
+    print(f"基准 {base_path}\n对比 {path}\n")
+    print(f"{'指标':<14}{'基准':>14}{'对比':>14}{'比例':>9}")
+    metrics = [
+        ("仿真时长", base["ticks"], profile["ticks"], "{:.0f}"),
+        ("耗时(s)", base["seconds"], profile["seconds"], "{:.6f}"),
+        ("时长/秒", ticks_per_second(base), ticks_per_second(profile), "{:.0f}"),
+        ("字节/时长", bytes_per_tick(base), bytes_per_tick(profile), "{:.2f}"),
+    ]
+    base_rows = {name: seconds for name, _, seconds in phase_rows(base)}
+    rows = {name: seconds for name, _, seconds in phase_rows(profile)}
+    for name in list(base_rows) + [name for name in rows if name not in base_rows]:
+        metrics.append((f"{name}(s)", base_rows.get(name, 0.0), rows.get(name, 0.0), "{:.6f}"))
+    for name, a, b, fmt in metrics:
+        print(f"{name:<14}{fmt.format(a):>14}{fmt.format(b):>14}{ratio(b, a):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="显示或对比仿真程序的性能剖析")
+    parser.add_argument("profile", help="剖析文件，默认由仿真程序写到build/profile.json")
+    parser.add_argument("base", nargs="?", help="作为基准的另一份剖析文件，给出时输出对比")
+    args = parser.parse_args()
+    try:
+        profile = load_profile(args.profile)
+        if args.base:
+            print_comparison(args.profile, profile, args.base, load_profile(args.base))
+        else:
+            print_profile(args.profile, profile)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
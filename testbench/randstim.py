@@ -0,0 +1,425 @@
+"""
+约束随机激励：按JSON描述的引脚、位宽、取值分布、变化密度与互斥约束，以固定种子生成按时间排序的激励步，
+直接送入csv2c.py的流式校验与代码生成，不经过CSV文本；--csv可另外导出等价的testbench CSV
+
+描述文件示例:
+    {
+      "seed": 1,
+      "config": {"enable clock input": 1, "clock pin name": "clock", "max stimulate time": 100000000},
+      "initial": {
+        "duration": 100000000,
+        "pins": {
+          "io_a":   {"width": 32},
+          "io_op":  {"width": 3, "choice": [0, 1, 2, "3'b111"], "weights": [4, 1, 1, 2], "every": 8},
+          "io_en":  {"toggle": true, "rate": 0.05, "init": 1, "start": 100},
+          "io_rd":  {"rate": 0.02},
+          "io_wr":  {"range": [0, 1], "interval": [10, 40]}
+        },
+        "exclusive": [["io_rd", "io_wr"]]
+      },
+      "forever": {"duration": 1000, "pins": {...}}
+    }
+
+- config中的配置名与CSV的Configuration块相同；块的duration同时设置对应块的使能与时长
+- 取值分布：默认在位宽内均匀分布，range为闭区间内均匀分布，choice按weights（默认相等）加权选择，
+  toggle每次取反；数值可以是整数或csv2c.py支持的Verilog字面量
+- 变化时刻：rate为每个时间单位发生变化的概率（默认0.1，间隔服从几何分布），every为固定间隔，
+  interval为闭区间内均匀分布的间隔；init为t=0时的值（默认0），start之前不变化
+- exclusive中每组引脚任意时刻至多一个非0：某个引脚变为非0时，同组其他非0的引脚在同一时刻被清0，
+  同一时刻同组的多个引脚变为非0时先处理的引脚生效
+
+各引脚的下一次变化时刻保存在一个小根堆中，逐个时间点产生写入，内存占用只与引脚数量有关。
+配合--binary时激励流式写入二进制文件，数千万个事件也不需要在内存中保存；不使用--binary时
+块宏需要在内存中折叠并展开，只适合较小的规模。
+
+用法: python testbench/randstim.py spec.json [include/sim_config.h] [--binary build/random.stim] [--seed N]
+                                   [--csv random.csv] [--no-merge] [--no-optimize]
+"""
+import os
+import sys
+import csv
+import json
+import math
+import heapq
+import random
+import bisect
+import hashlib
+import argparse
+from itertools import accumulate, zip_longest
+
+import csv2c
+
+BLOCKS = (('initial', 'ENABLE_INITIAL_BLOCK', 'INITIAL_BLOCK_MAX_STIMULATE_TIME'),
+          ('forever', 'ENABLE_FOREVER_BLOCK', 'FOREVER_BLOCK_CYCLE'))
+PIN_KEYS = {'width', 'range', 'choice', 'weights', 'toggle', 'rate', 'every', 'interval', 'init', 'start'}
+DEFAULT_RATE = 0.1
+CSV_HEADER = ['INITIAL', 'Time(ps)', 'Pin', 'Value', 'Note', 'FOREVER', 'Time(ps)', 'Pin', 'Value', 'Note',
+              'Configuration', 'Value', 'Note']
+
+
+def parse_number(value, what):
+    """整数直接使用，字符串按csv2c.py的规则解析（支持Verilog字面量）"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{what} 的值 {value!r} 不是整数或字符串")
+    return value if isinstance(value, int) else csv2c.parse_value(value)
+
+
+class PinSpec:
+    """单个引脚的取值分布与变化时刻规则"""
+    __slots__ = ('name', 'width', 'mask', 'low', 'high', 'choices', 'cum_weights', 'toggle',
+                 'rate', 'every', 'interval', 'init', 'start')
+
+    def __init__(self, name, spec):
+        if not isinstance(spec, dict):
+            raise ValueError(f"引脚 {name} 的描述必须是对象")
+        unknown = set(spec) - PIN_KEYS
+        if unknown:
+            raise ValueError(f"引脚 {name} 包含未知的键: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.width = spec.get('width', 1)
+        if not isinstance(self.width, int) or not 1 <= self.width <= 64:
+            raise ValueError(f"引脚 {name} 的位宽 {self.width!r} 不在1到64之间")
+        self.mask = (1 << self.width) - 1
+
+        # 取值分布
+        self.low, self.high = 0, self.mask
+        self.choices = self.cum_weights = None
+        self.toggle = bool(spec.get('toggle', False))
+        kinds = [key for key in ('range', 'choice') if key in spec] + (['toggle'] if self.toggle else [])
+        if len(kinds) > 1:
+            raise ValueError(f"引脚 {name} 只能使用range、choice、toggle中的一种分布")
+        if 'range' in spec:
+            bounds = spec['range']
+            if not isinstance(bounds, list) or len(bounds) != 2:
+                raise ValueError(f"引脚 {name} 的range必须是[最小值, 最大值]")
+            self.low, self.high = (parse_number(v, f"{name}.range") for v in bounds)
+            if self.low > self.high:
+                raise ValueError(f"引脚 {name} 的range下限大于上限")
+        elif 'choice' in spec:
+            if not isinstance(spec['choice'], list) or not spec['choice']:
+                raise ValueError(f"引脚 {name} 的choice必须是非空列表")
+            self.choices = [parse_number(v, f"{name}.choice") for v in spec['choice']]
+            weights = spec.get('weights', [1] * len(self.choices))
+            if not isinstance(weights, list) or len(weights) != len(self.choices):
+                raise ValueError(f"引脚 {name} 的weights必须与choice一一对应")
+            if any(isinstance(w, bool) or not isinstance(w, (int, float)) or w < 0 for w in weights) \
+                    or not sum(weights):
+                raise ValueError(f"引脚 {name} 的weights必须是非负数且不全为0")
+            self.cum_weights = list(accumulate(weights))
+        elif 'weights' in spec:
+            raise ValueError(f"引脚 {name} 的weights只能与choice一起使用")
+        if self.toggle and self.width != 1:
+            raise ValueError(f"引脚 {name} 使用toggle时位宽必须为1")
+        for value in [self.low, self.high] + (self.choices or []):
+            if value > self.mask:
+                raise ValueError(f"引脚 {name} 的取值 {value} 超出 {self.width} 位")
+
+        # 变化时刻
+        timings = [key for key in ('rate', 'every', 'interval') if key in spec]
+        if len(timings) > 1:
+            raise ValueError(f"引脚 {name} 只能使用rate、every、interval中的一种变化规则")
+        self.rate = spec.get('rate', DEFAULT_RATE if not timings else None)
+        self.every = spec.get('every')
+        self.interval = spec.get('interval')
+        if self.rate is not None and (isinstance(self.rate, bool) or not isinstance(self.rate, (int, float))
+                                      or not 0 < self.rate <= 1):
+            raise ValueError(f"引脚 {name} 的rate必须在(0, 1]之间")
+        if self.every is not None and (not isinstance(self.every, int) or self.every < 1):
+            raise ValueError(f"引脚 {name} 的every必须是正整数")
+        if self.interval is not None:
+            if not (isinstance(self.interval, list) and len(self.interval) == 2
+                    and all(isinstance(v, int) for v in self.interval) and 1 <= self.interval[0] <= self.interval[1]):
+                raise ValueError(f"引脚 {name} 的interval必须是[最小间隔, 最大间隔]，且最小间隔至少为1")
+
+        self.init = parse_number(spec.get('init', 0), f"{name}.init")
+        if self.init > self.mask:
+            raise ValueError(f"引脚 {name} 的初始值 {self.init} 超出 {self.width} 位")
+        self.start = spec.get('start', 0)
+        if not isinstance(self.start, int) or self.start < 0:
+            raise ValueError(f"引脚 {name} 的start必须是非负整数")
+
+    def value_function(self, rng):
+        """返回由当前值计算下一个值的函数"""
+        if self.toggle:
+            return lambda current: current ^ 1
+        if self.choices is not None:
+            choices, cum_weights, total = self.choices, self.cum_weights, self.cum_weights[-1]
+            bisect_right, rand = bisect.bisect_right, rng.random
+            return lambda current: choices[bisect_right(cum_weights, rand() * total)]
+        if self.low == 0 and self.high == self.mask:
+            getrandbits, width = rng.getrandbits, self.width
+            return lambda current: getrandbits(width)
+        randrange, low, stop = rng.randrange, self.low, self.high + 1
+        return lambda current: randrange(low, stop)
+
+    def gap_function(self, rng):
+        """返回产生下一次变化间隔（至少为1）的函数"""
+        if self.every is not None:
+            every = self.every
+            return lambda: every
+        if self.interval is not None:
+            randint, (low, high) = rng.randint, self.interval
+            return lambda: randint(low, high)
+        if self.rate >= 1:
+            return lambda: 1
+        # 每个时间单位以概率rate变化，间隔服从几何分布，由一次均匀采样反变换得到
+        rand, scale = rng.random, 1 / math.log1p(-self.rate)
+        return lambda: 1 + int(math.log(1.0 - rand()) * scale)
+
+
+class BlockSpec:
+    """一个块的时长、引脚与互斥组"""
+    __slots__ = ('name', 'duration', 'pins', 'exclusive')
+
+    def __init__(self, name, spec):
+        if not isinstance(spec, dict):
+            raise ValueError(f"{name}块的描述必须是对象")
+        self.name = name
+        self.duration = spec.get('duration')
+        if not isinstance(self.duration, int) or self.duration < 1:
+            raise ValueError(f"{name}块需要正整数的duration")
+        pins = spec.get('pins', {})
+        if not isinstance(pins, dict) or not pins:
+            raise ValueError(f"{name}块的pins必须是非空对象")
+        self.pins = [PinSpec(pin, pin_spec) for pin, pin_spec in pins.items()]
+
+        index = {pin.name: i for i, pin in enumerate(self.pins)}
+        self.exclusive = [None] * len(self.pins)
+        for group in spec.get('exclusive', []):
+            if not isinstance(group, list) or len(group) < 2:
+                raise ValueError(f"{name}块的exclusive每组至少需要两个引脚")
+            missing = [pin for pin in group if pin not in index]
+            if missing:
+                raise ValueError(f"{name}块的exclusive引用了未定义的引脚: {', '.join(map(str, missing))}")
+            members = [index[pin] for pin in group]
+            if sum(1 for i in members if self.pins[i].init) > 1:
+                raise ValueError(f"{name}块的互斥组 {group} 中有多个引脚的初始值非0")
+            for i in members:
+                if self.exclusive[i] is not None:
+                    raise ValueError(f"{name}块中引脚 {self.pins[i].name} 属于多个互斥组")
+                self.exclusive[i] = tuple(j for j in members if j != i)
+
+    def steps(self, pin_ids, seed, skip_unchanged=True):
+        """按时间顺序产出 (时间, [(引脚ID, 值), ...])，t=0步包含块内全部引脚的初始值
+
+        skip_unchanged为True时不产生与引脚当前值相同的写入，效果与csv2c.py的冗余写入消除相同
+        """
+        rng = random.Random(seed)
+        pins = self.pins
+        ids = [pin_ids[pin.name] for pin in pins]
+        values = [pin.value_function(rng) for pin in pins]
+        gaps = [pin.gap_function(rng) for pin in pins]
+        exclusive = self.exclusive
+        current = [pin.init for pin in pins]
+        yield 0, [(ids[i], value) for i, value in enumerate(current)]
+
+        # 堆中的键为(时间 << shift) | 下标，整数比较比元组快；同一时刻变化的引脚按下标顺序出堆
+        shift = len(pins).bit_length()
+        index_mask = (1 << shift) - 1
+        heap = [((pin.start + gaps[i]()) << shift) | i for i, pin in enumerate(pins)]
+        heapq.heapify(heap)
+        heapreplace = heapq.heapreplace
+        end_key = self.duration << shift
+        while True:
+            key = heap[0]
+            if key >= end_key:
+                return
+            i = key & index_mask
+            time = key >> shift
+            value = values[i](current[i])
+            heapreplace(heap, key + (gaps[i]() << shift))
+            if heap[0] >> shift != time and exclusive[i] is None:
+                # 大多数时刻只有一个引脚变化，不需要处理互斥约束
+                if value != current[i] or not skip_unchanged:
+                    current[i] = value
+                    yield time, [(ids[i], value)]
+                continue
+
+            writes = {i: value}
+            while heap[0] >> shift == time:
+                key = heap[0]
+                i = key & index_mask
+                writes[i] = values[i](current[i])
+                heapreplace(heap, key + (gaps[i]() << shift))
+            for i in list(writes):
+                if writes[i] and exclusive[i]:
+                    for j in exclusive[i]:
+                        if writes.get(j, current[j]):
+                            writes[j] = 0
+            if skip_unchanged:
+                writes = {i: value for i, value in writes.items() if value != current[i]}
+                if not writes:
+                    continue
+            for i, value in writes.items():
+                current[i] = value
+            yield time, [(ids[i], value) for i, value in writes.items()]
+
+
+class RandomSpec:
+    """描述文件：种子、CSV配置与各块的引脚描述"""
+    __slots__ = ('path', 'seed', 'config', 'blocks', 'pin_names', 'pin_ids', 'source')
+
+    def __init__(self, path, seed=None):
+        self.path = path
+        try:
+            with open(path) as f:
+                spec = json.load(f)
+        except OSError as e:
+            raise ValueError(f"{path}: {e.strerror}") from None
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}: JSON格式错误 ({e})") from None
+        if not isinstance(spec, dict):
+            raise ValueError(f"{path}: 描述文件必须是JSON对象")
+        unknown = set(spec) - {'seed', 'config'} - {name for name, _, _ in BLOCKS}
+        if unknown:
+            raise ValueError(f"{path}: 未知的键 {', '.join(sorted(unknown))}")
+
+        self.seed = spec.get('seed', 0) if seed is None else seed
+        if not isinstance(self.seed, int):
+            raise ValueError(f"{path}: seed必须是整数")
+        raw_config = spec.get('config', {})
+        if not isinstance(raw_config, dict):
+            raise ValueError(f"{path}: config必须是对象")
+        self.config = {csv2c.config_macro_name(name.strip().lower()): str(value).strip()
+                       for name, value in raw_config.items()}
+        self.blocks = {}
+        for name, enable_macro, duration_macro in BLOCKS:
+            if name in spec:
+                block = self.blocks[name] = BlockSpec(name.upper(), spec[name])
+                self.config[enable_macro] = '1'
+                self.config[duration_macro] = str(block.duration)
+
+        # 两个块共享引脚ID，与CSV中INITIAL与FOREVER共享引脚表相同
+        self.pin_names = []
+        self.pin_ids = {}
+        for block in self.blocks.values():
+            for pin in block.pins:
+                if pin.name not in self.pin_ids:
+                    self.pin_ids[pin.name] = len(self.pin_names)
+                    self.pin_names.append(pin.name)
+        self.source = json.dumps(spec, sort_keys=True)
+
+    def steps(self, name, skip_unchanged=True):
+        """块的步序列；每个块使用独立的随机数序列，重复调用得到相同的结果"""
+        block = self.blocks.get(name)
+        if block is None:
+            return iter(())
+        return block.steps(self.pin_ids, self.seed * 2 + (name == 'forever'), skip_unchanged)
+
+    def last_times(self):
+        """各块最后一次可能赋值的相对时间（块时长减1，没有该块时为None）；实际的最后一次变化要生成后才知道"""
+        return {name: self.blocks[name].duration - 1 if name in self.blocks else None for name, _, _ in BLOCKS}
+
+    def quiescence_start(self, config):
+        """块宏模式下静止检测的起点，按INITIAL块的时长保守估计；二进制模式下由仿真程序根据激励文件计算"""
+        last = self.last_times()
+        if last['forever'] is not None and csv2c.config_enabled(config, 'ENABLE_FOREVER_BLOCK'):
+            return None
+        return csv2c.last_stimulus_time(config, last['initial'], None, None) or 0
+
+    def checkpoint_key(self, config):
+        """INITIAL块的64位标识：由种子、描述与影响INITIAL块的配置计算"""
+        h = hashlib.sha256(f"{self.seed};{self.source};".encode())
+        for key in csv2c.CHECKPOINT_CONFIG_KEYS:
+            h.update(f"{key}={config.get(key, '')};".encode())
+        return int.from_bytes(h.digest()[:8], 'little')
+
+
+def resolve_auto_bounds(spec, config):
+    """值为auto的时长按各块的时长加上稳定余量计算；描述中给出的块时长优先，因此auto的块时长只对没有的块生效"""
+    auto = [key for key in csv2c.AUTO_CONFIG_KEYS if csv2c.is_auto(config.get(key))]
+    if not auto:
+        return
+    margin = csv2c.settle_margin(config)
+    last = spec.last_times()
+    for key in auto:
+        if key == 'MAX_TIME_SIM':
+            config[key] = str(csv2c.auto_bound(csv2c.last_stimulus_time(config, last['initial'], last['forever'], None),
+                                               margin))
+        else:
+            config[key] = str(csv2c.auto_bound(None, margin))
+        print(f"{key} 为auto，根据块时长设置为 {config[key]}（稳定余量 {margin}）")
+
+
+def convert_spec(spec, output_path, stimulus_path, binary_path=None, config_h_path=None, optimize=True,
+                 trace_path=None):
+    """把随机激励描述转换为csv2c.py的全部输出，校验失败时抛出ValueError，返回(配置字典, {输出文件路径: 是否写入})"""
+    existing_config = csv2c.parse_sim_config_h(config_h_path)
+    existing_config.pop('__SIM_CONFIG__', None)
+    config = {**existing_config, **spec.config}
+    config['ENABLE_BINARY_STIMULUS'] = '1' if binary_path else '0'
+    csv2c.merge_trace_scope_file(config, spec.path)
+    csv2c.check_config(config)
+    resolve_auto_bounds(spec, config)
+
+    block_steps = []
+    for name, _, duration_macro in BLOCKS:
+        # 冗余写入在生成时即已去除，不再经过eliminate_redundant_writes
+        block_steps.append(csv2c.validate_steps(spec.steps(name, optimize), spec.pin_names, duration_macro, config,
+                                                name.upper()))
+    written = csv2c.write_outputs(config, spec.pin_names, *block_steps, output_path, stimulus_path, binary_path,
+                                  optimize, trace_path, checkpoint_key=spec.checkpoint_key(config),
+                                  quiescence_start=spec.quiescence_start(config))
+    return config, written
+
+
+def export_csv(spec, csv_path):
+    """流式写出与描述等价的testbench CSV：INITIAL与FOREVER事件逐行并列，配置写在Configuration列"""
+    def events(name):
+        for time, writes in spec.steps(name):
+            for pin, value in writes:
+                yield time, spec.pin_names[pin], csv2c.format_value(value)
+
+    names = {macro: name for name, macro in csv2c.CONFIG_MAPPING.items()}
+    config = [(names.get(macro, macro.lower().replace('_', ' ')), value) for macro, value in spec.config.items()]
+    count = 0
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for initial, forever, setting in zip_longest(events('initial'), events('forever'), config):
+            row = [''] * len(CSV_HEADER)
+            if initial:
+                row[1:4] = initial
+                count += 1
+            if forever:
+                row[6:9] = forever
+                count += 1
+            if setting:
+                row[10:12] = setting
+            writer.writerow(row)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="由约束描述生成随机激励，直接转换为仿真使用的配置与激励")
+    parser.add_argument("spec", help="随机激励描述文件（JSON）")
+    parser.add_argument("config_h_path", nargs="?", default="include/sim_config.h", help="sim_config.h路径")
+    parser.add_argument("--stimulus", metavar="STIMULUS_H", help="激励块宏的输出文件，默认为sim_config.h同目录下的sim_stimulus.h")
+    parser.add_argument("--trace-config", metavar="VLT", help="波形层次过滤的Verilator配置文件，默认为sim_config.h同目录下的sim_trace.vlt")
+    parser.add_argument("--binary", metavar="STIM_FILE", help="输出二进制激励文件（大规模激励应使用此方式）")
+    parser.add_argument("--seed", type=int, help="覆盖描述文件中的种子")
+    parser.add_argument("--csv", metavar="CSV", help="另外导出等价的testbench CSV")
+    parser.add_argument("--no-merge", action="store_true", help="不读取已有sim_config.h中的配置")
+    parser.add_argument("--no-optimize", action="store_true", help="关闭冗余写入消除与循环折叠")
+    args = parser.parse_args()
+
+    stimulus_path = args.stimulus or os.path.join(os.path.dirname(args.config_h_path), "sim_stimulus.h")
+    try:
+        spec = RandomSpec(args.spec, args.seed)
+        _, written = convert_spec(spec, args.config_h_path, stimulus_path, args.binary,
+                                  None if args.no_merge else args.config_h_path, not args.no_optimize,
+                                  args.trace_config)
+        if args.csv:
+            count = export_csv(spec, args.csv)
+            print(f"导出 {count} 个事件到 {args.csv}")
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+
+    print(f"种子 {spec.seed}，{len(spec.pin_names)} 个引脚")
+    for path, changed in written.items():
+        print(f"输出文件位置: {os.path.abspath(path)}" + ("" if changed else "（内容未变化）"))
+
+
+if __name__ == "__main__":
+    main()
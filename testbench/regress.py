@@ -0,0 +1,283 @@
+"""
+并行回归测试：批量转换testbench CSV、构建或复用仿真程序并并发运行
+
+每个CSV在进程内通过csv2c.convert_testbench转换为二进制激励，配置与引脚表相同的用例共享
+同一个仿真程序；--library时全部用例编译进同一个激励库，只构建一次，运行时以+tb=选择。运行结果（通过/失败、耗时、仿真时长、每秒仿真时间单位数与EXPECT检查结果）
+写入JSON汇总文件。默认不记录波形，只对失败的用例开启波形重新运行一次。
+
+用法: python testbench/regress.py [testbench/*.csv ...] [-j N] [--timeout 秒] [--summary 路径] [--library]
+"""
+import os
+import sys
+import io
+import glob
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import csv2c
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TESTBENCH = os.path.join(ROOT, "testbench")
+INCLUDE = os.path.join(ROOT, "include")
+REGRESS = os.path.join(ROOT, "build", "regress")
+GENERATED_HEADERS = ("sim_config.h", "sim_stimulus.h", "sim_trace.vlt")
+TOPNAME = "top"
+
+
+def discover(patterns, excludes=()):
+    """按模式查找testbench CSV，返回去重并排序后的路径列表"""
+    paths = set()
+    for pattern in patterns:
+        paths.update(os.path.abspath(p) for p in glob.glob(pattern))
+    excluded = {os.path.abspath(p) for pattern in excludes for p in glob.glob(pattern)}
+    return sorted(p for p in paths - excluded if p.endswith(".csv"))
+
+
+def case_name(csv_path):
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def convert_case(csv_path, optimize=True, root=REGRESS):
+    """在进程内转换单个用例，返回用例信息；转换失败时error不为空"""
+    name = case_name(csv_path)
+    case_dir = os.path.join(root, "cases", name)
+    os.makedirs(case_dir, exist_ok=True)
+    case = {"name": name, "csv": csv_path, "dir": case_dir, "build_dir": case_dir,
+            "stim": os.path.join(case_dir, name + ".stim"), "plusargs": [], "key": None, "error": None}
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            csv2c.convert_testbench(csv_path,
+                                    os.path.join(case_dir, "sim_config.h"),
+                                    os.path.join(case_dir, "sim_stimulus.h"),
+                                    case["stim"], optimize=optimize,
+                                    trace_path=os.path.join(case_dir, "sim_trace.vlt"))
+    except (ValueError, FileNotFoundError) as e:
+        case["error"] = str(e)
+    with open(os.path.join(case_dir, "convert.log"), "w") as f:
+        f.write(log.getvalue())
+    if case["error"] is None:
+        # 二进制模式下生成的文件只含配置、引脚表与波形层次过滤，相同的用例可共享仿真程序
+        case["key"] = headers_key(case_dir)
+    return case
+
+
+def convert_library_cases(csv_paths, optimize=True, root=REGRESS):
+    """在进程内把全部用例编译为同一个激励库，返回用例信息列表；任一用例转换失败时所有用例的error均为该错误"""
+    library_dir = os.path.join(root, "library")
+    os.makedirs(library_dir, exist_ok=True)
+    error = None
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            csv2c.convert_library(csv_paths,
+                                  os.path.join(library_dir, "sim_config.h"),
+                                  os.path.join(library_dir, "sim_stimulus.h"), optimize,
+                                  trace_path=os.path.join(library_dir, "sim_trace.vlt"))
+    except (ValueError, FileNotFoundError) as e:
+        error = str(e)
+    with open(os.path.join(library_dir, "convert.log"), "w") as f:
+        f.write(log.getvalue())
+    key = headers_key(library_dir) if error is None else None
+    cases = []
+    for csv_path in csv_paths:
+        name = case_name(csv_path)
+        case_dir = os.path.join(root, "cases", name)
+        os.makedirs(case_dir, exist_ok=True)
+        cases.append({"name": name, "csv": csv_path, "dir": case_dir, "build_dir": library_dir, "stim": None,
+                      "plusargs": [f"+tb={csv2c.testbench_name(csv_path)}"], "key": key, "error": error})
+    return cases
+
+
+def headers_key(directory):
+    """生成的头文件的内容哈希，相同的用例共享仿真程序"""
+    digest = hashlib.sha256()
+    for header in GENERATED_HEADERS:
+        with open(os.path.join(directory, header), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def sync_file(src, dst):
+    """内容不同时才复制，保持未变化文件的修改时间"""
+    if os.path.exists(dst):
+        with open(src, "rb") as a, open(dst, "rb") as b:
+            if a.read() == b.read():
+                return
+    shutil.copyfile(src, dst)
+
+
+def build_simulator(key, case_dir, make_args=(), root=REGRESS):
+    """为一组共享配置的用例构建仿真程序，已是最新时由make直接跳过，返回(可执行文件, 错误信息)"""
+    build_dir = os.path.join(root, "builds", key)
+    include_dir = os.path.join(build_dir, "include")
+    os.makedirs(include_dir, exist_ok=True)
+    for header in glob.glob(os.path.join(INCLUDE, "*.h")):
+        if os.path.basename(header) not in GENERATED_HEADERS:
+            sync_file(header, os.path.join(include_dir, os.path.basename(header)))
+    for header in GENERATED_HEADERS:
+        sync_file(os.path.join(case_dir, header), os.path.join(include_dir, header))
+
+    bin_dir = os.path.join(build_dir, "bin")
+    executable = os.path.join(bin_dir, "V" + TOPNAME)
+    # 头文件已由转换生成，TB_STAMP为空时make不会再以testbench目录下的CSV覆盖它们
+    command = ["make", "-C", ROOT, executable,
+               f"INCLUDE={include_dir}", f"BUILD={os.path.join(build_dir, 'build')}", f"BIN={bin_dir}",
+               "SIMULATION_WITH_NVBOARD=0", "ENABLE_BINARY_STIMULUS=1", "TB_STAMP=", *make_args]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    with open(os.path.join(build_dir, "build.log"), "w") as f:
+        f.write(result.stdout)
+    if result.returncode != 0:
+        return None, f"构建失败，详见 {os.path.join(build_dir, 'build.log')}"
+    return executable, None
+
+
+def run_case(name, executable, stim, case_dir, timeout, plusargs=()):
+    """运行单个用例（在进程池中执行），返回结果字典"""
+    report_path = os.path.join(case_dir, "report.json")
+    log_path = os.path.join(case_dir, "run.log")
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    command = [executable, *([f"+stim={stim}"] if stim else []), f"+wave={os.path.join(case_dir, 'wave.fst')}",
+               f"+report={report_path}", *plusargs]
+    result = {"name": name, "status": "fail", "returncode": None, "wall_seconds": None,
+              "ticks": None, "ticks_per_second": None, "expect_total": None, "expect_failed": None,
+              "log": log_path, "wave": None}
+    if "+wave-dump=1" in plusargs:
+        result["wave"] = os.path.join(case_dir, 'wave.fst')
+    start = time.perf_counter()
+    with open(log_path, "w") as log:
+        try:
+            result["returncode"] = subprocess.run(command, stdout=log, stderr=subprocess.STDOUT,
+                                                  timeout=timeout, cwd=case_dir).returncode
+        except subprocess.TimeoutExpired:
+            result["status"] = "timeout"
+    result["wall_seconds"] = round(time.perf_counter() - start, 6)
+
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+        result["ticks"] = report["ticks"]
+        result["expect_total"] = report.get("expect_total")
+        result["expect_failed"] = report.get("expect_failed")
+        # 以仿真程序自身统计的耗时计算速率，排除进程启动开销
+        seconds = report["seconds"] or result["wall_seconds"]
+        result["ticks_per_second"] = round(report["ticks"] / seconds, 1) if seconds else None
+    if result["returncode"] == 0:
+        result["status"] = "pass"
+    return result
+
+
+def print_table(results):
+    width = max([len(r["name"]) for r in results] + [4])
+    print(f"\n{'用例':<{width - 2}}  状态     耗时(s)      仿真时长      时长/秒    期望失败")
+    for r in results:
+        wall = f"{r['wall_seconds']:.3f}" if r["wall_seconds"] is not None else "-"
+        ticks = r["ticks"] if r["ticks"] is not None else "-"
+        rate = f"{r['ticks_per_second']:.0f}" if r["ticks_per_second"] else "-"
+        expect = f"{r['expect_failed']}/{r['expect_total']}" if r["expect_total"] else "-"
+        print(f"{r['name']:<{width}}  {r['status']:<7}  {wall:>9}  {ticks:>12}  {rate:>11}  {expect:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并行运行testbench回归测试")
+    parser.add_argument("patterns", nargs="*", default=[os.path.join(TESTBENCH, "*.csv")],
+                        help="testbench CSV路径或通配模式，默认testbench/*.csv")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN", help="排除匹配的CSV")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="并发运行的用例数，默认为CPU核数")
+    parser.add_argument("--timeout", type=float, default=600, help="单个用例的超时时间（秒）")
+    parser.add_argument("--summary", default=os.path.join(REGRESS, "summary.json"), help="JSON汇总文件路径")
+    parser.add_argument("--no-optimize", action="store_true", help="转换时关闭激励优化")
+    parser.add_argument("--library", action="store_true",
+                        help="把全部用例编译进同一个激励库，只构建一次，运行时以+tb=选择用例")
+    parser.add_argument("--make-arg", action="append", default=[], metavar="VAR=VALUE",
+                        help="传递给make的额外变量，例如ENABLE_FAST_FORWARD=1")
+    parser.add_argument("--plusarg", action="append", default=[], metavar="+ARG", help="传递给仿真程序的额外参数")
+    parser.add_argument("--waves", choices=("failed", "all", "none"), default="failed",
+                        help="记录波形的用例：failed为失败或超时后开启波形重跑一次（默认），all为全部，none为不记录")
+    args = parser.parse_args()
+
+    csv_paths = discover(args.patterns, args.exclude)
+    if not csv_paths:
+        print("错误: 没有找到testbench CSV")
+        sys.exit(1)
+    if len({case_name(p) for p in csv_paths}) != len(csv_paths):
+        print("错误: 存在同名的testbench CSV，无法区分用例目录")
+        sys.exit(1)
+
+    begin = time.perf_counter()
+    results = {}
+    cases = []
+    if args.library:
+        converted = convert_library_cases(csv_paths, not args.no_optimize)
+    else:
+        converted = [convert_case(path, not args.no_optimize) for path in csv_paths]
+    for case in converted:
+        if case["error"]:
+            print(f"[CONVERT ERROR] {case['name']}: {case['error']}")
+            results[case["name"]] = {"name": case["name"], "status": "convert-error", "error": case["error"]}
+        else:
+            cases.append(case)
+
+    # 构建串行进行（make内部已并行编译），共享配置的用例只构建一次
+    executables = {}
+    for case in cases:
+        if case["key"] not in executables:
+            print(f"构建仿真程序 {case['key']}（{case['name']}）")
+            executables[case["key"]] = build_simulator(case["key"], case["build_dir"], args.make_arg)
+        executable, error = executables[case["key"]]
+        if error:
+            results[case["name"]] = {"name": case["name"], "status": "build-error", "error": error}
+
+    runnable = {case["name"]: case for case in cases if case["name"] not in results}
+    print(f"运行 {len(runnable)} 个用例，并发数 {args.jobs}")
+    plusargs = [f"+wave-dump={int(args.waves == 'all')}", *args.plusarg]
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(run_case, case["name"], executables[case["key"]][0], case["stim"],
+                               case["dir"], args.timeout, [*case["plusargs"], *plusargs])
+                   for case in runnable.values()]
+        for future in as_completed(futures):
+            result = future.result()
+            results[result["name"]] = result
+            print(f"[{result['status'].upper()}] {result['name']}")
+
+        # 失败或超时的用例开启波形重跑一次，统计结果仍以第一次运行为准
+        failed = [name for name in runnable if results[name]["status"] in ("fail", "timeout")]
+        if args.waves == "failed" and failed:
+            print(f"开启波形重新运行 {len(failed)} 个失败或超时的用例")
+            futures = [pool.submit(run_case, name, executables[runnable[name]["key"]][0], runnable[name]["stim"],
+                                   runnable[name]["dir"], args.timeout,
+                                   [*runnable[name]["plusargs"], "+wave-dump=1", *args.plusarg])
+                       for name in failed]
+            for future in as_completed(futures):
+                rerun = future.result()
+                results[rerun["name"]]["wave"] = rerun["wave"]
+                print(f"[WAVE] {rerun['name']}: {rerun['wave']}")
+
+    ordered = [results[case_name(p)] for p in csv_paths]
+    passed = sum(r["status"] == "pass" for r in ordered)
+    summary = {
+        "total": len(ordered),
+        "passed": passed,
+        "failed": len(ordered) - passed,
+        "jobs": args.jobs,
+        "wall_seconds": round(time.perf_counter() - begin, 6),
+        "cases": ordered,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.summary)), exist_ok=True)
+    with open(args.summary, "w") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+
+    print_table([r for r in ordered if "wall_seconds" in r])
+    print(f"\n通过 {passed}/{len(ordered)}，汇总写入 {args.summary}")
+    sys.exit(0 if passed == len(ordered) else 1)
+
+
+if __name__ == "__main__":
+    main()
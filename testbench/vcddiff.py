@@ -0,0 +1,270 @@
+"""
+波形对比：流式解析两个VCD（FST文件通过fst2vcd管道读取），按时间戳对齐并报告每个信号的前N处差异
+
+两个波形逐个时间戳推进，只保存每个信号的当前值与已报告的差异，内存占用与波形长度无关。
+信号按层次名匹配（如top.u_alu.result），一段连续不同的值计为一处差异，报告开始与结束的时间戳及两侧的值。
+
+用法: python testbench/vcddiff.py golden.fst new.fst [--include 'top.u_*'] [--exclude '*.tmp_*'] [-n 10]
+退出码: 0表示一致，1表示存在差异，2表示无法读取或解析
+"""
+import sys
+import fnmatch
+import argparse
+import subprocess
+
+
+class VcdReader:
+    """VCD流式解析器：构造时读取头部的变量定义，迭代时逐个时间戳产生(时间, [(标识符, 值)])"""
+    __slots__ = ("path", "process", "tokens", "timescale", "variables")
+
+    def __init__(self, path):
+        self.path = path
+        self.process = None
+        if path == "-":
+            stream = sys.stdin
+        elif path.endswith(".fst"):
+            # fst2vcd把VCD写到标准输出，边转换边解析，不在磁盘上生成完整的VCD
+            try:
+                self.process = subprocess.Popen(["fst2vcd", path], stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL, text=True)
+            except OSError as e:
+                raise ValueError(f"{path}: 无法运行fst2vcd ({e.strerror})") from None
+            stream = self.process.stdout
+        else:
+            try:
+                stream = open(path)
+            except OSError as e:
+                raise ValueError(f"{path}: {e.strerror}") from None
+        self.tokens = (token for line in stream for token in line.split())
+        self.timescale = None
+        self.variables = {}  # 标识符 -> [(层次名, 位宽)]，同一标识符可对应多个别名
+        self.read_header()
+
+    def until_end(self):
+        """读取到$end为止的全部记号"""
+        words = []
+        for token in self.tokens:
+            if token == "$end":
+                return words
+            words.append(token)
+        raise ValueError(f"{self.path}: 头部在$end之前结束")
+
+    def read_header(self):
+        scope = []
+        for token in self.tokens:
+            if token == "$scope":
+                words = self.until_end()
+                scope.append(words[1] if len(words) > 1 else words[0])
+            elif token == "$upscope":
+                self.until_end()
+                scope.pop()
+            elif token == "$var":
+                words = self.until_end()
+                if len(words) < 4:
+                    raise ValueError(f"{self.path}: 无效的变量定义 '$var {' '.join(words)} $end'")
+                _, width, code, name = words[:4]
+                # 位选写在名字后面时（如data [7:0]）不属于层次名
+                self.variables.setdefault(code, []).append((".".join(scope + [name]), int(width)))
+            elif token == "$timescale":
+                self.timescale = "".join(self.until_end())
+            elif token == "$enddefinitions":
+                self.until_end()
+                return
+            elif token.startswith("$"):
+                self.until_end()  # $date、$version、$comment等
+        raise ValueError(f"{self.path}: 没有找到$enddefinitions，不是有效的VCD")
+
+    def __iter__(self):
+        time = 0
+        changes = []
+        tokens = self.tokens
+        for token in tokens:
+            c = token[0]
+            if c == "#":
+                if changes:
+                    yield time, changes
+                    changes = []
+                time = int(token[1:])
+            elif c in "01xXzZ":
+                changes.append((token[1:], c.lower()))
+            elif c in "bB":
+                changes.append((next(tokens), token[1:].lower()))
+            elif c in "rRsS":
+                changes.append((next(tokens), token[1:]))
+            elif token == "$comment":
+                for token in tokens:
+                    if token == "$end":
+                        break
+            # $dumpvars、$dumpall、$dumpon、$dumpoff与$end只是分组，值变化照常处理
+        if changes:
+            yield time, changes
+
+    def close(self):
+        if self.process:
+            self.process.stdout.close()
+            self.process.kill()
+            self.process.wait()
+
+
+def normalize(value, width):
+    """按VCD规则把省略了高位的向量补齐到位宽：最高位为0或1时补0，为x或z时补x或z"""
+    if len(value) >= width or not value or value[0] not in "01xz":
+        return value
+    pad = "0" if value[0] in "01" else value[0]
+    return pad * (width - len(value)) + value
+
+
+def select_signals(reader, includes, excludes):
+    """返回{层次名: (标识符, 位宽)}，按包含与排除模式过滤"""
+    signals = {}
+    for code, aliases in reader.variables.items():
+        for name, width in aliases:
+            if includes and not any(fnmatch.fnmatchcase(name, p) for p in includes):
+                continue
+            if any(fnmatch.fnmatchcase(name, p) for p in excludes):
+                continue
+            signals[name] = (code, width)
+    return signals
+
+
+class Divergence:
+    """单个信号的差异记录：只保存前limit处，其余只计数"""
+    __slots__ = ("name", "count", "records", "open")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.records = []   # [开始时间, 结束时间或None, A侧值, B侧值]
+        self.open = None
+
+
+def compare(reader_a, reader_b, includes=(), excludes=(), limit=10, start=0, end=None):
+    """逐个时间戳对齐比较，返回(差异列表, 只在A中的信号, 只在B中的信号, 位宽不同的信号)"""
+    signals_a = select_signals(reader_a, includes, excludes)
+    signals_b = select_signals(reader_b, includes, excludes)
+    common = sorted(set(signals_a) & set(signals_b))
+    width_mismatch = [name for name in common if signals_a[name][1] != signals_b[name][1]]
+    common = [name for name in common if signals_a[name][1] == signals_b[name][1]]
+
+    # 标识符 -> 信号下标列表；当前值按下标保存
+    targets_a, targets_b = {}, {}
+    for index, name in enumerate(common):
+        targets_a.setdefault(signals_a[name][0], []).append(index)
+        targets_b.setdefault(signals_b[name][0], []).append(index)
+    widths = [signals_a[name][1] for name in common]
+    values_a = [None] * len(common)
+    values_b = [None] * len(common)
+    divergences = [Divergence(name) for name in common]
+
+    def check(indices, time):
+        for index in indices:
+            divergence = divergences[index]
+            value_a, value_b = values_a[index], values_b[index]
+            if value_a != value_b:
+                if divergence.open is not None:
+                    if divergence.open[2:] == [value_a, value_b]:
+                        continue
+                    # 差异持续但值变化时记为新的一处，便于看到每一段不同的值
+                    divergence.open[1] = time
+                divergence.count += 1
+                divergence.open = [time, None, value_a, value_b]
+                if len(divergence.records) < limit:
+                    divergence.records.append(divergence.open)
+            elif divergence.open is not None:
+                divergence.open[1] = time
+                divergence.open = None
+
+    # start之前的变化只更新当前值；到达start时比较全部信号，此前产生且一直保持的差异也会被报告
+    started = False
+    iter_a, iter_b = iter(reader_a), iter(reader_b)
+    next_a, next_b = next(iter_a, None), next(iter_b, None)
+    while next_a or next_b:
+        time = min(item[0] for item in (next_a, next_b) if item)
+        if end is not None and time > end:
+            break
+        if not started and time > start:
+            check(range(len(common)), start)
+            started = True
+        touched = set()
+        for targets, values, source in ((targets_a, values_a, "a"), (targets_b, values_b, "b")):
+            while True:
+                item = next_a if source == "a" else next_b
+                if not item or item[0] != time:
+                    break
+                for code, value in item[1]:
+                    for index in targets.get(code, ()):
+                        values[index] = normalize(value, widths[index])
+                        touched.add(index)
+                if source == "a":
+                    next_a = next(iter_a, None)
+                else:
+                    next_b = next(iter_b, None)
+        if time < start:
+            continue
+        if not started:
+            touched = range(len(common))
+            started = True
+        check(touched, time)
+    if not started and (end is None or start <= end):
+        check(range(len(common)), start)
+    only_a = sorted(set(signals_a) - set(signals_b))
+    only_b = sorted(set(signals_b) - set(signals_a))
+    return [d for d in divergences if d.count], only_a, only_b, width_mismatch
+
+
+def print_report(divergences, only_a, only_b, width_mismatch, limit, max_signals):
+    for title, names in (("只在A中的信号", only_a), ("只在B中的信号", only_b), ("位宽不同的信号", width_mismatch)):
+        if names:
+            print(f"{title} {len(names)} 个: {', '.join(names[:max_signals])}" + (" ..." if len(names) > max_signals else ""))
+    # 按首次差异的时间排序，最早出现问题的信号排在前面
+    divergences.sort(key=lambda d: d.records[0][0])
+    for divergence in divergences[:max_signals]:
+        shown = f"，显示前 {limit} 处" if divergence.count > limit else ""
+        print(f"\n{divergence.name}: {divergence.count} 处差异{shown}")
+        for begin, finish, value_a, value_b in divergence.records:
+            span = f"#{begin} .. #{finish}" if finish is not None else f"#{begin} .. 结束"
+            print(f"  {span:<24} A={value_a if value_a is not None else '-'}  B={value_b if value_b is not None else '-'}")
+    if len(divergences) > max_signals:
+        print(f"\n另有 {len(divergences) - max_signals} 个信号存在差异")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按时间戳对齐比较两个VCD/FST波形")
+    parser.add_argument("a", help="基准波形（.vcd、.fst或-表示标准输入）")
+    parser.add_argument("b", help="对比波形（.vcd或.fst）")
+    parser.add_argument("--include", action="append", default=[], metavar="PATTERN",
+                        help="只比较层次名匹配的信号，可多次指定，例如'top.u_alu.*'")
+    parser.add_argument("--exclude", action="append", default=[], metavar="PATTERN", help="不比较层次名匹配的信号")
+    parser.add_argument("-n", "--limit", type=int, default=10, help="每个信号报告的差异数")
+    parser.add_argument("--max-signals", type=int, default=50, help="最多报告的信号数")
+    parser.add_argument("--start", type=int, default=0, help="从该时间戳开始比较")
+    parser.add_argument("--end", type=int, help="比较到该时间戳为止")
+    args = parser.parse_args()
+    if args.a == "-" and args.b == "-":
+        parser.error("只能有一个波形来自标准输入")
+
+    readers = []
+    try:
+        readers.append(VcdReader(args.a))
+        readers.append(VcdReader(args.b))
+        if readers[0].timescale != readers[1].timescale:
+            raise ValueError(f"时间精度不同（{readers[0].timescale} 与 {readers[1].timescale}），时间戳无法对齐")
+        divergences, only_a, only_b, width_mismatch = compare(*readers, args.include, args.exclude, args.limit,
+                                                              args.start, args.end)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(2)
+    finally:
+        for reader in readers:
+            reader.close()
+
+    print_report(divergences, only_a, only_b, width_mismatch, args.limit, args.max_signals)
+    if divergences or only_a or only_b or width_mismatch:
+        print(f"\n{len(divergences)} 个信号存在差异")
+        sys.exit(1)
+    print("波形一致")
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
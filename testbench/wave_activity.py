@@ -0,0 +1,183 @@
+"""
+波形活动分析：流式统计VCD/FST波形中每个信号与每个层次的翻转次数、贡献的字节数以及随时间的变化密度
+
+字节数按VCD中值变化记录的长度估算（值、标识符与分隔符），FST压缩后的大小与之大致成比例。
+内存占用只与信号数量有关：每个信号两个计数器，时间分布使用固定数量的桶，超出范围时相邻的桶两两合并。
+
+--emit生成波形层次列表文件，列出按字节数从大到小排除、直到剩余字节数不超过--budget的层次，
+在testbench CSV中以trace scope file引用后由csv2c.py写入sim_trace.vlt，重新构建即可生效。
+
+用法: python testbench/wave_activity.py wave.fst [--top 20] [--depth 3] [--emit testbench/trace.scopes --budget 50]
+"""
+import sys
+import fnmatch
+import argparse
+
+from vcddiff import VcdReader
+
+DENSITY_BINS = 32
+
+
+class Histogram:
+    """桶宽随时间范围自动加倍的变化次数分布，桶数不超过2 * bins"""
+    __slots__ = ("bins", "width", "counts")
+
+    def __init__(self, bins=DENSITY_BINS):
+        self.bins = bins
+        self.width = 1
+        self.counts = [0] * (2 * bins)
+
+    def add(self, time, count):
+        index = time // self.width
+        while index >= len(self.counts):
+            self.counts = [self.counts[i] + self.counts[i + 1] for i in range(0, len(self.counts), 2)]
+            self.counts += [0] * len(self.counts)
+            self.width *= 2
+            index = time // self.width
+        self.counts[index] += count
+
+    def rows(self):
+        """返回[(起始时间, 结束时间, 变化次数)]，去掉末尾的空桶"""
+        counts = self.counts[:max((i for i, c in enumerate(self.counts) if c), default=-1) + 1]
+        width = self.width
+        while len(counts) > self.bins:
+            counts = [sum(counts[i:i + 2]) for i in range(0, len(counts), 2)]
+            width *= 2
+        return [(i * width, (i + 1) * width, c) for i, c in enumerate(counts)]
+
+
+def analyze(reader):
+    """统计每个标识符的变化次数与字节数，返回(toggles, nbytes, 时间分布, 最后时间)"""
+    toggles = dict.fromkeys(reader.variables, 0)
+    nbytes = dict.fromkeys(reader.variables, 0)
+    histogram = Histogram()
+    last_time = 0
+    for time, changes in reader:
+        for code, value in changes:
+            toggles[code] = toggles.get(code, 0) + 1
+            # 标量为"值标识符\n"，向量为"b值 标识符\n"
+            nbytes[code] = nbytes.get(code, 0) + len(value) + len(code) + (1 if len(value) == 1 else 3)
+        histogram.add(time, len(changes))
+        last_time = time
+    return toggles, nbytes, histogram, last_time
+
+
+def scope_of(name):
+    return name.rsplit(".", 1)[0] if "." in name else ""
+
+
+def scope_totals(signals, depth):
+    """按层次汇总，每个信号计入其所在层次的全部上级层次（不超过depth级），返回{层次: [信号数, 翻转, 字节]}"""
+    totals = {}
+    for name, _, toggles, nbytes in signals:
+        parts = scope_of(name).split(".")
+        for level in range(1, min(len(parts), depth) + 1):
+            entry = totals.setdefault(".".join(parts[:level]), [0, 0, 0])
+            entry[0] += 1
+            entry[1] += toggles
+            entry[2] += nbytes
+    return totals
+
+
+def choose_excludes(signals, budget, keep=(), min_level=3):
+    """按字节数从大到小选择要排除的层次，直到剩余字节数不超过总量的budget%
+
+    只考虑第min_level级及以下的实例层次（TOP与顶层模块本身的端口总是保留），与keep中模式匹配的层次
+    及其上级不会被排除。返回(层次列表, 剩余字节数)
+    """
+    total = sum(nbytes for _, _, _, nbytes in signals)
+    target = total * budget / 100
+    totals = scope_totals(signals, depth=1 << 16)
+    candidates = sorted((scope for scope in totals if scope.count(".") + 1 >= min_level),
+                        key=lambda scope: -totals[scope][2])
+    kept = [scope for scope in totals if any(fnmatch.fnmatchcase(scope, p) for p in keep)]
+    excluded = []
+    remaining = total
+    for scope in candidates:
+        if remaining <= target:
+            break
+        if any(scope == e or scope.startswith(e + ".") for e in excluded):
+            continue
+        if any(k == scope or k.startswith(scope + ".") or scope.startswith(k + ".") for k in kept):
+            continue
+        excluded.append(scope)
+        remaining -= totals[scope][2]
+    return excluded, remaining
+
+
+def write_scope_file(path, excluded, total, remaining, budget):
+    """写出csv2c.py可读取的波形层次列表；sim_trace.vlt中的层次名不含VCD的TOP前缀"""
+    with open(path, "w") as f:
+        f.write(f"# 由wave_activity.py生成：排除后估计波形字节数 {remaining}/{total}（目标 {budget}%）\n")
+        for scope in excluded:
+            f.write(f"exclude {scope[4:] if scope.startswith('TOP.') else scope}\n")
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GB"
+
+
+def print_report(signals, histogram, last_time, top, depth):
+    total_toggles = sum(s[2] for s in signals)
+    total_bytes = sum(s[3] for s in signals) or 1
+    span = last_time + 1
+    print(f"{len(signals)} 个信号，{total_toggles} 次变化，估计 {format_bytes(total_bytes)}，时间范围 0..{last_time}")
+
+    print(f"\n{'信号':<48}{'位宽':>6}{'翻转':>12}{'字节':>10}{'占比':>8}{'翻转/千时长':>12}")
+    for name, width, toggles, nbytes in sorted(signals, key=lambda s: -s[3])[:top]:
+        print(f"{name:<50}{width:>6}{toggles:>12}{format_bytes(nbytes):>10}{nbytes / total_bytes:>9.1%}"
+              f"{toggles * 1000 / span:>14.1f}")
+
+    print(f"\n{'层次':<48}{'信号数':>6}{'翻转':>12}{'字节':>10}{'占比':>8}")
+    totals = scope_totals(signals, depth)
+    for scope, (count, toggles, nbytes) in sorted(totals.items(), key=lambda item: -item[1][2])[:top]:
+        print(f"{scope:<50}{count:>6}{toggles:>12}{format_bytes(nbytes):>10}{nbytes / total_bytes:>9.1%}")
+
+    rows = histogram.rows()
+    peak = max((c for _, _, c in rows), default=0) or 1
+    print("\n变化密度")
+    for begin, end, count in rows:
+        print(f"  #{begin:<10} .. #{end:<10}{count:>10}  {'#' * round(40 * count / peak)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="统计波形中各信号与层次的活动情况，生成波形层次排除列表")
+    parser.add_argument("wave", help="波形文件（.vcd、.fst或-表示标准输入）")
+    parser.add_argument("--top", type=int, default=20, help="列出字节数最多的信号与层次数")
+    parser.add_argument("--depth", type=int, default=3, help="层次汇总的最大深度")
+    parser.add_argument("--emit", metavar="PATH", help="写出波形层次列表文件，供trace scope file引用")
+    parser.add_argument("--budget", type=float, default=50, help="排除后剩余字节数占总量的目标百分比")
+    parser.add_argument("--keep", action="append", default=[], metavar="PATTERN",
+                        help="不允许排除的层次（通配模式），例如'TOP.top.u_alu*'")
+    args = parser.parse_args()
+
+    reader = None
+    try:
+        reader = VcdReader(args.wave)
+        toggles, nbytes, histogram, last_time = analyze(reader)
+    except ValueError as e:
+        print(f"错误: {e}")
+        sys.exit(1)
+    finally:
+        if reader:
+            reader.close()
+
+    # 同一标识符的多个别名只统计第一个，波形中也只写一次
+    signals = [(aliases[0][0], aliases[0][1], toggles[code], nbytes[code])
+               for code, aliases in reader.variables.items()]
+    print_report(signals, histogram, last_time, args.top, args.depth)
+
+    if args.emit:
+        excluded, remaining = choose_excludes(signals, args.budget, args.keep)
+        total = sum(s[3] for s in signals)
+        write_scope_file(args.emit, excluded, total, remaining, args.budget)
+        print(f"\n排除 {len(excluded)} 个层次后估计 {format_bytes(remaining)}/{format_bytes(total)}，写入 {args.emit}")
+        print("在testbench CSV的Configuration块中设置 trace scope file 为该文件（相对CSV所在目录）后重新构建")
+
+
+if __name__ == "__main__":
+    main()